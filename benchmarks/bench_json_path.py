@@ -0,0 +1,54 @@
+"""
+Synopsis:   Compares the simple jsonpath fast path against jsonpath_ng for the paths dfm configs use most.
+Usage:      poetry run python benchmarks/bench_json_path.py
+"""
+import timeit
+
+from jsonpath_ng import parse
+
+from dfm.json_path import compile_json_path
+
+NUMBER = 20000
+
+
+def make_document() -> dict:
+    return {
+        "Resources": {
+            f"Resource{i}": {"Type": "AWS::S3::Bucket", "Properties": {"Tags": [i]}}
+            for i in range(200)
+        },
+        "a": {"b": [{"c": 1}]},
+    }
+
+
+def main():
+    document = make_document()
+    print(f"{'path':<20}{'operation':<20}{'jsonpath_ng (s)':>16}{'dfm (s)':>12}")
+    for json_path in ["$", "$.Resources", "$.a.b[0]"]:
+        jsonpath_ng_expr = parse(json_path)
+        dfm_expr = compile_json_path(json_path)
+        # Writing back the current value keeps the document the same size between runs.
+        current_value = dfm_expr.find_values(document)[0]
+        for operation, jsonpath_ng_call, dfm_call in [
+            (
+                "find",
+                lambda: [match.value for match in jsonpath_ng_expr.find(document)],
+                lambda: dfm_expr.find_values(document),
+            ),
+            (
+                "update_or_create",
+                lambda: jsonpath_ng_expr.update_or_create(document, current_value),
+                lambda: dfm_expr.update_or_create(document, current_value),
+            ),
+        ]:
+            if operation == "update_or_create" and json_path == "$.a.b[0]":
+                continue  # Index updates are delegated to jsonpath_ng.
+            print(
+                f"{json_path:<20}{operation:<20}"
+                f"{timeit.timeit(jsonpath_ng_call, number=NUMBER):>16.4f}"
+                f"{timeit.timeit(dfm_call, number=NUMBER):>12.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
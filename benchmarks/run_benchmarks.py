@@ -0,0 +1,194 @@
+"""
+Synopsis:   Times each stage of a build, and each merger, over synthetic workloads (see workload.py)
+            and compares the timings against a stored baseline so that regressions are caught.
+            Timings are the fastest of several runs. Baselines are machine specific,
+            so save a new one (--save-baseline) before comparing changes on a different machine.
+Usage:      poetry run python benchmarks/run_benchmarks.py [--workloads small,deep] [--repeat 7]
+                [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.5] [--output results.json]
+"""
+import argparse
+import gc
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from workload import WORKLOADS
+
+from dfm.config import BuildConfig
+from dfm.file_types import JsonFileType
+from dfm.json_merger import JsonMergerFactory
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+# Regressions smaller than this many seconds are noise whatever the tolerance.
+MINIMUM_REGRESSION = 0.001
+FOLDING_MERGERS = ("DictJsonMerger", "ListJsonMerger", "IntJsonMerger")
+
+
+def best_time(
+    stage: Callable[[], object], setup: Callable[[], object], repeat: int
+) -> float:
+    """
+    Synopsis:   Times a stage several times, each after a fresh setup.
+    Parameters:
+        stage = Called with the result of setup. Only this is timed.
+        setup = Prepares each run, e.g. by loading a fresh config.
+        repeat = The number of runs.
+    Returns:    The fastest run, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        prepared = setup()
+        # As timeit does, keep garbage collection from landing in the middle of a run.
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            stage(prepared)
+            timings.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+    return min(timings)
+
+
+def fragments_by_merger(build_config: BuildConfig) -> Dict[str, List]:
+    """
+    Synopsis:   Groups every value in a build's sources (at every depth) by the merger class that merges into it.
+                Every value can be merged into None, so the NoneJsonMerger group holds all of them.
+    """
+    groups = {"NoneJsonMerger": []}
+    values_to_group = [
+        value
+        for src in build_config.source_files
+        for value in src.retrieved_src_content
+    ]
+    while values_to_group:
+        value = values_to_group.pop()
+        merger_name = type(JsonMergerFactory(value).generate_json_merger()).__name__
+        groups.setdefault(merger_name, []).append(value)
+        groups["NoneJsonMerger"].append(value)
+        if isinstance(value, dict):
+            values_to_group.extend(value.values())
+    return groups
+
+
+def merger_stage(merger_name: str, fragments: List) -> Callable[[object], object]:
+    if merger_name in FOLDING_MERGERS:
+        # Fold every fragment into the first, as a build does.
+        return lambda _: JsonMergerFactory(fragments[0]).merge_all(fragments[1:])
+    # The other mergers only merge once before the value changes type, so merge each fragment into a fresh value.
+    start = None if merger_name == "NoneJsonMerger" else fragments[0]
+    return lambda _: [
+        JsonMergerFactory(start).merge_all([fragment]) for fragment in fragments
+    ]
+
+
+def benchmark_workload(
+    directory: Path, config_path: Path, repeat: int
+) -> Dict[str, float]:
+    def load_config() -> BuildConfig:
+        return BuildConfig.load_config_from_file(config_path, directory)
+
+    def load_sources() -> BuildConfig:
+        build_config = load_config()
+        for src in build_config.source_files:
+            src.retrieved_src_content
+        return build_config
+
+    timings = {
+        "resolved_paths": best_time(
+            lambda build_config: [
+                src.location.resolved_paths for src in build_config.source_files
+            ],
+            load_config,
+            repeat,
+        ),
+        "retrieved_src_content": best_time(
+            lambda build_config: [
+                src.retrieved_src_content for src in build_config.source_files
+            ],
+            load_config,
+            repeat,
+        ),
+        "generate_new_dest_content": best_time(
+            lambda build_config: build_config.generate_new_dest_content(),
+            load_sources,
+            repeat,
+        ),
+    }
+
+    build_config = load_sources()
+    content = build_config.generate_new_dest_content()
+    timings["save_to_file"] = best_time(
+        lambda _: JsonFileType.save_to_file(content, directory / "destination.json"),
+        lambda: None,
+        repeat,
+    )
+    for merger_name, fragments in sorted(fragments_by_merger(build_config).items()):
+        timings[f"merge:{merger_name}"] = best_time(
+            merger_stage(merger_name, fragments), lambda: None, repeat
+        )
+    return timings
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Synopsis:   Finds the timings that got slower than the baseline allows.
+    Returns:    A description of each regression.
+    """
+    regressions = []
+    for workload_name, timings in results["Workloads"].items():
+        baseline_timings = baseline["Workloads"].get(workload_name, {})
+        for stage, seconds in timings.items():
+            if stage not in baseline_timings:
+                continue
+            allowed = baseline_timings[stage] * (1 + tolerance)
+            if (
+                seconds > allowed
+                and seconds - baseline_timings[stage] > MINIMUM_REGRESSION
+            ):
+                regressions.append(
+                    f"{workload_name} {stage}: {seconds * 1000:.2f}ms, "
+                    f"baseline {baseline_timings[stage] * 1000:.2f}ms"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("Usage:")[0].strip())
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = {"Workloads": {}}
+    for workload_name in args.workloads.split(","):
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = WORKLOADS[workload_name].generate(Path(directory))
+            timings = benchmark_workload(Path(directory), config_path, args.repeat)
+        results["Workloads"][workload_name] = timings
+        for stage, seconds in timings.items():
+            print(f"{workload_name:<16}{stage:<32}{seconds * 1000:>10.2f}ms")
+
+    if args.output:
+        JsonFileType.save_to_file(results, args.output)
+    if args.save_baseline:
+        JsonFileType.save_to_file(results, args.baseline)
+        print(f"Saved the baseline to {args.baseline}")
+    elif args.baseline.exists():
+        regressions = compare(
+            results, JsonFileType.load_from_file(args.baseline), args.tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
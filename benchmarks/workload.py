@@ -0,0 +1,167 @@
+"""
+Synopsis:   Generates synthetic source trees and configs to benchmark dfm with.
+Usage:      poetry run python benchmarks/workload.py <directory> [workload name]
+"""
+import json
+import random
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+NESTED_SHAPE = "nested"
+CLOUDFORMATION_SHAPE = "cloudformation"
+CLOUDFORMATION_RESOURCE_TYPES = (
+    "AWS::S3::Bucket",
+    "AWS::EC2::Subnet",
+    "AWS::EC2::Instance",
+    "AWS::IAM::Role",
+    "AWS::Lambda::Function",
+)
+
+
+@dataclass
+class Workload:
+    """
+    Synopsis:   The shape of a synthetic source tree.
+    Parameters:
+        name = The name results are reported under.
+        file_count = The number of source files.
+        depth = How deeply the content of each file is nested.
+        clash_ratio = The fraction of keys (at every level) that are shared by every file, so have to be merged.
+        list_size = The number of items in each list.
+        directory_depth = How many directories deep the source files are spread.
+        shape = 'nested' for generic nested content merged at '$',
+                or 'cloudformation' for one resource per file merged into a template's '$.Resources',
+                like examples/aws-cloudformation-example.
+        seed = The seed content is generated from, so a workload is the same every time.
+    """
+
+    name: str
+    file_count: int = 100
+    depth: int = 3
+    clash_ratio: float = 0.5
+    list_size: int = 10
+    directory_depth: int = 2
+    shape: str = NESTED_SHAPE
+    seed: int = 0
+
+    KEYS_PER_LEVEL = 4
+
+    def _value(self, key_name: str, depth: int, rng: random.Random):
+        # A key's type is decided by its name, so clashing keys always hold the same type.
+        kind = sum(map(ord, key_name)) % 5
+        if depth < self.depth and kind < 2:
+            return self._nested_content(key_name, depth + 1, rng)
+        if kind == 2:
+            return [rng.randint(0, 1000) for _ in range(self.list_size)]
+        if kind == 3:
+            return rng.randint(0, 1000)
+        if kind == 4:
+            return rng.random() < 0.5
+        return f"value-{rng.randint(0, 1000)}"
+
+    def _nested_content(self, prefix: str, depth: int, rng: random.Random) -> dict:
+        content = {}
+        for key_index in range(self.KEYS_PER_LEVEL):
+            if rng.random() < self.clash_ratio:
+                key_name = f"{prefix}_shared{key_index}"
+            else:
+                key_name = f"{prefix}_unique{rng.randint(0, 1 << 30)}"
+            content[key_name] = self._value(key_name, depth, rng)
+        return content
+
+    def _resource(self, file_index: int, rng: random.Random) -> dict:
+        return {
+            f"Resource{file_index}": {
+                "Type": rng.choice(CLOUDFORMATION_RESOURCE_TYPES),
+                "Properties": {
+                    "Tags": [
+                        {"Key": f"Tag{tag}", "Value": f"value-{rng.randint(0, 1000)}"}
+                        for tag in range(self.list_size)
+                    ],
+                    **self._nested_content("Property", 1, rng),
+                },
+            }
+        }
+
+    def _source_path(self, file_index: int) -> Path:
+        directories = [
+            f"group{(file_index >> (level * 2)) % 4}"
+            for level in range(self.directory_depth)
+        ]
+        return Path("sources", *directories, f"source_{file_index}.json")
+
+    def generate(self, directory: Path) -> Path:
+        """
+        Synopsis:   Writes the source tree and a config that merges it.
+        Parameters:
+            directory = The (empty) directory to write to. It is the root path of the config.
+        Returns:    The path to the config file.
+        """
+        directory = Path(directory)
+        rng = random.Random(self.seed)
+        for file_index in range(self.file_count):
+            source_path = directory / self._source_path(file_index)
+            source_path.parent.mkdir(parents=True, exist_ok=True)
+            if self.shape == CLOUDFORMATION_SHAPE:
+                content = self._resource(file_index, rng)
+            else:
+                content = self._nested_content("key", 1, rng)
+            source_path.write_text(json.dumps(content, indent=4))
+
+        source_pattern = "sources/" + "**/" * bool(self.directory_depth) + "*.json"
+        if self.shape == CLOUDFORMATION_SHAPE:
+            (directory / "template.json").write_text(
+                json.dumps(
+                    {
+                        "AWSTemplateFormatVersion": "2010-09-09",
+                        "Resources": {},
+                        "Outputs": {},
+                    }
+                )
+            )
+            source_files = [
+                self._source_file("template.json", "$"),
+                self._source_file(source_pattern, "$.Resources"),
+            ]
+        else:
+            source_files = [self._source_file(source_pattern, "$")]
+        config_path = directory / "config.json"
+        config_path.write_text(
+            json.dumps(
+                {
+                    "SourceFiles": source_files,
+                    "DestinationFile": {
+                        "DestinationFileLocation": {"Path": "destination.json"}
+                    },
+                },
+                indent=4,
+            )
+        )
+        return config_path
+
+    @staticmethod
+    def _source_file(path: str, destination_node: str) -> dict:
+        return {
+            "SourceFileLocation": {"Path": path},
+            "SourceFileNode": "$",
+            "DestinationFileNode": destination_node,
+        }
+
+
+WORKLOADS = {
+    workload.name: workload
+    for workload in [
+        Workload("small", file_count=50),
+        Workload("many-files", file_count=1000, depth=2, directory_depth=3),
+        Workload("deep", file_count=50, depth=6),
+        Workload("high-clash", file_count=200, clash_ratio=0.9, list_size=50),
+        Workload("cloudformation", file_count=500, shape=CLOUDFORMATION_SHAPE),
+    ]
+}
+
+
+if __name__ == "__main__":
+    print(
+        WORKLOADS[sys.argv[2] if len(sys.argv) > 2 else "small"].generate(sys.argv[1])
+    )
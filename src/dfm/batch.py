@@ -0,0 +1,243 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, Set
+
+from dfm.build_cache import MemoryCache
+from dfm.config import BuildConfig
+from dfm.directory_index import DirectoryIndex
+from dfm.exceptions import BatchBuildError
+from dfm.file_loader import FileLoader
+from dfm.json_merger import COPY_ON_WRITE
+from dfm.json_path import json_path_cache_info
+
+
+@dataclass
+class BatchResult:
+    """
+    Synopsis:   The outcome of one config's build within a batch.
+    Parameters:
+        config_path = The config file that was built.
+        destination_path = The destination file the config builds.
+        wave = The wave the build ran in. Builds in the same wave ran in parallel.
+        seconds = How long the build took.
+        error = Why the build failed (or was skipped), or None if it succeeded.
+    """
+
+    config_path: str
+    destination_path: str
+    wave: int
+    seconds: float = 0.0
+    error: str = None
+
+
+@dataclass
+class BatchBuild:
+    """
+    Synopsis:   A class for building many configs in one process.
+                Configs whose sources include another config's destination (or that share a destination
+                with an earlier config) are built after it. Everything else is built in parallel, in waves.
+                All of the builds share one FileLoader, whose MemoryCache keeps each source file once
+                however many configs read it, and the process wide cache of compiled jsonpaths.
+                Builds run in threads rather than processes so that they can share these caches.
+    Parameters:
+        config_paths = The config files to build. Order only matters between configs with the same destination.
+        root_path = The path that all file paths in the configs are relative to.
+        parameters = The parameters fed to every config.
+        loader = The FileLoader shared by every build. Its cache is wrapped in a MemoryCache if it isn't one already.
+        compact_output = Whether to write destination files without any whitespace.
+        workers = The most builds to run at once.
+    """
+
+    config_paths: List[Path]
+    root_path: Path
+    parameters: dict = None
+    loader: FileLoader = None
+    compact_output: bool = False
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+
+    def __post_init__(self):
+        if self.workers < 1:
+            raise ValueError(
+                f"A batch build needs at least 1 worker, {self.workers} were requested."
+            )
+        if self.loader is None:
+            self.loader = FileLoader()
+        if not isinstance(self.loader.cache, MemoryCache):
+            self.loader.cache = MemoryCache(backing=self.loader.cache, documents=True)
+
+    @cached_property
+    def build_configs(self) -> List[BuildConfig]:
+        return [
+            BuildConfig.load_config_from_file(
+                config_path,
+                self.root_path,
+                self.parameters,
+                self.loader,
+                self.compact_output,
+                self.directory_index,
+            )
+            for config_path in self.config_paths
+        ]
+
+    @cached_property
+    def directory_index(self) -> DirectoryIndex:
+        return DirectoryIndex()
+
+    @cached_property
+    def dependencies(self) -> Dict[int, Set[int]]:
+        """
+        Synopsis:   Works out which configs have to be built before which.
+        Returns:    A mapping of each config's index to the indexes of the configs it has to be built after.
+        """
+        destination_paths = [
+            build_config.destination_path.absolute()
+            for build_config in self.build_configs
+        ]
+        dependencies = {}
+        for index, build_config in enumerate(self.build_configs):
+            dependencies[index] = {
+                other_index
+                for other_index, destination_path in enumerate(destination_paths)
+                if other_index != index
+                and (
+                    any(
+                        src.location.matches(destination_path)
+                        for src in build_config.source_files
+                    )
+                    or (
+                        other_index < index
+                        and destination_path == destination_paths[index]
+                    )
+                )
+            }
+        return dependencies
+
+    @cached_property
+    def waves(self) -> List[List[int]]:
+        """
+        Synopsis:   Groups the configs into waves that only depend on configs in earlier waves.
+        Returns:    A list of waves, each a list of config indexes.
+        """
+        remaining = dict(self.dependencies)
+        built = set()
+        waves = []
+        while remaining:
+            wave = sorted(
+                index
+                for index, dependencies in remaining.items()
+                if dependencies <= built
+            )
+            if not wave:
+                raise BatchBuildError(
+                    "These configs depend on each other's destination files: "
+                    + ", ".join(str(self.config_paths[index]) for index in remaining)
+                )
+            for index in wave:
+                del remaining[index]
+            built.update(wave)
+            waves.append(wave)
+        return waves
+
+    def _build_one(self, index: int, wave: int, merge_workers: int) -> BatchResult:
+        build_config = self.build_configs[index]
+        result = BatchResult(
+            str(self.config_paths[index]), str(build_config.destination_path), wave
+        )
+        started = time.perf_counter()
+        try:
+            build_config.build(merge_mode=COPY_ON_WRITE, merge_workers=merge_workers)
+        except Exception as error:
+            result.error = f"{type(error).__name__}: {error}"
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def run(self, merge_workers: int = 1) -> List[BatchResult]:
+        """
+        Synopsis:   Builds every config, wave by wave. A config whose dependencies failed is skipped.
+                    Source content is shared between builds, so merges are always copy on write.
+        Parameters:
+            merge_workers = See BuildConfig.generate_new_dest_content.
+        Returns:    A BatchResult per config, in the order of config_paths.
+        """
+        results = {}
+        failed = set()
+        for wave_number, wave in enumerate(self.waves):
+            to_build = []
+            for index in wave:
+                failed_dependencies = self.dependencies[index] & failed
+                if failed_dependencies:
+                    results[index] = BatchResult(
+                        str(self.config_paths[index]),
+                        str(self.build_configs[index].destination_path),
+                        wave_number,
+                        error="Skipped as a config it depends on failed.",
+                    )
+                    failed.add(index)
+                else:
+                    to_build.append(index)
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for index, result in zip(
+                    to_build,
+                    executor.map(
+                        lambda index: self._build_one(
+                            index, wave_number, merge_workers
+                        ),
+                        to_build,
+                    ),
+                ):
+                    results[index] = result
+                    if result.error is not None:
+                        failed.add(index)
+            # A listing taken while another build of the wave was writing could be missing its destination.
+            self.directory_index.invalidate(
+                self.build_configs[index].destination_path.parent for index in to_build
+            )
+        return [results[index] for index in range(len(self.config_paths))]
+
+
+def format_summary(results: List[BatchResult]) -> str:
+    """
+    Synopsis:   Formats the results of a batch build as a table, one row per config.
+    Parameters:
+        results = The results returned by BatchBuild.run.
+    Returns:    The table, followed by totals and the jsonpath cache's hit rate.
+    """
+    config_width = max(
+        [len("Config")] + [len(result.config_path) for result in results]
+    )
+    lines = [f"{'Config':<{config_width}}  Wave  Time (ms)  Result"]
+    for result in results:
+        lines.append(
+            f"{result.config_path:<{config_width}}  {result.wave:>4}  {result.seconds * 1000:>9.1f}  "
+            + ("OK" if result.error is None else result.error)
+        )
+    failures = sum(result.error is not None for result in results)
+    cache_info = json_path_cache_info()
+    lines.append(
+        f"{len(results) - failures} built, {failures} failed in "
+        f"{sum(result.seconds for result in results) * 1000:.1f}ms of build time. "
+        f"jsonpath cache: {cache_info.hits} hits, {cache_info.misses} misses."
+    )
+    return "\n".join(lines)
+
+
+def summary_to_dict(results: List[BatchResult]) -> dict:
+    """
+    Synopsis:   Converts the results of a batch build into a dict that can be saved as JSON.
+    """
+    return {
+        "Results": [
+            {
+                "ConfigPath": result.config_path,
+                "DestinationPath": result.destination_path,
+                "Wave": result.wave,
+                "Seconds": result.seconds,
+                "Error": result.error,
+            }
+            for result in results
+        ]
+    }
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, List
+
+from dfm.exceptions import FileTypeError
+from dfm.file_types import BaseBinaryFileType, FileTypeFactory
+from dfm.json_codecs import JsonCodecFactory
+
+# A file changed in the same instant its entry was written could change again without its mtime moving,
+# so mtime and size are only trusted for files last modified well before they were cached.
+RACY_WINDOW_NS = 2_000_000_000
+# The file types that can hold any content exactly as it was loaded (YAML and TOML can't, e.g. TOML has no null).
+STORAGE_FORMATS = ("Json", "MessagePack", "Cbor")
+
+
+def hash_file(file_path: Path) -> str:
+    """
+    Synopsis:   Hashes the content of a file.
+    Parameters:
+        file_path = The file to hash.
+    Returns:    The hex sha256 digest of the file's content.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+@dataclass
+class BuildCache:
+    """
+    Synopsis:   An on-disk cache that lets a build skip work that was already done by a previous build.
+                For every source file and node it stores the file's mtime, size and hash alongside the content
+                retrieved from it, so unchanged files are not parsed again. It also stores a fingerprint of
+                the last build of each destination file, so a build whose inputs haven't changed can be skipped.
+    Parameters:
+        cache_dir = The directory to keep the cache in. It is created if it doesn't exist.
+        max_entries = The most source file entries, and the most build entries, to keep.
+                      The least recently used are evicted first. None for no limit.
+        max_age = The seconds an entry can go unused before it is evicted. None for no limit.
+        storage_format = The name of the file type entries are stored as, one of STORAGE_FORMATS.
+                         A binary format ('MessagePack' or 'Cbor') is quicker to read and write than 'Json'.
+                         Entries stored in another format are ignored, and evicted in time.
+    """
+
+    cache_dir: Path
+    max_entries: int = 10000
+    max_age: float = None
+    storage_format: str = "Json"
+
+    def __post_init__(self):
+        self.cache_dir = Path(self.cache_dir)
+        if self.storage_format not in STORAGE_FORMATS:
+            raise ValueError(
+                f"Cache storage format '{self.storage_format}' is not one of {STORAGE_FORMATS}."
+            )
+        self.file_type = FileTypeFactory(self.storage_format).generate()
+        if not self.file_type.is_available():
+            raise FileTypeError(
+                f"Cache storage format '{self.storage_format}' is not installed."
+            )
+
+    @property
+    def sources_dir(self) -> Path:
+        return self.cache_dir / "sources"
+
+    @property
+    def builds_dir(self) -> Path:
+        return self.cache_dir / "builds"
+
+    def _entry_name(self, *keys: str) -> str:
+        return (
+            hashlib.sha256("\0".join(keys).encode()).hexdigest()
+            + self.file_type.extensions[0]
+        )
+
+    def _read_entry(self, entry_path: Path) -> dict:
+        try:
+            return self.file_type.load_from_file(entry_path)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, entry_path: Path, entry: dict):
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        if issubclass(self.file_type, BaseBinaryFileType):
+            blocks = [self.file_type.dumps(entry)]
+        else:
+            blocks = JsonCodecFactory().generate().iterencode(entry)
+        # An entry lost in a crash is only rebuilt, so it is replaced atomically but not flushed to disk.
+        self.file_type.write_atomically(entry_path, blocks, durable=False)
+
+    def get_node_values(
+        self, file_path: Path, node: str, load_node_values: Callable[[], List]
+    ) -> List:
+        """
+        Synopsis:   Retrieves the content at a node of a file from the cache, loading and caching it if needed.
+                    A file whose mtime and size match the cache is trusted without being read,
+                    unless it was modified within RACY_WINDOW_NS of being cached.
+                    Otherwise the file is hashed and only loaded if the hash differs too.
+        Parameters:
+            file_path = The source file.
+            node = The jsonpath string of the node retrieved.
+            load_node_values = Called to load the content when the cache is out of date.
+        Returns:    A list of the values matched in the file.
+        """
+        file_path = Path(file_path).absolute()
+        file_stat = file_path.stat()
+        entry_path = self.sources_dir / self._entry_name(str(file_path), node)
+        entry = self._read_entry(entry_path)
+        if (
+            entry is not None
+            and entry["MtimeNs"] == file_stat.st_mtime_ns
+            and entry["Size"] == file_stat.st_size
+            and entry["CachedAtNs"] - file_stat.st_mtime_ns > RACY_WINDOW_NS
+        ):
+            os.utime(entry_path)
+            return entry["Values"]
+
+        file_hash = hash_file(file_path)
+        if entry is None or entry["Sha256"] != file_hash:
+            entry = {"Sha256": file_hash, "Values": load_node_values()}
+        entry.update(
+            {
+                "Path": str(file_path),
+                "Node": node,
+                "MtimeNs": file_stat.st_mtime_ns,
+                "Size": file_stat.st_size,
+                "CachedAtNs": time.time_ns(),
+            }
+        )
+        self._write_entry(entry_path, entry)
+        return entry["Values"]
+
+    def is_up_to_date(self, destination_path: Path, fingerprint: str) -> bool:
+        """
+        Synopsis:   Determines whether a destination file was last built from exactly the same inputs.
+        Parameters:
+            destination_path = The destination file.
+            fingerprint = The fingerprint of the build's inputs (see record_build).
+        Returns:    True if the destination exists and is unchanged since a build with the same fingerprint.
+        """
+        destination_path = Path(destination_path).absolute()
+        if not destination_path.exists():
+            return False
+        entry_path = self.builds_dir / self._entry_name(str(destination_path))
+        entry = self._read_entry(entry_path)
+        if entry is None or entry != self._build_entry(destination_path, fingerprint):
+            return False
+        os.utime(entry_path)
+        return True
+
+    def record_build(self, destination_path: Path, fingerprint: str):
+        """
+        Synopsis:   Records that a destination file has just been built.
+        Parameters:
+            destination_path = The destination file that was written.
+            fingerprint = A string that changes whenever anything the build depends on changes.
+        """
+        destination_path = Path(destination_path).absolute()
+        self._write_entry(
+            self.builds_dir / self._entry_name(str(destination_path)),
+            self._build_entry(destination_path, fingerprint),
+        )
+
+    @staticmethod
+    def _build_entry(destination_path: Path, fingerprint: str) -> dict:
+        destination_stat = destination_path.stat()
+        return {
+            "Path": str(destination_path),
+            "Fingerprint": fingerprint,
+            "MtimeNs": destination_stat.st_mtime_ns,
+            "Size": destination_stat.st_size,
+        }
+
+    def evict(self):
+        """
+        Synopsis:   Removes source file and build entries that are older than max_age or beyond max_entries.
+                    Source file and build entries are counted separately.
+        """
+        for entries_dir in (self.sources_dir, self.builds_dir):
+            if entries_dir.exists():
+                self._evict_from(entries_dir)
+
+    def _evict_from(self, entries_dir: Path):
+        entries = sorted(
+            (entry.stat().st_mtime, entry) for entry in entries_dir.iterdir()
+        )
+        to_evict = []
+        if self.max_age is not None:
+            oldest_allowed = time.time() - self.max_age
+            to_evict = [entry for mtime, entry in entries if mtime < oldest_allowed]
+            entries = entries[len(to_evict) :]
+        if self.max_entries is not None and len(entries) > self.max_entries:
+            to_evict.extend(
+                entry for _, entry in entries[: len(entries) - self.max_entries]
+            )
+        for entry in to_evict:
+            entry.unlink(missing_ok=True)
+
+
+@dataclass
+class MemoryCache:
+    """
+    Synopsis:   An in-memory cache of the content retrieved from each source file, for long running processes
+                such as 'dfm watch'. Entries are checked against the file's mtime and size on every use
+                and can be invalidated explicitly when a file is known to have changed.
+                Content is shared between builds so it must not be mutated, i.e. merge with 'copy_on_write'.
+    Parameters:
+        backing = An optional BuildCache to consult when an entry is missing or out of date.
+        documents = Whether to also keep each whole source file once it has been loaded,
+                    so that retrieving other nodes from it doesn't load it again.
+    """
+
+    backing: BuildCache = None
+    documents: bool = False
+    entries: dict = field(default_factory=dict, init=False, repr=False)
+
+    def _get(self, file_path: Path, node: str or None, load: Callable):
+        file_stat = file_path.stat()
+        file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+        entry = self.entries.get((file_path, node))
+        if entry is not None and entry[0] == file_version:
+            return entry[1]
+        value = load()
+        self.entries[(file_path, node)] = (file_version, value)
+        return value
+
+    def get_document(self, file_path: Path, load_document: Callable):
+        """
+        Synopsis:   Retrieves the whole content of a source file from memory, loading and caching it if needed.
+                    Only caches anything if documents is set.
+        Parameters:
+            file_path = The source file.
+            load_document = Called to load the content when the cache is out of date.
+        Returns:    The content of the file.
+        """
+        if not self.documents:
+            return load_document()
+        return self._get(Path(file_path).absolute(), None, load_document)
+
+    def get_node_values(
+        self, file_path: Path, node: str, load_node_values: Callable[[], List]
+    ) -> List:
+        """
+        Synopsis:   Retrieves the content at a node of a file from memory, loading and caching it if needed.
+        Parameters:
+            file_path = The source file.
+            node = The jsonpath string of the node retrieved.
+            load_node_values = Called to load the content when the cache is out of date.
+        Returns:    A list of the values matched in the file.
+        """
+        file_path = Path(file_path).absolute()
+        if self.backing is not None:
+            return self._get(
+                file_path,
+                node,
+                lambda: self.backing.get_node_values(file_path, node, load_node_values),
+            )
+        return self._get(file_path, node, load_node_values)
+
+    def invalidate(self, file_paths: Iterable[Path] = None):
+        """
+        Synopsis:   Drops the entries of files that have changed.
+        Parameters:
+            file_paths = The files to drop. None drops every entry.
+        """
+        if file_paths is None:
+            self.entries.clear()
+            return
+        file_paths = {Path(file_path).absolute() for file_path in file_paths}
+        for key in [key for key in self.entries if key[0] in file_paths]:
+            del self.entries[key]
@@ -1,10 +1,22 @@
 import argparse
+import asyncio
+import glob
 import os
 import platform
 from pathlib import Path
 
+from dfm.batch import BatchBuild, format_summary, summary_to_dict
+from dfm.build_cache import STORAGE_FORMATS, BuildCache
 from dfm.config import BuildConfig
+from dfm.exceptions import BatchBuildError
+from dfm.file_loader import EXECUTORS, THREAD_EXECUTOR, FileLoader
+from dfm.file_types import JsonFileType
+from dfm.json_codecs import AUTO_CODEC, JsonCodecFactory
+from dfm.json_merger import COPY_ON_WRITE, MERGE_MODES
+from dfm.profiling import PROFILE_FORMATS, TEXT_FORMAT, Profiler
+from dfm.split import SplitBuild
 from dfm.version import __version__
+from dfm.watch import BuildWatcher
 
 
 def parse_parameter_string(param_str: str) -> dict:
@@ -55,11 +67,13 @@ def main():
     parser = argparse.ArgumentParser(
         description="Merge files into a single file based on the rules defined in a config file."
     )
-    parser.add_argument("action", choices=["merge", "split"])
+    parser.add_argument("action", choices=["merge", "merge-all", "watch", "split"])
     parser.add_argument(
-        "config_file_path",
+        "config_file_paths",
         type=str,
-        help="The complete local path to the data-file-merge config file.",
+        nargs="+",
+        help="The complete local path to the data-file-merge config file. "
+        "merge-all takes any number of paths and globs (e.g. 'configs/**/*.json').",
     )
     parser.add_argument(
         "-p",
@@ -73,6 +87,118 @@ def main():
         type=str,
         help='The root path to append all file paths contained within the config file to. E.g "/foo/bar"',
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of source files to load at once. Defaults to 1 (one file at a time).",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default=THREAD_EXECUTOR,
+        help="Whether to load source files concurrently with threads or processes.",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=tuple(JsonCodecFactory.CODEC_MAPPING),
+        default=AUTO_CODEC,
+        help="The JSON library used to read and write files. 'auto' reads with the fastest one installed.",
+    )
+    parser.add_argument(
+        "--lazy-sources",
+        action="store_true",
+        help="Only parse the SourceFileNode of each source file, skipping the rest of the file. Needs ijson.",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write the destination file without indentation or whitespace.",
+    )
+    parser.add_argument(
+        "--merge-mode",
+        choices=MERGE_MODES,
+        default=COPY_ON_WRITE,
+        help="'copy_on_write' only copies the loaded content a merge changes. 'in_place' mutates it directly.",
+    )
+    parser.add_argument(
+        "--merge-workers",
+        type=int,
+        default=1,
+        help="The number of processes to merge each source's content with. Defaults to 1 (serial merging).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help="A directory to cache source file content in between builds. A build whose inputs haven't changed is skipped.",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=10000,
+        help="The most source file entries, and the most build entries, to keep in the cache. Defaults to 10000.",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=float,
+        help="The seconds a cache entry can go unused before it is evicted. Defaults to no limit.",
+    )
+    parser.add_argument(
+        "--cache-format",
+        choices=STORAGE_FORMATS,
+        default="Json",
+        help="The format to store cache entries in. The binary formats need msgpack or cbor2. Defaults to Json.",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.05,
+        help="watch only: the seconds to wait for a burst of changes to finish before rebuilding.",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="watch only: poll for changes instead of using inotify.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0.5,
+        help="watch only: the seconds between scans when polling.",
+    )
+    parser.add_argument(
+        "--build-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="merge-all only: the most configs to build at once. split: the most files to write at once. "
+        "Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--summary-file",
+        type=str,
+        help="merge-all only: a JSON file to write the timings of each config's build to.",
+    )
+    parser.add_argument(
+        "--async",
+        dest="async_build",
+        action="store_true",
+        help="merge only: merge each source file as soon as it is loaded (see BuildConfig.build_async) "
+        "rather than loading every file first. Merges serially, so --merge-workers is ignored.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=TEXT_FORMAT,
+        choices=PROFILE_FORMATS,
+        help="merge only: time each stage of the build and each source. Prints tables by default, "
+        "'json' prints the totals as JSON and 'chrome' a trace of every call for chrome://tracing.",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        help="merge only: a file to write the profile to instead of printing it.",
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -92,16 +218,85 @@ def main():
         parameters = parse_parameter_string(args.parameters)
     else:
         parameters = None
-    if args.action == "merge":
+    if args.action != "merge-all" and len(args.config_file_paths) > 1:
+        parser.error(f"{args.action} takes a single config file.")
+
+    loader = FileLoader(
+        workers=args.workers,
+        executor=args.executor,
+        codec=args.codec,
+        lazy=args.lazy_sources,
+        cache=BuildCache(
+            args.cache_dir,
+            args.cache_max_entries,
+            args.cache_max_age,
+            args.cache_format,
+        )
+        if args.cache_dir
+        else None,
+    )
+    if args.action in ("merge", "watch", "split"):
         cfg = BuildConfig.load_config_from_file(
-            args.config_file_path, root_path, parameters
+            args.config_file_paths[0], root_path, parameters, loader, args.compact
         )
-        cfg.build()
 
-    elif args.action == "split":
-        raise NotImplementedError(
-            "Splitting has not been implimented for data-file-merge ... yet."
+    if args.action == "merge":
+
+        def build():
+            if args.async_build:
+                asyncio.run(cfg.build_async(merge_mode=args.merge_mode))
+            else:
+                cfg.build(merge_mode=args.merge_mode, merge_workers=args.merge_workers)
+
+        if args.profile:
+            with Profiler() as profiler:
+                build()
+            profiler.report(args.profile, args.profile_output)
+        else:
+            build()
+
+    elif args.action == "merge-all":
+        config_file_paths = []
+        for config_file_pattern in args.config_file_paths:
+            matched_paths = sorted(glob.glob(config_file_pattern, recursive=True))
+            if not matched_paths:
+                parser.error(f"No config files found at '{config_file_pattern}'.")
+            config_file_paths.extend(
+                matched_path
+                for matched_path in matched_paths
+                if matched_path not in config_file_paths
+            )
+        batch_build = BatchBuild(
+            config_file_paths,
+            root_path,
+            parameters,
+            loader,
+            args.compact,
+            args.build_workers,
+        )
+        results = batch_build.run(merge_workers=args.merge_workers)
+        print(format_summary(results))
+        if args.summary_file:
+            JsonFileType.save_to_file(summary_to_dict(results), args.summary_file)
+        failures = [result for result in results if result.error is not None]
+        if failures:
+            raise BatchBuildError(
+                f"{len(failures)} of {len(results)} configs failed to build."
+            )
+
+    elif args.action == "watch":
+        # Content is kept between rebuilds, so watching always merges copy on write.
+        watcher = BuildWatcher(
+            cfg, args.debounce, args.poll, args.poll_interval, args.merge_workers
         )
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
+
+    elif args.action == "split":
+        written_paths = SplitBuild(cfg, args.build_workers).run()
+        print(f"Split {cfg.destination_path} into {len(written_paths)} files.")
 
 
 if __name__ == "__main__":
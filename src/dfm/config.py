@@ -1,17 +1,39 @@
-from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from functools import cached_property
 from pathlib import Path
 from typing import List
 
-from jsonpath_ng import parse
-
+from dfm.build_cache import RACY_WINDOW_NS, BuildCache, MemoryCache
+from dfm.directory_index import DirectoryIndex
+from dfm.file_loader import FileLoader
 from dfm.file_location import FileLocation, Substitution
-from dfm.file_types import JsonFileType
-from dfm.json_merger import JsonMergerFactory
+from dfm.file_types import FileTypeFactory
+from dfm.json_merger import COPY_ON_WRITE, JsonMergerFactory, MergeOwnership
+from dfm.json_path import SimpleJsonPath, compile_json_path
+from dfm.naming_conventions import StringConverter
+from dfm.parallel_merge import TreeReductionMerger
 from dfm.reference_types import ReferenceTypeFactory
 from dfm.regex import RegexExtractor
 
 
+def _writes_to_several_nodes(jsonpath_expr, dest_content_matches: List) -> bool:
+    """
+    Synopsis:   Works out whether a source is merged into (and written back to) more than one destination node.
+                Simple paths are only ever written to one node, other paths to every node they match or create.
+    Returns:    True if more than one node may be written.
+    """
+    return len(dest_content_matches) > 1 or (
+        not dest_content_matches and not isinstance(jsonpath_expr, SimpleJsonPath)
+    )
+
+
 @dataclass
 class SourceFile:
     """
@@ -20,11 +42,16 @@ class SourceFile:
         location = a FileLocation object that provides one or more file locations for the build.
         node = the jsonpath to the root node to copy from in each source file found.
         destination_node = the jsonpath to the root node to copy to in the destination file.
+        loader = the FileLoader used to load each source file found. Defaults to loading one file at a time.
+        file_type = the name of the file type (e.g. 'Yaml') to load each source file as.
+                    Defaults to choosing by each file's extension, see FileTypeFactory.
     """
 
     location: FileLocation
     node: str
     destination_node: str
+    loader: FileLoader = field(default=None, compare=False, repr=False)
+    file_type: str = None
 
     @cached_property
     def retrieved_src_content(self) -> List:
@@ -33,14 +60,10 @@ class SourceFile:
                     for all files that are found at the specified file location.
         Returns:    A list of objects that will be merged within the destination file at the specified root node.
         """
-        retrieved_src_content = []
-        for src_file in self.location.resolved_paths:
-            src_content = JsonFileType.load_from_file(src_file)
-            jsonpath_expr = parse(self.node)
-            retrieved_src_content.extend(
-                [match.value for match in jsonpath_expr.find(src_content)]
-            )
-        return retrieved_src_content
+        loader = self.loader if self.loader is not None else FileLoader()
+        return loader.load_node_values(
+            self.location.resolved_paths, self.node, self.file_type
+        )
 
 
 @dataclass
@@ -49,9 +72,13 @@ class DestinationFile:
     Synopsis:   A class for handling the destination file definition for a build.
     Parameters:
         file_location = a FileLocation object that provides one single file location for the build.
+        loader = the FileLoader used to load the existing destination file. Defaults to the build's loader.
+        file_type = the name of the file type to load and save the destination file as. Defaults to choosing by extension.
     """
 
     location: FileLocation
+    loader: FileLoader = field(default=None, compare=False, repr=False)
+    file_type: str = None
 
     def __post_init__(self):
         if len(self.location.resolved_paths) > 1:
@@ -61,20 +88,49 @@ class DestinationFile:
 
     @cached_property
     def content(self) -> dict or List:
+        loader = self.loader if self.loader is not None else FileLoader()
+        file_path = self.location.root_path / self.location.substituted_path
         return (
-            JsonFileType.load_from_file(
-                self.location.root_path / self.location.substituted_path
-            )
-            if (self.location.root_path / self.location.substituted_path).exists()
+            loader.load_file(file_path, self.file_type)
+            if loader.file_exists(file_path)
             else {}
         )
 
 
 @dataclass
 class BuildConfig:
+    """
+    Synopsis:   A class for handling a complete build.
+    Parameters:
+        source_files = the SourceFile objects to merge, in merge order.
+        destination_file = the DestinationFile to merge into.
+        root_path = the path that all file paths are relative to.
+        loader = the FileLoader shared by every source and destination file that does not have its own.
+                 Its codec is also used to write the destination file.
+        compact_output = whether to write the destination file without any whitespace instead of indenting by 4 spaces.
+        directory_index = the DirectoryIndex shared by every file location that does not have its own,
+                          so directories shared by several sources are only listed once.
+    Attributes:
+        build_skipped = whether the last build was skipped because the loader's cache showed nothing had changed.
+    """
+
     source_files: List[SourceFile]
     destination_file: DestinationFile
     root_path: Path
+    loader: FileLoader = field(default_factory=FileLoader, repr=False)
+    compact_output: bool = False
+    directory_index: DirectoryIndex = field(default_factory=DirectoryIndex, repr=False)
+    tree_writes_avoided: int = field(default=0, init=False, repr=False)
+    build_skipped: bool = field(default=False, init=False, repr=False)
+
+    def __post_init__(self):
+        for src in self.source_files:
+            if src.loader is None:
+                src.loader = self.loader
+            if src.location.directory_index is None:
+                src.location.directory_index = self.directory_index
+        if self.destination_file.loader is None:
+            self.destination_file.loader = self.loader
 
     def __eq__(self, other):
 
@@ -97,97 +153,448 @@ class BuildConfig:
             and src_files_match
         )
 
-    def generate_new_dest_content(self) -> dict or List:
+    def generate_new_dest_content(
+        self, merge_mode: str = COPY_ON_WRITE, merge_workers: int = 1
+    ) -> dict or List:
         """
         Synopsis:   Combines the current state of the desination file with desired source file content
+                    All of a source's content is folded into each destination match before that match is
+                    written back to the tree once. The number of writes this saved is kept in tree_writes_avoided.
+        Parameters:
+            merge_mode = 'copy_on_write' (default) copies a loaded container the first time a merge changes it,
+                         leaving everything else shared. 'in_place' mutates loaded content directly,
+                         until a source is merged into more than one node (see MergeOwnership.share_between_nodes).
+                         Both modes give the same content. Source content is never changed by merging it, and
+                         nodes written together (e.g. by '$.*') don't change each other when merged into later.
+            merge_workers = the number of processes to merge each source's content with.
+                            1 (default) merges serially. See TreeReductionMerger.
         Returns:    The new destination file content. Note the file has not been saved to disk yet.
         """
+        if merge_mode == COPY_ON_WRITE:
+            self.retrieve_shared_sources()
+        ownership = MergeOwnership(merge_mode)
+        self.tree_writes_avoided = 0
         dest_content = self.destination_file.content
-        for src in self.source_files:
-            jsonpath_expr = parse(src.destination_node)
-            dest_content_matches = [
-                match.value for match in jsonpath_expr.find(dest_content)
-            ]
-            if dest_content_matches == []:
-                dest_content_matches = [None]
-            for destination_match in dest_content_matches:
-                for src_content in src.retrieved_src_content:
-                    dest_json_merger = JsonMergerFactory(
-                        destination_match
-                    ).generate_json_merger()
-                    dest_json_merger.merge_obj(src_content)
-                    destination_match = dest_json_merger.json_obj
+        # One process pool (if any) is shared by every merge of the build.
+        with TreeReductionMerger(merge_workers, ownership) as merger:
+            for src in self.source_files:
+                jsonpath_expr = compile_json_path(src.destination_node)
+                dest_content_matches = jsonpath_expr.find_values(dest_content)
+                if not src.retrieved_src_content:
+                    continue
+                writes_to_several_nodes = _writes_to_several_nodes(
+                    jsonpath_expr, dest_content_matches
+                )
+                if writes_to_several_nodes:
+                    ownership.share_between_nodes()
+                for destination_match in dest_content_matches or [None]:
+                    merged_match = merger.merge_all(
+                        destination_match, src.retrieved_src_content
+                    )
                     dest_content = jsonpath_expr.update_or_create(
-                        dest_content, dest_json_merger.json_obj
+                        dest_content, merged_match, ownership
                     )
+                    self.tree_writes_avoided += len(src.retrieved_src_content) - 1
+                if writes_to_several_nodes:
+                    # Every node now holds the same merged content, which mustn't be changed through just one of them.
+                    ownership.share_between_nodes()
         return dest_content
 
+    def retrieve_shared_sources(self):
+        """
+        Synopsis:   Retrieves the content of sources that share a FileLocation (e.g. different nodes of the same files)
+                    so that each of their files is only loaded once. The documents are kept only while these sources
+                    are retrieved. Sources share the loaded content, so this is only safe for copy on write merges.
+                    Loaders whose cache is already a MemoryCache keep their own documents and are left alone.
+        """
+        sources_by_location = {}
+        for src in self.source_files:
+            sources_by_location.setdefault(id(src.location), []).append(src)
+        document_loaders = {}
+        for sources in sources_by_location.values():
+            if len(sources) < 2:
+                continue
+            for src in sources:
+                loader = src.loader
+                if loader is None or isinstance(loader.cache, MemoryCache):
+                    continue
+                if id(loader) not in document_loaders:
+                    document_loaders[id(loader)] = replace(
+                        loader, cache=MemoryCache(backing=loader.cache, documents=True)
+                    )
+                src.loader = document_loaders[id(loader)]
+                try:
+                    src.retrieved_src_content
+                finally:
+                    src.loader = loader
+
     def write_content(self, content: dict):
         # Only current use case is writing a destination file which at the moment uses the substituted path instead of a resolved path.
         # This is because the file to write to can be new so doesn't resolve (hence have empty list for resolved_paths)
         # JsonFileType.save_to_file(content, self.destination_file.destination_file_location.resolved_paths[0])
-        JsonFileType.save_to_file(
+        self.loader.save_file(
             content,
-            self.root_path / self.destination_file.location.substituted_path,
+            self.destination_path,
+            self.destination_file.file_type,
+            self.compact_output,
+        )
+        self.directory_index.invalidate([self.destination_path.parent])
+
+    @property
+    def destination_path(self) -> Path:
+        return self.root_path / self.destination_file.location.substituted_path
+
+    def fingerprint(self) -> str:
+        """
+        Synopsis:   Fingerprints everything a build's output depends on: the nodes copied, the mtime and size
+                    of every source file found and the output options. Any change to these changes the fingerprint.
+                    A source file modified within RACY_WINDOW_NS could change again without its mtime moving,
+                    so while any is that recent the fingerprint is unique and never matches a later build.
+        Returns:    The hex sha256 digest of the build's inputs.
+        """
+        fingerprinted_at_ns = time.time_ns()
+        build_hash = hashlib.sha256()
+        for src in self.source_files:
+            build_hash.update(
+                f"{src.node}\0{src.destination_node}\0{src.file_type}\0".encode()
+            )
+            for resolved_path in src.location.resolved_paths:
+                file_stat = Path(resolved_path).stat()
+                build_hash.update(
+                    f"{Path(resolved_path).absolute()}\0{file_stat.st_mtime_ns}\0{file_stat.st_size}\0".encode()
+                )
+                if fingerprinted_at_ns - file_stat.st_mtime_ns <= RACY_WINDOW_NS:
+                    build_hash.update(secrets.token_bytes(16))
+        build_hash.update(
+            f"{self.destination_path.absolute()}\0{self.destination_file.file_type}\0"
+            f"{self.compact_output}\0{self.loader.codec}".encode()
         )
+        return build_hash.hexdigest()
 
     @staticmethod
     def load_config_from_file(
         file_path: Path,
         root_path: Path,
         parameters=None,
+        loader: FileLoader = None,
+        compact_output: bool = False,
+        directory_index: DirectoryIndex = None,
     ):
+        config_dict = FileTypeFactory().generate(file_path).load_from_file(file_path)
+        return BuildConfig.from_dict(
+            config_dict,
+            root_path,
+            parameters,
+            loader,
+            compact_output,
+            directory_index,
+        )
+
+    @staticmethod
+    def from_dict(
+        config_dict: dict,
+        root_path: Path,
+        parameters=None,
+        loader: FileLoader = None,
+        compact_output: bool = False,
+        directory_index: DirectoryIndex = None,
+    ):
+        """
+        Synopsis:   Creates a build from a config that has already been loaded, in the format of a config file.
+                    See load_config_from_file. For a build that runs entirely in memory, see dfm.in_memory.
+        Parameters:
+            config_dict = The config, with 'SourceFiles' and 'DestinationFile' keys.
+            root_path = The path that all file paths are relative to.
+            parameters = The values of 'Parameter' substitutions.
+            loader = The FileLoader to load every file with. Defaults to loading one file at a time.
+            compact_output = Whether to write the destination file without whitespace.
+            directory_index = The DirectoryIndex to glob with. Defaults to a new index of the local filesystem.
+        Returns:    The BuildConfig.
+        """
         if parameters is None:
             parameters = {}
-        config_dict = JsonFileType.load_from_file(file_path)
-        source_files = []
-        for src in config_dict["SourceFiles"]:
+        if directory_index is None:
+            directory_index = DirectoryIndex()
+        # Substitutions and source locations that are written the same way are shared, so each substitution
+        # is evaluated once and each location is only globbed once however many sources use it.
+        substitutions = {}
+        source_locations = {}
+
+        def parse_subs(location_dict: dict) -> dict:
             subs = {}
-            if "PathSubs" in src["SourceFileLocation"]:
-                for sub_key, sub_dict in src["SourceFileLocation"]["PathSubs"].items():
+            for sub_key, sub_dict in location_dict.get("PathSubs", {}).items():
+                substitution_key = json.dumps(sub_dict, sort_keys=True)
+                if substitution_key not in substitutions:
                     reference_type = ReferenceTypeFactory(sub_dict["Type"]).generate()
-                    regex = RegexExtractor.parse_from_sub_dict(sub_dict)
-                    subs[sub_key] = Substitution(
+                    substitutions[substitution_key] = Substitution(
                         reference_type(
                             parameters, None  # TODO support reading from content
                         ),
                         sub_dict["Value"],
-                        regex,
+                        RegexExtractor.parse_from_sub_dict(sub_dict),
+                        StringConverter.parse_from_sub_dict(sub_dict),
                     )
+                subs[sub_key] = substitutions[substitution_key]
+            return subs
+
+        source_files = []
+        for src in config_dict["SourceFiles"]:
+            location_key = json.dumps(src["SourceFileLocation"], sort_keys=True)
+            if location_key not in source_locations:
+                source_locations[location_key] = FileLocation(
+                    src["SourceFileLocation"]["Path"],
+                    root_path,
+                    parse_subs(src["SourceFileLocation"]),
+                    directory_index,
+                    content_wildcards=True,
+                )
+            # Warm the jsonpath cache so that parsing happens once, up front.
+            compile_json_path(src["SourceFileNode"])
+            compile_json_path(src["DestinationFileNode"])
             source_files.append(
                 SourceFile(
-                    FileLocation(src["SourceFileLocation"]["Path"], root_path, subs),
+                    source_locations[location_key],
                     src["SourceFileNode"],
                     src["DestinationFileNode"],
+                    file_type=src["SourceFileLocation"].get("FileType"),
                 )
             )
-        dest_subs = {}
-        if "PathSubs" in config_dict["DestinationFile"]["DestinationFileLocation"]:
-            for sub_key, sub_dict in config_dict["DestinationFile"][
-                "DestinationFileLocation"
-            ]["PathSubs"].items():
-                reference_type = ReferenceTypeFactory(sub_dict["Type"]).generate()
-                regex = RegexExtractor.parse_from_sub_dict(sub_dict)
-                dest_subs[sub_key] = Substitution(
-                    reference_type(
-                        parameters, None
-                    ),  # TODO support reading from content
-                    sub_dict["Value"],
-                    regex,
-                )
+        dest_subs = parse_subs(
+            config_dict["DestinationFile"]["DestinationFileLocation"]
+        )
         dest_file = DestinationFile(
             FileLocation(
                 config_dict["DestinationFile"]["DestinationFileLocation"]["Path"],
                 root_path,
                 dest_subs,
-            )
+                directory_index,
+            ),
+            file_type=config_dict["DestinationFile"]["DestinationFileLocation"].get(
+                "FileType"
+            ),
         )
         return BuildConfig(
-            source_files=source_files, destination_file=dest_file, root_path=root_path
+            source_files=source_files,
+            destination_file=dest_file,
+            root_path=root_path,
+            loader=loader if loader is not None else FileLoader(),
+            compact_output=compact_output,
+            directory_index=directory_index,
         )
 
-    def build(self, save_to_local_file: bool = True):
-        content = self.generate_new_dest_content()
+    def _build_cache(self, save_to_local_file: bool) -> BuildCache:
+        cache = self.loader.cache if save_to_local_file else None
+        if isinstance(cache, MemoryCache):
+            cache = cache.backing
+        if not isinstance(cache, BuildCache):
+            cache = None
+        return cache
+
+    def build(
+        self,
+        save_to_local_file: bool = True,
+        merge_mode: str = COPY_ON_WRITE,
+        merge_workers: int = 1,
+    ):
+        cache = self._build_cache(save_to_local_file)
+        if cache is not None:
+            fingerprint = self.fingerprint()
+            self.build_skipped = cache.is_up_to_date(self.destination_path, fingerprint)
+            if self.build_skipped:
+                return self.destination_file.content
+        content = self.generate_new_dest_content(merge_mode, merge_workers)
         if save_to_local_file:
             self.write_content(content)
+        if cache is not None:
+            cache.record_build(self.destination_path, fingerprint)
+            cache.evict()
         return content
+
+    async def build_async(
+        self,
+        save_to_local_file: bool = True,
+        merge_mode: str = COPY_ON_WRITE,
+        queue_size: int = 8,
+    ):
+        """
+        Synopsis:   Builds as build does, but as an asyncio pipeline: source files are loaded on threads
+                    (loader.workers at a time) and each file's content is merged as soon as it arrives,
+                    so loading overlaps with merging. Content is merged in config order, so the result
+                    is the same as build's however the loads finish.
+                    Loading, merging and writing all happen off the event loop, so other tasks keep running.
+                    Each file is handed between threads, so for many small local files build is quicker;
+                    this pays off when loads wait on I/O, e.g. on network filesystems.
+        Parameters:
+            save_to_local_file = whether to write the destination file.
+            merge_mode = 'copy_on_write' or 'in_place', see generate_new_dest_content.
+            queue_size = the most loaded files waiting to be merged. Loading pauses while the queue is full.
+                         The files waiting when a merge starts are merged together, so at most
+                         2 * queue_size + loader.workers files' content is held at once.
+        Returns:    The new destination file content.
+        """
+        if queue_size < 1:
+            raise ValueError(
+                f"A build needs a queue of at least 1, {queue_size} was requested."
+            )
+        loop = asyncio.get_running_loop()
+        load_executor = ThreadPoolExecutor(max_workers=self.loader.workers)
+        # One thread merges, so content is merged in order without blocking the event loop.
+        merge_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            cache = self._build_cache(save_to_local_file)
+            if cache is not None:
+                fingerprint = await loop.run_in_executor(
+                    load_executor, self.fingerprint
+                )
+                self.build_skipped = await loop.run_in_executor(
+                    load_executor,
+                    cache.is_up_to_date,
+                    self.destination_path,
+                    fingerprint,
+                )
+                if self.build_skipped:
+                    return await loop.run_in_executor(
+                        load_executor, lambda: self.destination_file.content
+                    )
+            queue = asyncio.Queue(maxsize=queue_size)
+            producer = asyncio.ensure_future(
+                self._load_source_values(queue, load_executor)
+            )
+            consumer = asyncio.ensure_future(
+                self._merge_source_values(queue, merge_executor, merge_mode)
+            )
+            try:
+                _, content = await asyncio.gather(producer, consumer)
+            except BaseException:
+                producer.cancel()
+                consumer.cancel()
+                raise
+            if save_to_local_file:
+                await loop.run_in_executor(merge_executor, self.write_content, content)
+            if cache is not None:
+                await loop.run_in_executor(
+                    merge_executor,
+                    cache.record_build,
+                    self.destination_path,
+                    fingerprint,
+                )
+                await loop.run_in_executor(merge_executor, cache.evict)
+            return content
+        finally:
+            load_executor.shutdown(wait=False)
+            merge_executor.shutdown(wait=False)
+
+    async def _load_source_values(
+        self, queue: asyncio.Queue, executor: ThreadPoolExecutor
+    ):
+        # Puts (source index, values) on the queue for every file of every source, in order, then None.
+        loop = asyncio.get_running_loop()
+        loading = deque()
+        for src_index, src in enumerate(self.source_files):
+            if "retrieved_src_content" in src.__dict__:
+                # Already loaded, e.g. by a previous build.
+                loaded = loop.create_future()
+                loaded.set_result(src.retrieved_src_content)
+                loading.append((src_index, loaded))
+                continue
+            loader = src.loader if src.loader is not None else self.loader
+            jsonpath_expr = compile_json_path(src.node)
+            resolved_paths = await loop.run_in_executor(
+                executor, lambda: src.location.resolved_paths
+            )
+            for file_path in resolved_paths:
+                while len(loading) >= self.loader.workers:
+                    await self._put_loaded(queue, loading)
+                loading.append(
+                    (
+                        src_index,
+                        loop.run_in_executor(
+                            executor,
+                            loader.extract_node_values,
+                            file_path,
+                            jsonpath_expr,
+                            src.file_type,
+                        ),
+                    )
+                )
+        while loading:
+            await self._put_loaded(queue, loading)
+        await queue.put(None)
+
+    @staticmethod
+    async def _put_loaded(queue: asyncio.Queue, loading: deque):
+        src_index, values = loading.popleft()
+        await queue.put((src_index, await values))
+
+    async def _merge_source_values(
+        self, queue: asyncio.Queue, executor: ThreadPoolExecutor, merge_mode: str
+    ) -> dict or List:
+        loop = asyncio.get_running_loop()
+        ownership = MergeOwnership(merge_mode)
+        self.tree_writes_avoided = 0
+        dest_content = await loop.run_in_executor(
+            executor, lambda: self.destination_file.content
+        )
+        merging_index = None
+        merged_matches = []
+        writes_to_several_nodes = False
+        merged_count = 0
+        not_taken = object()
+
+        def merge_values(values: List) -> List:
+            return [
+                JsonMergerFactory(merged_match, ownership).merge_all(values)
+                for merged_match in merged_matches
+            ]
+
+        def update_dest_content() -> dict or List:
+            # As in generate_new_dest_content, each match is written back once, after all its content is merged.
+            jsonpath_expr = compile_json_path(
+                self.source_files[merging_index].destination_node
+            )
+            updated_content = dest_content
+            for merged_match in merged_matches:
+                updated_content = jsonpath_expr.update_or_create(
+                    updated_content, merged_match, ownership
+                )
+            return updated_content
+
+        item = await queue.get()
+        while True:
+            if item is None or item[0] != merging_index:
+                if merged_count:
+                    dest_content = await loop.run_in_executor(
+                        executor, update_dest_content
+                    )
+                    self.tree_writes_avoided += (merged_count - 1) * len(merged_matches)
+                    if writes_to_several_nodes:
+                        ownership.share_between_nodes()
+                if item is None:
+                    return dest_content
+                merging_index = item[0]
+                jsonpath_expr = compile_json_path(
+                    self.source_files[merging_index].destination_node
+                )
+                merged_matches = jsonpath_expr.find_values(dest_content)
+                writes_to_several_nodes = _writes_to_several_nodes(
+                    jsonpath_expr, merged_matches
+                )
+                if writes_to_several_nodes:
+                    ownership.share_between_nodes()
+                merged_matches = merged_matches or [None]
+                merged_count = 0
+            # Everything of this source that is already waiting is merged in one go, rather than a file at a time.
+            values = list(item[1])
+            next_item = not_taken
+            while not queue.empty():
+                waiting_item = queue.get_nowait()
+                if waiting_item is None or waiting_item[0] != merging_index:
+                    next_item = waiting_item
+                    break
+                values.extend(waiting_item[1])
+            if values:
+                merged_matches = await loop.run_in_executor(
+                    executor, merge_values, values
+                )
+                merged_count += len(values)
+            item = await queue.get() if next_item is not_taken else next_item
@@ -0,0 +1,201 @@
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path, PurePath
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+GLOB_CHARACTERS = ("*", "?", "[")
+# A character class (whose first character may be '!' and/or ']'), a wildcard, or any other character.
+GLOB_TOKEN = re.compile(r"\[!?\]?[^\]]*\]|.", re.DOTALL)
+
+
+def is_wildcard(part: str) -> bool:
+    """
+    Synopsis:   Determines whether a part of a glob pattern has to be matched against directory listings.
+    """
+    return any(character in part for character in GLOB_CHARACTERS)
+
+
+def _translate_glob_token(token: str) -> str:
+    if token == "*":
+        return "[^/]*"
+    if token == "?":
+        return "[^/]"
+    if len(token) > 2 and token.startswith("["):
+        character_class = token[1:-1].replace("\\", "\\\\")
+        if character_class.startswith("!"):
+            character_class = "^" + character_class[1:]
+        elif character_class.startswith("^"):
+            character_class = "\\" + character_class
+        return f"[{character_class}]"
+    return re.escape(token)
+
+
+@lru_cache(maxsize=None)
+def compile_glob_part(part: str):
+    """
+    Synopsis:   Converts one part of a pathlib style glob pattern (e.g. 'file_*.json') to a regex.
+    Returns:    A compiled regex that matches whole file names.
+    """
+    return re.compile(
+        "".join(_translate_glob_token(token) for token in GLOB_TOKEN.findall(part))
+        + r"\Z"
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_glob(pattern: str):
+    """
+    Synopsis:   Converts a pathlib style glob pattern to a regex that matches the same relative paths.
+                '**' matches any number of directories, '*', '?' and '[...]' never match a '/'.
+    Parameters:
+        pattern = The glob pattern, e.g. 'resources/**/*.json'.
+    Returns:    A compiled regex to match posix style relative paths against.
+    """
+    parts = PurePath(pattern).parts
+    regex = ""
+    for index, part in enumerate(parts):
+        if part == "**":
+            regex += "(?:[^/]+/)*"
+            continue
+        regex += compile_glob_part(part).pattern[: -len(r"\Z")]
+        if index < len(parts) - 1:
+            regex += "/"
+    return re.compile(regex + r"\Z")
+
+
+@dataclass
+class DirectoryEntry:
+    """
+    Synopsis:   What a directory listing records about each of its entries.
+    Parameters:
+        is_dir = Whether the entry is a directory, following symlinks.
+        is_symlink = Whether the entry is a symlink.
+    """
+
+    is_dir: bool
+    is_symlink: bool
+
+
+@dataclass
+class DirectoryIndex:
+    """
+    Synopsis:   Lists each directory at most once and matches glob patterns against the listings.
+                One index is shared by every FileLocation of a build (or batch of builds), so sources
+                with overlapping patterns don't walk the same directories again.
+                Matches are the same as pathlib's Path.glob, including '**' not following symlinks,
+                but are returned sorted so that builds are deterministic.
+                Subclasses can index something other than the local filesystem by overriding scan_directory.
+    """
+
+    listings: Dict[Path, Dict[str, DirectoryEntry]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    def scan_directory(self, directory: Path) -> Dict[str, DirectoryEntry]:
+        """
+        Synopsis:   Lists a directory.
+        Parameters:
+            directory = The directory to list.
+        Returns:    A mapping of each entry's name to what is known about it. Empty if the directory can't be listed.
+        """
+        entries = {}
+        try:
+            with os.scandir(directory) as directory_entries:
+                for entry in directory_entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    entries[entry.name] = DirectoryEntry(is_dir, entry.is_symlink())
+        except OSError:
+            pass
+        return entries
+
+    def list_directory(self, directory: Path) -> Dict[str, DirectoryEntry]:
+        """
+        Synopsis:   Lists a directory, from the index if it has been listed before.
+        """
+        listing = self.listings.get(directory)
+        if listing is None:
+            listing = self.scan_directory(directory)
+            with self.lock:
+                self.listings[directory] = listing
+        return listing
+
+    def invalidate(self, directories: Iterable[Path] = None):
+        """
+        Synopsis:   Forgets the listings of directories whose content has changed.
+        Parameters:
+            directories = The directories to forget. None forgets every listing.
+        """
+        with self.lock:
+            if directories is None:
+                self.listings.clear()
+                return
+            for directory in directories:
+                self.listings.pop(Path(directory), None)
+
+    def _walk_directories(self, directory: Path) -> Iterator[Path]:
+        directories_to_walk = [directory]
+        while directories_to_walk:
+            directory = directories_to_walk.pop()
+            yield directory
+            directories_to_walk.extend(
+                directory / name
+                for name, entry in sorted(
+                    self.list_directory(directory).items(), reverse=True
+                )
+                if entry.is_dir and not entry.is_symlink
+            )
+
+    def _select(self, directory: Path, parts: Tuple[str, ...]) -> Iterator[Path]:
+        if not parts:
+            yield directory
+            return
+        part, remaining_parts = parts[0], parts[1:]
+        if part == "":
+            # A trailing separator, only directories match.
+            yield directory
+        elif part == "**":
+            for walked_directory in self._walk_directories(directory):
+                yield from self._select(walked_directory, remaining_parts)
+        elif is_wildcard(part):
+            part_regex = compile_glob_part(part)
+            for name, entry in self.list_directory(directory).items():
+                if (entry.is_dir or not remaining_parts) and part_regex.match(name):
+                    yield from self._select(directory / name, remaining_parts)
+        elif part == "..":
+            if (directory / part).is_dir():
+                yield from self._select(directory / part, remaining_parts)
+        else:
+            entry = self.list_directory(directory).get(part)
+            if (
+                entry is not None
+                and (entry.is_dir or not remaining_parts)
+                and not (entry.is_symlink and not (directory / part).exists())
+            ):
+                yield from self._select(directory / part, remaining_parts)
+
+    def glob(self, root_path: Path, pattern: str) -> List[Path]:
+        """
+        Synopsis:   Finds every path under root_path that matches a glob pattern.
+        Parameters:
+            root_path = The path the pattern is relative to.
+            pattern = The pathlib style glob pattern.
+        Returns:    The matching paths, sorted.
+        """
+        pure_pattern = PurePath(pattern)
+        if pure_pattern.anchor:
+            raise NotImplementedError("Non-relative patterns are unsupported")
+        if not pure_pattern.parts:
+            raise ValueError(f"Unacceptable pattern: {pattern!r}")
+        parts = pure_pattern.parts
+        if str(pattern).endswith(("/", os.sep)):
+            parts += ("",)
+        return sorted(set(self._select(Path(root_path), parts)))
@@ -12,3 +12,19 @@ class NamingConventionError(ConfigSeperationError):
 
 class ReferenceTypeError(ConfigSeperationError):
     ...
+
+
+class JsonCodecError(ConfigSeperationError):
+    ...
+
+
+class FileTypeError(ConfigSeperationError):
+    ...
+
+
+class BatchBuildError(ConfigSeperationError):
+    ...
+
+
+class SplitError(ConfigSeperationError):
+    ...
@@ -0,0 +1,227 @@
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import repeat
+from pathlib import Path
+from typing import List
+
+from dfm.build_cache import BuildCache, MemoryCache
+from dfm.file_types import FileTypeFactory, JsonFileType, ijson
+from dfm.json_codecs import AUTO_CODEC, JsonCodecFactory
+from dfm.json_path import SimpleJsonPath, compile_json_path
+
+THREAD_EXECUTOR = "thread"
+PROCESS_EXECUTOR = "process"
+EXECUTORS = (THREAD_EXECUTOR, PROCESS_EXECUTOR)
+
+
+@dataclass
+class FileLoader:
+    """
+    Synopsis:   A class for loading the content of many files, optionally concurrently.
+    Parameters:
+        workers = The maximum number of files to load at once. 1 loads files one at a time.
+        executor = 'thread' to load with a thread pool (best for slow or network filesystems)
+                   or 'process' to load with a process pool (best when JSON decoding dominates).
+        codec = The name of the JSON codec used to decode (and encode) JSON files. See JsonCodecFactory.
+        lazy = Whether to only parse the node being retrieved when it is a path of plain keys (e.g. '$.Resources').
+               The rest of the file is skipped without building python objects for it. Needs ijson.
+        cache = An optional BuildCache (or MemoryCache) of the content retrieved from each file,
+                so unchanged files aren't parsed again.
+    """
+
+    workers: int = 1
+    executor: str = THREAD_EXECUTOR
+    codec: str = AUTO_CODEC
+    lazy: bool = False
+    cache: BuildCache or MemoryCache = None
+
+    def __post_init__(self):
+        if self.workers < 1:
+            raise ValueError(
+                f"A file loader needs at least 1 worker, {self.workers} were requested."
+            )
+        if self.executor not in EXECUTORS:
+            raise ValueError(
+                f"Executor '{self.executor}' is not one of the supported executors {EXECUTORS}."
+            )
+        JsonCodecFactory(self.codec).generate()
+        if self.lazy and ijson is None:
+            warnings.warn(
+                "Lazy loading needs ijson, which is not installed. Files will be loaded in full."
+            )
+
+    def load_file(self, file_path: Path, file_type: str = None) -> dict or list:
+        """
+        Synopsis:   Loads the whole content of a single file.
+        Parameters:
+            file_path = The file to load.
+            file_type = The name of the file type to load the file as. None chooses by extension, see FileTypeFactory.
+        Returns:    The content of the file.
+        """
+        return (
+            FileTypeFactory(file_type)
+            .generate(file_path)
+            .load_from_file(file_path, self.codec)
+        )
+
+    def file_exists(self, file_path: Path) -> bool:
+        """
+        Synopsis:   Determines whether there is a file to load at a path.
+        """
+        return Path(file_path).exists()
+
+    def save_file(
+        self,
+        content: dict or list,
+        file_path: Path,
+        file_type: str = None,
+        compact: bool = False,
+    ):
+        """
+        Synopsis:   Saves content to a file, encoding JSON with the loader's codec.
+        Parameters:
+            content = The content to save.
+            file_path = The file to save to.
+            file_type = The name of the file type to save the file as. None chooses by extension.
+            compact = Whether to leave out all whitespace.
+        """
+        FileTypeFactory(file_type).generate(file_path).save_to_file(
+            content, file_path, self.codec, compact
+        )
+
+    def extract_node_values(
+        self, file_path: Path, jsonpath_expr, file_type: str = None
+    ) -> List:
+        """
+        Synopsis:   Retrieves the content found at a jsonpath expression in a single file.
+        Parameters:
+            file_path = The file to load.
+            jsonpath_expr = The expression (from compile_json_path) to find in the file.
+            file_type = The name of the file type to load the file as. None chooses by extension.
+        Returns:    A list of the values matched in the file.
+        """
+        if self.cache is not None:
+            return self.cache.get_node_values(
+                file_path,
+                str(jsonpath_expr),
+                lambda: self._parse_node_values(file_path, jsonpath_expr, file_type),
+            )
+        return self._parse_node_values(file_path, jsonpath_expr, file_type)
+
+    def _parse_node_values(
+        self, file_path: Path, jsonpath_expr, file_type: str = None
+    ) -> List:
+        if (
+            self.lazy
+            and FileTypeFactory(file_type).generate(file_path) is JsonFileType
+            and isinstance(jsonpath_expr, SimpleJsonPath)
+            and JsonFileType.can_stream_node(jsonpath_expr.steps)
+            and Path(file_path).stat().st_size > 0
+        ):
+            return JsonFileType.load_node_from_file(file_path, jsonpath_expr.steps)
+        if isinstance(self.cache, MemoryCache):
+            document = self.cache.get_document(
+                file_path, lambda: self.load_file(file_path, file_type)
+            )
+        else:
+            document = self.load_file(file_path, file_type)
+        return jsonpath_expr.find_values(document)
+
+    def load_node_values(
+        self, file_paths: List[Path], node: str, file_type: str = None
+    ) -> List:
+        """
+        Synopsis:   Retrieves the content at a jsonpath node from every file given.
+        Parameters:
+            file_paths = The files to load.
+            node = The jsonpath to the node to retrieve from each file.
+            file_type = The name of the file type to load every file as. None chooses by each file's extension.
+        Returns:    A list of all matched values. Values are in the same order as file_paths,
+                    however many workers were used.
+        """
+        jsonpath_expr = compile_json_path(node)
+        if self.workers == 1 or len(file_paths) < 2:
+            values_per_file = [
+                self.extract_node_values(file_path, jsonpath_expr, file_type)
+                for file_path in file_paths
+            ]
+        else:
+            values_per_file = self._map_concurrently(
+                file_paths, jsonpath_expr, file_type
+            )
+
+        retrieved_values = []
+        for values in values_per_file:
+            retrieved_values.extend(values)
+        return retrieved_values
+
+    def _map_concurrently(
+        self, file_paths: List[Path], jsonpath_expr, file_type: str = None
+    ) -> List[List]:
+        workers = min(self.workers, len(file_paths))
+        if self.executor == PROCESS_EXECUTOR:
+            return self._map_processes(file_paths, jsonpath_expr, file_type, workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    self.extract_node_values,
+                    file_paths,
+                    repeat(jsonpath_expr),
+                    repeat(file_type),
+                )
+            )
+
+    def _map_processes(
+        self, file_paths: List[Path], jsonpath_expr, file_type: str, workers: int
+    ) -> List[List]:
+        # Processes are only sent plain arguments, never the loader, so the cache stays in this process.
+        parse = partial(parse_node_values, self.codec, self.lazy)
+        node = str(jsonpath_expr)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            if self.cache is None:
+                # Batch the files sent to each process to keep the pickling overhead down.
+                return list(
+                    executor.map(
+                        parse,
+                        file_paths,
+                        repeat(node),
+                        repeat(file_type),
+                        chunksize=max(1, len(file_paths) // (workers * 4)),
+                    )
+                )
+            # The cache is checked (and filled) from threads of this process, which wait on a process
+            # for each file the cache doesn't have.
+            with ThreadPoolExecutor(max_workers=workers) as cache_executor:
+                return list(
+                    cache_executor.map(
+                        lambda file_path: self.cache.get_node_values(
+                            file_path,
+                            node,
+                            lambda: executor.submit(
+                                parse, file_path, node, file_type
+                            ).result(),
+                        ),
+                        file_paths,
+                    )
+                )
+
+
+def parse_node_values(
+    codec: str, lazy: bool, file_path: Path, node: str, file_type: str = None
+) -> List:
+    """
+    Synopsis:   Parses the content at a node of a file, as a FileLoader without a cache would.
+                Kept at module level so that it can be sent to a process pool.
+    Parameters:
+        codec = The name of the JSON codec to decode with.
+        lazy = Whether to only parse the node, see FileLoader.
+        file_path = The file to load.
+        node = The jsonpath string of the node to retrieve.
+        file_type = The name of the file type to load the file as. None chooses by extension.
+    Returns:    A list of the values matched in the file.
+    """
+    return FileLoader(codec=codec, lazy=lazy)._parse_node_values(
+        file_path, compile_json_path(node), file_type
+    )
@@ -1,8 +1,11 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from functools import cached_property
 from pathlib import Path
 from typing import List
 
+from dfm.directory_index import DirectoryIndex, compile_glob
+from dfm.exceptions import ReferenceTypeError
+from dfm.naming_conventions import StringConverter
 from dfm.reference_types import BaseReferenceType
 from dfm.regex import RegexExtractor
 
@@ -16,20 +19,46 @@ class Substitution:
         reference_type = The ReferenceType object containing the specific substitution preparation logic
         value = The string to pass into the substitution preparation logic
         regex = The optional regex to filter the result on futher before finalising the substitution value #TODO make this optional
+        naming_convention = The optional StringConverter to convert the (filtered) result's naming convention with
+    Additional:
+        evaluated = The value evaluated the first time the substitution was needed. A build shares one Substitution
+                    between every location with the same substitution, so each is only evaluated once.
     """
 
     reference_type: BaseReferenceType  # TODO is this right? I want it to be any reference type so I've set the type to the base which they all inherit?
     value: str
     regex: RegexExtractor = None
+    naming_convention: StringConverter = None
+    evaluated: str = field(default=None, init=False, repr=False, compare=False)
 
     def evaluate(self) -> str:
         """
         Synopsis:   Evaluates a substitution request for a given reference type.
         Returns:    The value to use in the subsiquent substitution.
         """
-        return self.reference_type.evaluate(
+        if self.evaluated is None:
+            self.evaluated = self._evaluate(self.reference_type)
+        return self.evaluated
+
+    def evaluate_with_content(self, file_content: dict or list) -> str:
+        """
+        Synopsis:   Evaluates a substitution against some content, e.g. each item being split out of a file.
+                    Only differs from evaluate for reference types that read content ('Key' and 'Content').
+        Parameters:
+            file_content = The content for the reference type to read.
+        Returns:    The value to use in the subsiquent substitution.
+        """
+        if not self.reference_type.reads_content:
+            return self.evaluate()
+        return self._evaluate(replace(self.reference_type, file_content=file_content))
+
+    def _evaluate(self, reference_type: BaseReferenceType) -> str:
+        evaluated = reference_type.evaluate(
             self.value, self.regex  # I want to pass this conditionally
         )
+        if self.naming_convention is not None:
+            evaluated = self.naming_convention.convert(str(evaluated))
+        return evaluated
 
 
 @dataclass
@@ -42,8 +71,13 @@ class FileLocation:
                 Each key is the value to sub for in the path
                 (so {"key1" : "value1", "key2" : "value2"} will provide substitutions for
                 "${key1" and "${key2}" in the path string.)
+        directory_index = The DirectoryIndex to find files with. Share one between locations
+                          so each directory is only listed once. Defaults to a new index.
+        content_wildcards = Whether substitutions that read content that isn't there (e.g. a 'Key' substitution
+                            when merging, as opposed to splitting) match any name. Set for source locations,
+                            so that one config can both merge and split. Otherwise they raise a ReferenceTypeError.
     Additional:
-        resolved_paths = A list of pathlib paths that satisfy the file search
+        resolved_paths = A sorted list of pathlib paths that satisfy the file search
     """
 
     path: str
@@ -51,25 +85,59 @@ class FileLocation:
     subs: dict = field(
         default_factory=dict
     )  # TODO I want this to be dict(Substitution) but I was getting an error that the object was not itterable.
+    directory_index: DirectoryIndex = field(default=None, compare=False, repr=False)
+    content_wildcards: bool = field(default=False, compare=False, repr=False)
 
     @cached_property
     def resolved_paths(self) -> List[Path]:
         """
         Synopsis:   Resolves all substitutions against the path string
                     then finds all local files matching this path.
-        Returns:    A list of pathlib paths that satisfy the file search
+        Returns:    A sorted list of pathlib paths that satisfy the file search
+        """
+        if self.directory_index is None:
+            self.directory_index = DirectoryIndex()
+        return self.directory_index.glob(self.root_path, self.substituted_path)
+
+    def matches(self, file_path: Path) -> bool:
         """
-        return list(self.root_path.glob(self.substituted_path))
+        Synopsis:   Determines whether a file would be found at this location, whether or not it exists yet.
+        Parameters:
+            file_path = The file to check.
+        Returns:    True if the file's path matches the substituted path.
+        """
+        try:
+            relative_path = (
+                Path(file_path).absolute().relative_to(self.root_path.absolute())
+            )
+        except ValueError:
+            return False
+        return (
+            compile_glob(self.substituted_path).match(relative_path.as_posix())
+            is not None
+        )
 
     @cached_property
     def substituted_path(self) -> str:
         """
         Synopsis: Performs a substitution on the 'path' attribute using the 'subs' attributes as substitutions.
+                  Substitutions that read content that isn't there match any name if content_wildcards is set.
         Returns: A fully substitutited path.
         """
         subbed_path = self.path
         for sub_key in self.subs:
             substitutor = self.subs[sub_key]
-            evaluated_sub = substitutor.evaluate()
+            if (
+                substitutor.reference_type.reads_content
+                and substitutor.reference_type.file_content is None
+            ):
+                if not self.content_wildcards:
+                    raise ReferenceTypeError(
+                        f"Substitution '{sub_key}' in '{self.path}' reads file content, which there is none of here."
+                        " Only source file paths can use 'Key' and 'Content' substitutions."
+                    )
+                evaluated_sub = "*"
+            else:
+                evaluated_sub = substitutor.evaluate()
             subbed_path = subbed_path.replace(f"${{{sub_key}}}", evaluated_sub)
         return subbed_path
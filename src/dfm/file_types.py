@@ -1,29 +1,457 @@
-import json
+import mmap
+import os
+import secrets
+import shutil
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from dfm.exceptions import FileTypeError
+from dfm.json_codecs import JsonCodecFactory
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import tomli_w
+except ImportError:
+    tomli_w = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
 
 
 class BaseFileType(ABC):
+    """
+    Synopsis:   A base class for the file formats content can be loaded from and saved to.
+                Every file type loads to (and saves from) the same python dicts and lists,
+                so files of different types can be merged together.
+    Parameters:
+        extensions = The file extensions the file type is chosen for, see FileTypeFactory.
+    """
+
+    WRITE_BUFFER_SIZE = 1 << 20
+    extensions = ()
+
     def __init__(self):
         pass
 
+    @classmethod
+    def is_available(cls) -> bool:
+        """
+        Synopsis:   Determines whether the libraries the file type needs are installed.
+        """
+        return True
+
     @abstractmethod
-    def load_from_file(self, file_path: Path):
+    def load_from_file(self, file_path: Path, codec: str = None):
         raise NotImplementedError("load_from_file has not been implemented yet")
 
     @abstractmethod
-    def save_to_file(self, json_object: dict or list, file_path: Path):
+    def save_to_file(
+        self,
+        json_object: dict or list,
+        file_path: Path,
+        codec: str = None,
+        compact: bool = False,
+    ):
         raise NotImplementedError("save_to_file has not been implemented yet")
 
+    @classmethod
+    def write_atomically(
+        cls, file_path: Path, blocks: Iterable[bytes], durable: bool = True
+    ):
+        """
+        Synopsis:   Streams blocks of data into a temporary file next to file_path, then renames it over file_path.
+                    If anything goes wrong part way through, file_path is left as it was.
+        Parameters:
+            file_path = The file to write.
+            blocks = The data to write, in order.
+            durable = Whether to flush the data to disk before the rename, so the file survives a crash.
+                      Files that can be recreated, such as cache entries, can skip the cost.
+        """
+        file_path = Path(file_path)
+        temp_path = file_path.with_name(f".{file_path.name}.{secrets.token_hex(4)}.tmp")
+        try:
+            with open(
+                os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666),
+                "wb",
+                buffering=cls.WRITE_BUFFER_SIZE,
+            ) as output:
+                for block in blocks:
+                    output.write(block)
+                if durable:
+                    output.flush()
+                    os.fsync(output.fileno())
+            if file_path.exists():
+                shutil.copymode(file_path, temp_path)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def sync_directory(directory: Path):
+        """
+        Synopsis:   Flushes a directory's entries to disk, so that files written into it with write_atomically
+                    survive a crash under their new names. Does nothing on Windows, where directories can't be opened.
+        Parameters:
+            directory = The directory to sync.
+        """
+        if os.name == "nt":
+            return
+        directory_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
 
 class JsonFileType(BaseFileType):
+    """
+    Synopsis:   The file type for JSON files.
+                Files are read and written in binary mode and encoded/decoded by a JSON codec,
+                see JsonCodecFactory for the codecs available. The default 'auto' codec decodes with
+                the fastest JSON library installed and encodes with the standard library.
+    """
+
+    extensions = (".json",)
+
+    @classmethod
+    def load_from_file(cls, file_path: Path, codec: str = None):
+        with open(file_path, "rb") as loadedFile:
+            data = loadedFile.read()
+        return JsonCodecFactory(codec).generate().loads(data)
+
+    @staticmethod
+    def can_stream_node(keys: Tuple[str, ...]) -> bool:
+        """
+        Synopsis:   Determines whether load_node_from_file can find a node.
+        Parameters:
+            keys = The dict keys leading from the root of the file to the node.
+        Returns:    True if ijson is installed and the keys can be written as an ijson prefix.
+        """
+        return (
+            ijson is not None
+            and len(keys) > 0
+            and all(
+                isinstance(key, str) and "." not in key and key != "item"
+                for key in keys
+            )
+        )
+
+    @classmethod
+    def load_node_from_file(cls, file_path: Path, keys: Tuple[str, ...]) -> List:
+        """
+        Synopsis:   Memory-maps a file and parses it incrementally with ijson, only building python objects
+                    for the node at keys. Everything else in the file is skipped over, so memory use
+                    scales with the size of the node rather than the file.
+                    Check can_stream_node first. Where a key is duplicated the last value wins, as with json.load.
+        Parameters:
+            file_path = The file to load.
+            keys = The dict keys leading from the root of the file to the node.
+        Returns:    A list holding the node, or an empty list if it isn't in the file.
+        """
+        with open(file_path, "rb") as loadedFile:
+            with mmap.mmap(
+                loadedFile.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped_file:
+                nodes = list(ijson.items(mapped_file, ".".join(keys), use_float=True))
+        return nodes[-1:]
+
+    @classmethod
+    def save_to_file(
+        cls,
+        json_object: dict or list,
+        file_path: Path,
+        codec: str = None,
+        compact: bool = False,
+    ):
+        """
+        Synopsis:   Streams an object to a JSON file atomically, see write_atomically.
+        Parameters:
+            json_object = The object to save.
+            file_path = The file to save to.
+            codec = The name of the JSON codec to encode with.
+            compact = Whether to leave out all whitespace rather than indenting by 4 spaces.
+        """
+        cls.write_atomically(
+            file_path,
+            JsonCodecFactory(codec)
+            .generate()
+            .iterencode(json_object, indent=None if compact else 4),
+        )
+
+
+class YamlFileType(BaseFileType):
+    """
+    Synopsis:   The file type for YAML files. Needs PyYAML.
+                Files are loaded and saved with libyaml's C loader and dumper when PyYAML was built with them,
+                which is several times faster than the pure python ones. Only plain data is loaded (as safe_load does).
+                The JSON codec is not used.
+    """
+
+    extensions = (".yaml", ".yml")
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return yaml is not None
+
+    @staticmethod
+    def _yaml():
+        if yaml is None:
+            raise FileTypeError("YAML files need PyYAML, which is not installed.")
+        return yaml
+
+    @classmethod
+    def load_from_file(cls, file_path: Path, codec: str = None):
+        yaml_module = cls._yaml()
+        with open(file_path, "rb") as loadedFile:
+            return yaml_module.load(
+                loadedFile,
+                Loader=getattr(yaml_module, "CSafeLoader", yaml_module.SafeLoader),
+            )
+
+    @classmethod
+    def save_to_file(
+        cls,
+        json_object: dict or list,
+        file_path: Path,
+        codec: str = None,
+        compact: bool = False,
+    ):
+        """
+        Synopsis:   Saves an object to a YAML file atomically, see write_atomically.
+        Parameters:
+            json_object = The object to save.
+            file_path = The file to save to.
+            codec = Unused, YAML files aren't encoded by a JSON codec.
+            compact = Whether to write the document in flow style (as JSON-like {...} and [...]) rather than block style.
+        """
+        yaml_module = cls._yaml()
+        cls.write_atomically(
+            file_path,
+            [
+                yaml_module.dump(
+                    json_object,
+                    Dumper=getattr(yaml_module, "CSafeDumper", yaml_module.SafeDumper),
+                    default_flow_style=compact,
+                    sort_keys=False,
+                    allow_unicode=True,
+                ).encode()
+            ],
+        )
+
+
+class TomlFileType(BaseFileType):
+    """
+    Synopsis:   The file type for TOML files.
+                Files are loaded with tomllib (or tomli before python 3.11) and saved with tomli_w.
+                A TOML document is always a table, so only dicts can be saved, and TOML has no null.
+                The JSON codec is not used.
+    """
+
+    extensions = (".toml",)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return tomllib is not None and tomli_w is not None
+
     @classmethod
-    def load_from_file(cls, file_path: Path):
-        with open(file_path) as loadedFile:
-            obj = json.load(loadedFile)
-        return obj
+    def load_from_file(cls, file_path: Path, codec: str = None):
+        if tomllib is None:
+            raise FileTypeError(
+                "Loading TOML files needs tomli, which is not installed."
+            )
+        with open(file_path, "rb") as loadedFile:
+            return tomllib.load(loadedFile)
 
     @classmethod
-    def save_to_file(cls, json_object: dict or list, file_path: Path):
-        with open(file_path, "w+") as output:
-            json.dump(json_object, output, indent=4)
+    def save_to_file(
+        cls,
+        json_object: dict or list,
+        file_path: Path,
+        codec: str = None,
+        compact: bool = False,
+    ):
+        """
+        Synopsis:   Saves a dict to a TOML file atomically, see write_atomically.
+        Parameters:
+            json_object = The dict to save.
+            file_path = The file to save to.
+            codec = Unused, TOML files aren't encoded by a JSON codec.
+            compact = Unused, TOML has one layout.
+        """
+        if tomli_w is None:
+            raise FileTypeError(
+                "Saving TOML files needs tomli_w, which is not installed."
+            )
+        if not isinstance(json_object, dict):
+            raise FileTypeError(
+                f"Only a dict can be saved as TOML, not a {type(json_object).__name__}."
+            )
+        cls.write_atomically(file_path, [tomli_w.dumps(json_object).encode()])
+
+
+class BaseBinaryFileType(BaseFileType):
+    """
+    Synopsis:   A base class for binary formats that hold the same data as JSON, e.g. for the intermediate files
+                of chained builds (one build's destination being the next build's source) or a build cache.
+                They are encoded and decoded in one go by a C extension, with no text to format or parse.
+                The JSON codec and compact output don't apply.
+    Parameters:
+        library_name = The name of the package the file type needs, for error messages.
+    """
+
+    library_name = None
+
+    @classmethod
+    @abstractmethod
+    def loads(cls, data: bytes) -> dict or list:
+        raise NotImplementedError()
+
+    @classmethod
+    @abstractmethod
+    def dumps(cls, json_object: dict or list) -> bytes:
+        raise NotImplementedError()
+
+    @classmethod
+    def _check_available(cls):
+        if not cls.is_available():
+            raise FileTypeError(
+                f"{cls.__name__} needs {cls.library_name}, which is not installed."
+            )
+
+    @classmethod
+    def load_from_file(cls, file_path: Path, codec: str = None):
+        cls._check_available()
+        with open(file_path, "rb") as loadedFile:
+            data = loadedFile.read()
+        return cls.loads(data)
+
+    @classmethod
+    def save_to_file(
+        cls,
+        json_object: dict or list,
+        file_path: Path,
+        codec: str = None,
+        compact: bool = False,
+    ):
+        """
+        Synopsis:   Saves an object to a binary file atomically, see write_atomically.
+        Parameters:
+            json_object = The object to save.
+            file_path = The file to save to.
+            codec = Unused, binary files aren't encoded by a JSON codec.
+            compact = Unused, binary files have no whitespace.
+        """
+        cls._check_available()
+        cls.write_atomically(file_path, [cls.dumps(json_object)])
+
+
+class MessagePackFileType(BaseBinaryFileType):
+    """
+    Synopsis:   The file type for MessagePack files. Needs msgpack.
+                Integers must fit in 64 bits.
+    """
+
+    extensions = (".msgpack", ".mpk")
+    library_name = "msgpack"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return msgpack is not None
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    @classmethod
+    def dumps(cls, json_object: dict or list) -> bytes:
+        return msgpack.packb(json_object, use_bin_type=True)
+
+
+class CborFileType(BaseBinaryFileType):
+    """
+    Synopsis:   The file type for CBOR files. Needs cbor2.
+    """
+
+    extensions = (".cbor",)
+    library_name = "cbor2"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return cbor2 is not None
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        return cbor2.loads(data)
+
+    @classmethod
+    def dumps(cls, json_object: dict or list) -> bytes:
+        return cbor2.dumps(json_object)
+
+
+@dataclass
+class FileTypeFactory:
+    """
+    Synopsis:   A factory for retrieving the file type to load or save a file with.
+    Parameters:
+        file_type_name = One of the names in FILE_TYPE_MAPPING, e.g. from a location's 'FileType' in a config.
+                         None chooses the file type by the file's extension, falling back to JSON.
+    """
+
+    file_type_name: str = None
+
+    FILE_TYPE_MAPPING = {
+        "Json": JsonFileType,
+        "Yaml": YamlFileType,
+        "Toml": TomlFileType,
+        "MessagePack": MessagePackFileType,
+        "Cbor": CborFileType,
+    }
+    EXTENSION_MAPPING = {
+        extension: file_type
+        for file_type in FILE_TYPE_MAPPING.values()
+        for extension in file_type.extensions
+    }
+
+    def generate(self, file_path: Path = None):
+        """
+        Synopsis:   Retrieves the file type.
+        Parameters:
+            file_path = The file being loaded or saved, used to choose a file type by extension.
+        Returns:    The file type class.
+        """
+        if self.file_type_name is not None:
+            if self.file_type_name not in self.FILE_TYPE_MAPPING:
+                raise FileTypeError(
+                    f"File type '{self.file_type_name}' is not one of {tuple(self.FILE_TYPE_MAPPING)}."
+                )
+            return self.FILE_TYPE_MAPPING[self.file_type_name]
+        if file_path is None:
+            return JsonFileType
+        return self.EXTENSION_MAPPING.get(Path(file_path).suffix.lower(), JsonFileType)
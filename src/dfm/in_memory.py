@@ -0,0 +1,136 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from dfm.config import BuildConfig
+from dfm.directory_index import DirectoryEntry, DirectoryIndex
+from dfm.file_loader import FileLoader
+
+# Virtual paths are relative, so every path in an in-memory build is relative to this root.
+VIRTUAL_ROOT = Path()
+
+
+def _virtual_documents(documents: dict) -> Dict[Path, object]:
+    if all(isinstance(file_path, Path) for file_path in documents):
+        return documents
+    virtual_documents = {}
+    for file_path, content in documents.items():
+        file_path = Path(file_path)
+        if file_path.anchor:
+            raise ValueError(
+                f"Virtual path '{file_path}' must be relative, e.g. 'sources/file.json'."
+            )
+        virtual_documents[file_path] = content
+    return virtual_documents
+
+
+@dataclass
+class InMemoryFileLoader(FileLoader):
+    """
+    Synopsis:   A FileLoader that 'loads' already parsed content from a mapping of virtual paths, rather than from disk.
+                Content is returned as it is, not copied, so merge with 'copy_on_write' to leave it unchanged.
+                Saving a file adds (or replaces) it in the mapping, so one in-memory build can read another's output.
+                The cache, lazy loading, workers and the file type (everything is already parsed) don't apply.
+    Parameters:
+        documents = The content of each virtual file, keyed by its relative path (a str or Path), e.g. 'sources/a.json'.
+    """
+
+    documents: Dict[Path, object] = field(default_factory=dict)
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.documents = _virtual_documents(self.documents)
+
+    def load_file(self, file_path: Path, file_type: str = None) -> dict or list:
+        try:
+            return self.documents[Path(file_path)]
+        except KeyError:
+            raise FileNotFoundError(
+                f"There is no virtual file at '{file_path}'."
+            ) from None
+
+    def extract_node_values(
+        self, file_path: Path, jsonpath_expr, file_type: str = None
+    ) -> List:
+        return jsonpath_expr.find_values(self.load_file(file_path))
+
+    def _map_concurrently(
+        self, file_paths: List[Path], jsonpath_expr, file_type: str = None
+    ) -> List[List]:
+        # Nothing is parsed, so there's nothing to gain from other threads or processes.
+        return [
+            self.extract_node_values(file_path, jsonpath_expr)
+            for file_path in file_paths
+        ]
+
+    def file_exists(self, file_path: Path) -> bool:
+        return Path(file_path) in self.documents
+
+    def save_file(
+        self,
+        content: dict or list,
+        file_path: Path,
+        file_type: str = None,
+        compact: bool = False,
+    ):
+        self.documents[Path(file_path)] = content
+
+
+@dataclass
+class InMemoryDirectoryIndex(DirectoryIndex):
+    """
+    Synopsis:   A DirectoryIndex of the virtual paths of an InMemoryFileLoader, so sources can glob over them
+                (e.g. 'sources/**/*.json') exactly as they would over files on disk.
+                Every directory is worked out from the paths at once, the first time any is listed.
+    Parameters:
+        documents = The mapping of virtual paths to content. Share the loader's, so files it saves can be found.
+    """
+
+    documents: Dict[Path, object] = field(default_factory=dict)
+    directories: Dict[Path, Dict[str, DirectoryEntry]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self.documents = _virtual_documents(self.documents)
+
+    def scan_directory(self, directory: Path) -> Dict[str, DirectoryEntry]:
+        if self.directories is None:
+            directories = {}
+            for file_path in self.documents:
+                is_dir = False
+                for parent in (file_path, *list(file_path.parents)[:-1]):
+                    directories.setdefault(parent.parent, {})[
+                        parent.name
+                    ] = DirectoryEntry(is_dir, False)
+                    is_dir = True
+            self.directories = directories
+        return self.directories.get(Path(directory), {})
+
+    def invalidate(self, directories=None):
+        # Any listing may be out of date once a file has been saved, so all are worked out again.
+        self.directories = None
+        super().invalidate()
+
+
+def load_config_in_memory(
+    config_dict: dict, documents: dict, parameters: dict = None
+) -> BuildConfig:
+    """
+    Synopsis:   Creates a build that runs entirely in memory, without reading or writing any files.
+                Paths in the config are matched against the virtual paths of documents. build returns the
+                destination's content and, unless save_to_local_file is False, adds it to the loader's documents.
+    Parameters:
+        config_dict = The config, in the format of a config file (see BuildConfig.from_dict).
+        documents = The content of each virtual file, keyed by its relative path, e.g. {'sources/a.json': {...}}.
+        parameters = The values of 'Parameter' substitutions.
+    Returns:    The BuildConfig.
+    """
+    loader = InMemoryFileLoader(documents=documents)
+    return BuildConfig.from_dict(
+        config_dict,
+        VIRTUAL_ROOT,
+        parameters,
+        loader,
+        directory_index=InMemoryDirectoryIndex(loader.documents),
+    )
@@ -0,0 +1,244 @@
+import json
+import re
+import warnings
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib import import_module
+from typing import Iterator
+
+from dfm.exceptions import JsonCodecError
+
+AUTO_CODEC = "auto"
+ENCODE_BLOCK_SIZE = 1 << 20
+
+
+class BaseJsonCodec(ABC):
+    """
+    Synopsis:   A base class for the libraries that can encode and decode JSON.
+                Codecs work on bytes so files can be read and written in binary mode.
+    """
+
+    module_name = None
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def is_available(cls) -> bool:
+        """
+        Synopsis:   Determines whether the library behind the codec is installed.
+        """
+        if cls.module_name is None:
+            return True
+        try:
+            import_module(cls.module_name)
+        except ImportError:
+            return False
+        return True
+
+    @classmethod
+    @abstractmethod
+    def loads(cls, data: bytes) -> dict or list:
+        raise NotImplementedError()
+
+    @classmethod
+    def iterencode(
+        cls, json_object: dict or list, indent: int = None
+    ) -> Iterator[bytes]:
+        """
+        Synopsis:   Encodes an object in blocks, exactly as the standard library's json.dump would.
+                    Codecs that can produce identical output override this.
+        Parameters:
+            json_object = The object to encode.
+            indent = The number of spaces to indent by, or None for compact output.
+        Returns:    An iterator of encoded blocks which, joined, make the whole document.
+        """
+        return StdlibJsonCodec.iterencode(json_object, indent)
+
+    @classmethod
+    def dumps(cls, json_object: dict or list, indent: int = None) -> bytes:
+        """
+        Synopsis:   Encodes an object in one go. See iterencode.
+        """
+        return b"".join(cls.iterencode(json_object, indent))
+
+
+class StdlibJsonCodec(BaseJsonCodec):
+    """
+    Synopsis:   The codec for python's built in json module.
+                Documents are encoded in blocks of about ENCODE_BLOCK_SIZE characters, so a document
+                never has to be held in memory as one string.
+    """
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        return json.loads(data)
+
+    @classmethod
+    def iterencode(
+        cls, json_object: dict or list, indent: int = None
+    ) -> Iterator[bytes]:
+        if indent is not None:
+            chunks = json.JSONEncoder(indent=indent).iterencode(json_object)
+        else:
+            chunks = cls._iterencode_compact(
+                json_object, json.JSONEncoder(separators=(",", ":"))
+            )
+        block = []
+        block_size = 0
+        for chunk in chunks:
+            block.append(chunk)
+            block_size += len(chunk)
+            if block_size >= ENCODE_BLOCK_SIZE:
+                yield "".join(block).encode()
+                block = []
+                block_size = 0
+        if block:
+            yield "".join(block).encode()
+
+    @classmethod
+    def _iterencode_compact(
+        cls, json_object, encoder: json.JSONEncoder, depth: int = 2
+    ) -> Iterator[str]:
+        # Indentation isn't needed, so the top levels of the document are walked here and everything below
+        # is handed to the (much faster) C encoder one value at a time.
+        if depth and type(json_object) is dict and json_object:
+            if not all(type(key) is str for key in json_object):
+                yield encoder.encode(json_object)
+                return
+            separator = "{"
+            for key, value in json_object.items():
+                yield separator + encoder.encode(key) + ":"
+                yield from cls._iterencode_compact(value, encoder, depth - 1)
+                separator = ","
+            yield "}"
+        elif depth and type(json_object) is list and json_object:
+            separator = "["
+            for value in json_object:
+                yield separator
+                yield from cls._iterencode_compact(value, encoder, depth - 1)
+                separator = ","
+            yield "]"
+        else:
+            yield encoder.encode(json_object)
+
+
+class OrjsonJsonCodec(BaseJsonCodec):
+    """
+    Synopsis:   The codec for orjson. orjson can only indent by 2 spaces
+                and does not escape non-ASCII characters, so it is only used
+                for compact or 2 space indented output.
+                Note orjson decodes integers over 64 bits as floats.
+    """
+
+    module_name = "orjson"
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        return import_module(cls.module_name).loads(data)
+
+    @classmethod
+    def iterencode(
+        cls, json_object: dict or list, indent: int = None
+    ) -> Iterator[bytes]:
+        orjson = import_module(cls.module_name)
+        if indent is None:
+            return iter([orjson.dumps(json_object)])
+        if indent == 2:
+            return iter([orjson.dumps(json_object, option=orjson.OPT_INDENT_2)])
+        return super().iterencode(json_object, indent)
+
+
+class UjsonJsonCodec(BaseJsonCodec):
+    """
+    Synopsis:   The codec for ujson. Indented output is left to the standard library.
+    """
+
+    module_name = "ujson"
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        return import_module(cls.module_name).loads(data)
+
+    @classmethod
+    def iterencode(
+        cls, json_object: dict or list, indent: int = None
+    ) -> Iterator[bytes]:
+        if indent is not None:
+            return super().iterencode(json_object, indent)
+        return iter(
+            [
+                import_module(cls.module_name)
+                .dumps(json_object, ensure_ascii=True, escape_forward_slashes=False)
+                .encode()
+            ]
+        )
+
+
+class SimdjsonJsonCodec(BaseJsonCodec):
+    """
+    Synopsis:   The codec for pysimdjson. Only decoding is accelerated.
+    """
+
+    module_name = "simdjson"
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        return import_module(cls.module_name).loads(data)
+
+
+class AutoJsonCodec(BaseJsonCodec):
+    """
+    Synopsis:   Decodes with the fastest installed library and encodes with the standard library,
+                so output files are unchanged by whichever libraries happen to be installed.
+                Documents that might hold integers over 64 bits, which the fast libraries
+                reject or round, and documents the fast library rejects (e.g. NaN) are
+                decoded by the standard library.
+    """
+
+    DECODER_PREFERENCE = (OrjsonJsonCodec, SimdjsonJsonCodec, UjsonJsonCodec)
+    LARGE_INTEGER_PATTERN = re.compile(rb"\d{19,}")
+
+    @classmethod
+    def loads(cls, data: bytes) -> dict or list:
+        if cls.LARGE_INTEGER_PATTERN.search(data):
+            return StdlibJsonCodec.loads(data)
+        for codec in cls.DECODER_PREFERENCE:
+            if codec.is_available():
+                try:
+                    return codec.loads(data)
+                except ValueError:
+                    break
+        return StdlibJsonCodec.loads(data)
+
+
+@dataclass
+class JsonCodecFactory:
+    """
+    Synopsis:   A factory for retrieving a JSON codec by name.
+    Parameters:
+        codec_name = One of the names in CODEC_MAPPING. None is treated as 'auto'.
+    """
+
+    codec_name: str = AUTO_CODEC
+
+    CODEC_MAPPING = {
+        AUTO_CODEC: AutoJsonCodec,
+        "stdlib": StdlibJsonCodec,
+        "orjson": OrjsonJsonCodec,
+        "ujson": UjsonJsonCodec,
+        "simdjson": SimdjsonJsonCodec,
+    }
+
+    def generate(self):
+        codec_name = self.codec_name if self.codec_name is not None else AUTO_CODEC
+        if codec_name not in self.CODEC_MAPPING:
+            raise JsonCodecError(
+                f"JSON codec '{codec_name}' is not one of {tuple(self.CODEC_MAPPING)}."
+            )
+        codec = self.CODEC_MAPPING[codec_name]
+        if not codec.is_available():
+            warnings.warn(
+                f"JSON codec '{codec_name}' is not installed, falling back to the standard library."
+            )
+            return StdlibJsonCodec
+        return codec
@@ -1,28 +1,112 @@
 from abc import ABC
-from copy import deepcopy
-from dataclasses import dataclass
+from copy import copy
+from dataclasses import dataclass, field
+
+from dfm.exceptions import JsonMergerError
 
 NoneType = type(None)
 
+COPY_ON_WRITE = "copy_on_write"
+IN_PLACE = "in_place"
+MERGE_MODES = (COPY_ON_WRITE, IN_PLACE)
+
 
 @dataclass
-class BaseJsonMerger(ABC):
+class MergeOwnership:
     """
-    Synopsis: A base class to merge values into an object in preparation for producing a new json object.
+    Synopsis:   Tracks which containers a merge is allowed to mutate.
+                In 'copy_on_write' mode, a list or dict that the merge did not create itself
+                (e.g. the cached destination content or a retrieved source fragment) is shallow copied
+                the first time it needs changing. Untouched subtrees are shared rather than copied.
+                In 'in_place' mode every container is mutated directly and nothing is copied,
+                until content is shared between nodes (see share_between_nodes).
+    Parameters:
+        mode = Either 'copy_on_write' or 'in_place'.
     """
 
+    mode: str = COPY_ON_WRITE
+    owned: dict = field(default_factory=dict, repr=False)
+
     def __post_init__(self):
+        if self.mode not in MERGE_MODES:
+            raise JsonMergerError(
+                f"Merge mode '{self.mode}' is not one of the supported modes {MERGE_MODES}."
+            )
+
+    def claim(self, container: list or dict) -> list or dict:
         """
-        Synopsis: Prepares a mapping so that a future JSON merger can determine which merge function to use.
+        Synopsis:   Marks a container created by the merge as safe to mutate.
+                    The container itself is held onto so its id can't be recycled during the build.
+        Returns:    The container that was claimed.
         """
-        self.TYPE_TO_MERGER_MAPPING = (
-            (list, self.merge_a_list),
-            (int, self.merge_an_int),
-            (dict, self.merge_a_dict),
-            (str, self.merge_a_str),
-            (bool, self.merge_a_bool),
-            (NoneType, self.merge_a_none),
-        )
+        if self.mode == COPY_ON_WRITE:
+            self.owned[id(container)] = container
+        return container
+
+    def writable(self, container: list or dict) -> list or dict:
+        """
+        Synopsis:   Returns a version of the container that can be mutated.
+        Returns:    The container itself if it may be mutated, otherwise a claimed shallow copy of it.
+        """
+        if self.mode == IN_PLACE or id(container) in self.owned:
+            return container
+        return self.claim(copy(container))
+
+    def share_between_nodes(self):
+        """
+        Synopsis:   Stops the merge mutating any container that exists so far. From then on the merge is
+                    copy on write (in either mode) and nothing is owned, so everything is copied before it is changed.
+                    Called around merging a source into more than one destination node (e.g. '$.*'):
+                    before, so that in 'in_place' mode the source content merged into one node isn't changed
+                    for the next, and after, as every node is written the same merged content.
+        """
+        self.mode = COPY_ON_WRITE
+        self.owned = {}
+
+
+class BaseJsonMerger(ABC):
+    """
+    Synopsis: A base class to merge values into an object in preparation for producing a new json object.
+    Parameters:
+        json_obj: The original object to merge into.
+        ownership: The MergeOwnership shared by every merger of a build. Defaults to a fresh copy-on-write one.
+    """
+
+    __slots__ = ("json_obj", "ownership")
+
+    # The merge method for each type that can be merged in. Each subclass gets its own MERGE_METHODS table,
+    # built once when the class is defined, so merge_obj is a single dict lookup.
+    MERGE_METHOD_NAMES = {
+        list: "merge_a_list",
+        int: "merge_an_int",
+        dict: "merge_a_dict",
+        str: "merge_a_str",
+        bool: "merge_a_bool",
+        NoneType: "merge_a_none",
+    }
+
+    def __init__(
+        self,
+        json_obj: list or int or dict or str or bool or NoneType,
+        ownership: MergeOwnership = None,
+    ):
+        self.json_obj = json_obj
+        self.ownership = MergeOwnership() if ownership is None else ownership
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.MERGE_METHODS = {
+            object_type: getattr(cls, method_name)
+            for object_type, method_name in cls.MERGE_METHOD_NAMES.items()
+        }
+
+    def __repr__(self):
+        return f"{type(self).__name__}(json_obj={self.json_obj!r}, ownership={self.ownership!r})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return (self.json_obj, self.ownership) == (other.json_obj, other.ownership)
 
     # These merging methods are overridden in specific typed merger JsonMerger classes where appropriate.
     # The default behaviour is to convert the value at the node into a list and append it with the value to merge in.
@@ -31,23 +115,19 @@ class BaseJsonMerger(ABC):
         self.json_obj = self.json_obj + (the_list)
 
     def merge_an_int(self, the_int: int):
-        self.json_obj = [self.json_obj]
-        self.json_obj.append(the_int)
+        self.json_obj = self.ownership.claim([self.json_obj, the_int])
 
     def merge_a_dict(self, the_dict: dict):
-        self.json_obj = [self.json_obj]
-        self.json_obj.append(the_dict)
+        self.json_obj = self.ownership.claim([self.json_obj, the_dict])
 
     def merge_a_str(self, the_str: str):
-        self.json_obj = [self.json_obj]
-        self.json_obj.append(the_str)
+        self.json_obj = self.ownership.claim([self.json_obj, the_str])
 
     def merge_a_none(self, the_none: NoneType):
         pass
 
     def merge_a_bool(self, the_bool: bool):
-        self.json_obj = [self.json_obj]
-        self.json_obj.append(the_bool)
+        self.json_obj = self.ownership.claim([self.json_obj, the_bool])
 
     def merge_obj(self, the_obj: list or int or dict or str):
         """
@@ -57,15 +137,18 @@ class BaseJsonMerger(ABC):
             the_obj: The object to merge in.
         Returns: The output of the merger function. However the merger function should change attributes of the class without returning anything.
         """
-        for object_type, merge_method in self.TYPE_TO_MERGER_MAPPING:
-            if type(the_obj) == object_type:
-                return merge_method(the_obj)
-        raise TypeError(
-            f"Json object for merging was not one of the 4 expected types (list, int, dict, str). Instead it was {str(type(the_obj))}"
-        )
+        merge_method = self.MERGE_METHODS.get(type(the_obj))
+        if merge_method is None:
+            raise TypeError(
+                f"Json object for merging was not one of the 4 expected types (list, int, dict, str). Instead it was {str(type(the_obj))}"
+            )
+        return merge_method(self, the_obj)
+
+
+# The base class isn't a subclass of itself, so its table is built here.
+BaseJsonMerger.__init_subclass__()
 
 
-@dataclass
 class ListJsonMerger(BaseJsonMerger):
     """
     Synopsis: A class for merging into a list object
@@ -73,6 +156,8 @@ class ListJsonMerger(BaseJsonMerger):
         json_obj: The original list to merge into.
     """
 
+    __slots__ = ()
+
     json_obj: list
 
     def merge_a_list(self, the_list: list):
@@ -81,6 +166,7 @@ class ListJsonMerger(BaseJsonMerger):
         Parameters:
             the_list: The list to merge in.
         """
+        self.json_obj = self.ownership.writable(self.json_obj)
         self.json_obj += the_list
 
     def merge_an_int(self, the_int: int):
@@ -89,6 +175,7 @@ class ListJsonMerger(BaseJsonMerger):
         Parameters:
             the_int: The int to merge in.
         """
+        self.json_obj = self.ownership.writable(self.json_obj)
         self.json_obj.append(the_int)
 
     def merge_a_dict(self, the_dict: dict):
@@ -97,6 +184,7 @@ class ListJsonMerger(BaseJsonMerger):
         Parameters:
             the_dict: The dict to merge in.
         """
+        self.json_obj = self.ownership.writable(self.json_obj)
         self.json_obj.append(the_dict)
 
     def merge_a_str(self, the_str: str):
@@ -105,6 +193,7 @@ class ListJsonMerger(BaseJsonMerger):
         Parameters:
             the_str: The str to merge in.
         """
+        self.json_obj = self.ownership.writable(self.json_obj)
         self.json_obj.append(the_str)
 
     def merge_a_bool(self, the_bool: bool):
@@ -113,10 +202,10 @@ class ListJsonMerger(BaseJsonMerger):
         Parameters:
             the_bool: The bool to merge in.
         """
+        self.json_obj = self.ownership.writable(self.json_obj)
         self.json_obj.append(the_bool)
 
 
-@dataclass
 class IntJsonMerger(BaseJsonMerger):
     """
     Synopsis: A class for merging into an integer.
@@ -124,6 +213,8 @@ class IntJsonMerger(BaseJsonMerger):
         json_obj: The integer to merge into.
     """
 
+    __slots__ = ()
+
     json_obj: int
 
     def merge_an_int(self, the_int: int):
@@ -135,7 +226,6 @@ class IntJsonMerger(BaseJsonMerger):
         self.json_obj += the_int
 
 
-@dataclass
 class DictJsonMerger(BaseJsonMerger):
     """
     Synopsis: A class for merging into a json dictionary
@@ -143,28 +233,49 @@ class DictJsonMerger(BaseJsonMerger):
         json_obj: The original dictionary to merge into.
     """
 
+    __slots__ = ()
+
     json_obj: dict
 
     def merge_a_dict(self, the_dict: dict):
         """
         Synopsis:   Adds the keys from the_dict to json_obj as part of a merge.
                     Clashing keys will have their values merged recursively as per the documentation
+                    Neither the_dict nor any container reachable from it is mutated.
+                    Clashing keys keep their position and new keys are added in the order of the_dict.
+                    Clashing dicts are merged with an explicit stack (one entry per dict being merged)
+                    rather than a merger per level, so documents of any depth can be merged.
+                    Keys are visited in the same depth first order as a recursive merge.
         Parameters:
             the_dict: The dict to merge in.
         """
-        for key in the_dict:
-            if key in self.json_obj:
-                clashing_json_obj_value = deepcopy(self.json_obj[key])
-                clashing_json_obj_value_merger = JsonMergerFactory(
-                    clashing_json_obj_value
-                ).generate_json_merger()
-                clashing_json_obj_value_merger.merge_obj(the_dict[key])
-                the_dict[key] = clashing_json_obj_value_merger.json_obj
-        json_obj_copy = deepcopy(self.json_obj)
-        self.json_obj = {**json_obj_copy, **the_dict}
+        if not the_dict:
+            return
+        ownership = self.ownership
+        self.json_obj = ownership.writable(self.json_obj)
+        dicts_to_merge = [(self.json_obj, iter(the_dict.items()))]
+        while dicts_to_merge:
+            json_obj, items_to_merge = dicts_to_merge[-1]
+            for key, value in items_to_merge:
+                if key not in json_obj:
+                    json_obj[key] = value
+                    continue
+                clashing_value = json_obj[key]
+                if type(clashing_value) is dict and type(value) is dict:
+                    if value:
+                        json_obj[key] = ownership.writable(clashing_value)
+                        dicts_to_merge.append((json_obj[key], iter(value.items())))
+                        break
+                    continue
+                clashing_json_obj_value_merger = generate_json_merger(
+                    clashing_value, ownership
+                )
+                clashing_json_obj_value_merger.merge_obj(value)
+                json_obj[key] = clashing_json_obj_value_merger.json_obj
+            else:
+                dicts_to_merge.pop()
 
 
-@dataclass
 class StrJsonMerger(BaseJsonMerger):
     """
     Synopsis: A class for merging into an string.
@@ -172,10 +283,11 @@ class StrJsonMerger(BaseJsonMerger):
         json_obj: The string to merge into.
     """
 
+    __slots__ = ()
+
     json_obj: str
 
 
-@dataclass
 class BoolJsonMerger(BaseJsonMerger):
     """
     Synopsis: A class for merging into a boolean.
@@ -183,10 +295,11 @@ class BoolJsonMerger(BaseJsonMerger):
         json_obj: The string to merge into.
     """
 
+    __slots__ = ()
+
     json_obj: bool
 
 
-@dataclass
 class NoneJsonMerger(BaseJsonMerger):
     """
     Synopsis: A class for merging into None.
@@ -194,6 +307,8 @@ class NoneJsonMerger(BaseJsonMerger):
         json_obj: The string to merge into. (Should be 'None')
     """
 
+    __slots__ = ()
+
     json_obj: list or int or dict or str or NoneType
 
     def merge_a_list(self, the_list: list):
@@ -237,6 +352,36 @@ class NoneJsonMerger(BaseJsonMerger):
         self.json_obj = the_bool
 
 
+MERGER_MAPPING = {
+    list: ListJsonMerger,
+    int: IntJsonMerger,
+    dict: DictJsonMerger,
+    str: StrJsonMerger,
+    bool: BoolJsonMerger,
+    NoneType: NoneJsonMerger,
+}
+
+
+def generate_json_merger(
+    json_to_merge_into: list or int or dict or str or bool or NoneType,
+    ownership: MergeOwnership = None,
+) -> BaseJsonMerger:
+    """
+    Synopsis:   Initialises the JsonMerger class for the type of the object being merged into.
+                Types are matched exactly (a bool is not merged as an int) with one dict lookup.
+    Parameters:
+        json_to_merge_into: The object to merge into.
+        ownership: The MergeOwnership shared by every merger of a build.
+    Returns: An initialised JsonMerger object of the correct type.
+    """
+    merger_class = MERGER_MAPPING.get(type(json_to_merge_into))
+    if merger_class is None:
+        raise TypeError(
+            f"Json object for merging was not one of the 5 expected types (list, int, dict, bool, str). Instead it was {str(type(json_to_merge_into))}"
+        )
+    return merger_class(json_to_merge_into, ownership)
+
+
 @dataclass
 class JsonMergerFactory:
     """
@@ -247,21 +392,29 @@ class JsonMergerFactory:
     """
 
     json_to_merge_into: list or int or dict or str or bool or NoneType
+    ownership: MergeOwnership = None
 
     def generate_json_merger(self):
-        for obj_type, type_merger in zip(
-            [list, int, dict, str, bool, NoneType],
-            [
-                ListJsonMerger,
-                IntJsonMerger,
-                DictJsonMerger,
-                StrJsonMerger,
-                BoolJsonMerger,
-                NoneJsonMerger,
-            ],
-        ):
-            if type(self.json_to_merge_into) == obj_type:
-                return type_merger(self.json_to_merge_into)
-        raise TypeError(
-            f"Json object for merging was not one of the 5 expected types (list, int, dict, bool, str). Instead it was {str(type(self.json_to_merge_into))}"
-        )
+        return generate_json_merger(self.json_to_merge_into, self.ownership)
+
+    def merge_all(
+        self, objs_to_merge: list
+    ) -> list or int or dict or str or bool or NoneType:
+        """
+        Synopsis:   Folds every object into json_to_merge_into in order, as if each was merged in turn.
+                    One merger is reused until the merged value changes type (e.g. None becoming a dict),
+                    at which point a merger for the new type is generated.
+        Parameters:
+            objs_to_merge: The objects to merge in, in merge order.
+        Returns:    The merged object.
+        """
+        json_obj = self.json_to_merge_into
+        json_merger = None
+        merger_type = None
+        for obj_to_merge in objs_to_merge:
+            if type(json_obj) is not merger_type:
+                json_merger = generate_json_merger(json_obj, self.ownership)
+                merger_type = type(json_obj)
+            json_merger.merge_obj(obj_to_merge)
+            json_obj = json_merger.json_obj
+        return json_obj
@@ -0,0 +1,304 @@
+from copy import deepcopy
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import List, Tuple
+
+from jsonpath_ng import parse
+from jsonpath_ng.jsonpath import Child, Fields, Index, Root, Slice
+
+from dfm.json_merger import COPY_ON_WRITE, IN_PLACE, MergeOwnership
+
+JSON_PATH_CACHE_SIZE = 1024
+# Steps that jsonpath_ng updates by assigning into the container the previous steps matched.
+WRITE_BACK_STEPS = (Fields, Index, Slice)
+
+
+def _datum_steps(datum) -> List[str or int]:
+    """
+    Synopsis:   Works out the field names and indexes leading from the root of a document to a jsonpath_ng match.
+    Returns:    The steps, in order, or None if the match wasn't reached through single fields and indexes.
+    """
+    steps = []
+    while datum.context is not None:
+        if isinstance(datum.path, Fields) and len(datum.path.fields) == 1:
+            steps.append(datum.path.fields[0])
+        elif isinstance(datum.path, Index) and len(datum.path.indices) == 1:
+            steps.append(datum.path.indices[0])
+        else:
+            return None
+        datum = datum.context
+    return steps[::-1]
+
+
+@dataclass(frozen=True)
+class JsonPathExpression:
+    """
+    Synopsis:   A jsonpath expression evaluated by jsonpath_ng.
+                Used for anything that isn't a simple path, e.g. filters, wildcards and recursive descent.
+    Parameters:
+        jsonpath_expr = The parsed jsonpath_ng expression.
+    """
+
+    jsonpath_expr: object
+
+    def find_values(self, data) -> List:
+        """
+        Synopsis:   Finds every value matching the expression.
+        Parameters:
+            data = The dict/list to search.
+        Returns:    A list of the matched values.
+        """
+        return [match.value for match in self.jsonpath_expr.find(data)]
+
+    def update_or_create(self, data, val, ownership: MergeOwnership = None):
+        """
+        Synopsis:   Sets every value matching the expression to val, creating missing dicts on the way.
+        Parameters:
+            data = The dict/list to update.
+            val = The value to set.
+            ownership = The MergeOwnership of the build. In 'copy_on_write' mode, jsonpath_ng (which can only
+                        update in place) is given a document where every container it could change has been
+                        made writable. Everything else stays shared with data.
+        Returns:    The updated data.
+        """
+        if self._field_steps is not None:
+            updated_data = self._update_existing_fields(
+                data, val, ownership or MergeOwnership(IN_PLACE)
+            )
+            if updated_data is not None:
+                return updated_data
+        if ownership is not None and ownership.mode == COPY_ON_WRITE:
+            data = self._writable_update_paths(data, ownership)
+        return self.jsonpath_expr.update_or_create(data, val)
+
+    @cached_property
+    def _field_steps(self) -> List[Tuple[str, ...]]:
+        """
+        Synopsis:   Lists the field names of each step of expressions made only of fields, e.g. '$.Resources.*.Tags'.
+        Returns:    The field names of each step, in order, or None if the expression has any other kind of step.
+        """
+        field_steps = []
+        jsonpath_expr = self.jsonpath_expr
+        while isinstance(jsonpath_expr, Child) and isinstance(
+            jsonpath_expr.right, Fields
+        ):
+            field_steps.append(jsonpath_expr.right.fields)
+            jsonpath_expr = jsonpath_expr.left
+        if not isinstance(jsonpath_expr, Root) or not field_steps:
+            return None
+        return field_steps[::-1]
+
+    def _update_existing_fields(self, data, val, ownership: MergeOwnership):
+        """
+        Synopsis:   Sets every match of a fields only expression to val, walking the dicts directly.
+                    jsonpath_ng follows every update with a pass over the whole document, so writing a source back
+                    to each of many matches (e.g. '$.Resources.*.Tags') would otherwise take time proportional to
+                    the number of matches times the size of the document. Only the dicts on the way to a match
+                    are made writable, the rest of the document stays shared.
+        Returns:    The updated data, or None if jsonpath_ng would have had to create a field (or raise an error),
+                    in which case it should do the update instead.
+        """
+        if isinstance(data, dict):
+            data = ownership.writable(data)
+        parents = [data]
+        for depth, fields in enumerate(self._field_steps):
+            is_last_step = depth == len(self._field_steps) - 1
+            children = []
+            for parent in parents:
+                if not isinstance(parent, dict):
+                    if is_last_step and parent is not None and "*" not in fields:
+                        return None
+                    continue
+                for field_name in tuple(parent) if "*" in fields else fields:
+                    if field_name not in parent:
+                        return None
+                    if is_last_step:
+                        parent[field_name] = val
+                    elif isinstance(parent[field_name], dict):
+                        parent[field_name] = ownership.writable(parent[field_name])
+                        children.append(parent[field_name])
+                    else:
+                        children.append(parent[field_name])
+            parents = children
+        return data
+
+    @cached_property
+    def _update_prefixes(self) -> List:
+        """
+        Synopsis:   Lists the expressions matching every container an update could assign into:
+                    the expression without its last step, without its last two steps and so on.
+        Returns:    The expressions, shortest first, or None for expressions (e.g. recursive descent or unions)
+                    that update content some other way.
+        """
+        prefixes = []
+        jsonpath_expr = self.jsonpath_expr
+        while isinstance(jsonpath_expr, Child):
+            if not isinstance(jsonpath_expr.right, WRITE_BACK_STEPS):
+                return None
+            jsonpath_expr = jsonpath_expr.left
+            prefixes.append(jsonpath_expr)
+        if not isinstance(jsonpath_expr, Root):
+            return None
+        return prefixes[-2::-1]
+
+    def _writable_update_paths(self, data, ownership: MergeOwnership):
+        """
+        Synopsis:   Copies (through ownership) just the containers on the paths to whatever an update could change,
+                    so that copy on write write-backs don't deep copy the whole document for every match.
+                    Expressions this can't be done for are deep copied, as before.
+        Returns:    data, with every container an update could change made writable.
+        """
+        if self._update_prefixes is None:
+            return deepcopy(data)
+        if isinstance(data, (dict, list)):
+            data = ownership.writable(data)
+        for prefix in self._update_prefixes:
+            for datum in prefix.find(data):
+                steps = _datum_steps(datum)
+                if steps is None:
+                    return deepcopy(data)
+                container = data
+                for step in steps:
+                    if isinstance(step, int) and not isinstance(container, list):
+                        # jsonpath_ng matches a dict as a list of one item (reported as index 0).
+                        return deepcopy(data)
+                    child = container[step]
+                    if not isinstance(child, (dict, list)):
+                        break
+                    writable_child = ownership.writable(child)
+                    if writable_child is not child:
+                        container[step] = writable_child
+                    container = writable_child
+        return data
+
+    def __str__(self):
+        return str(self.jsonpath_expr)
+
+
+@dataclass(frozen=True)
+class SimpleJsonPath:
+    """
+    Synopsis:   A jsonpath made only of single field names and single indexes, e.g. '$', '$.Resources' or '$.a.b[0]'.
+                These are walked directly over the dicts and lists rather than through jsonpath_ng,
+                which avoids wrapping every step in a DatumInContext and, for updates,
+                rescanning the whole document afterwards. Results match jsonpath_ng.
+    Parameters:
+        steps = The field names (str) and indexes (int) to walk from the root, in order.
+        jsonpath_expr = The parsed jsonpath_ng expression the steps came from.
+    """
+
+    steps: Tuple[str or int, ...]
+    jsonpath_expr: object = field(default=None, compare=False, repr=False)
+
+    @staticmethod
+    def from_jsonpath_expr(jsonpath_expr):
+        """
+        Synopsis:   Converts a parsed jsonpath_ng expression to a SimpleJsonPath, if it is simple.
+        Parameters:
+            jsonpath_expr = The parsed jsonpath_ng expression.
+        Returns:    The SimpleJsonPath, or None if the expression needs jsonpath_ng to evaluate it.
+        """
+        steps = []
+        original_jsonpath_expr = jsonpath_expr
+        while isinstance(jsonpath_expr, Child):
+            step = jsonpath_expr.right
+            if (
+                isinstance(step, Fields)
+                and len(step.fields) == 1
+                and step.fields[0] != "*"
+            ):
+                steps.append(step.fields[0])
+            elif isinstance(step, Index) and len(step.indices) == 1:
+                steps.append(step.indices[0])
+            else:
+                return None
+            jsonpath_expr = jsonpath_expr.left
+        if not isinstance(jsonpath_expr, Root):
+            return None
+        return SimpleJsonPath(tuple(reversed(steps)), original_jsonpath_expr)
+
+    def find_values(self, data) -> List:
+        """
+        Synopsis:   Finds the value at the path.
+        Parameters:
+            data = The dict/list to search.
+        Returns:    A list holding the value, or an empty list if the path doesn't exist.
+        """
+        for step in self.steps:
+            if isinstance(step, int):
+                if isinstance(data, dict) or not (
+                    data and -len(data) <= step < len(data)
+                ):
+                    return []
+            elif not isinstance(data, dict) or step not in data:
+                return []
+            data = data[step]
+        return [data]
+
+    def update_or_create(self, data, val, ownership: MergeOwnership = None):
+        """
+        Synopsis:   Sets the value at the path to val, creating missing dicts on the way.
+        Parameters:
+            data = The dict/list to update.
+            val = The value to set.
+            ownership = The MergeOwnership of the build. Every dict on the way to the path is made writable
+                        through it, so in 'copy_on_write' mode content that was loaded is never mutated.
+        Returns:    The updated data.
+        """
+        if not self.steps:
+            return val
+        if any(isinstance(step, int) for step in self.steps):
+            # Creating list items has subtle padding rules, leave those to jsonpath_ng.
+            return JsonPathExpression(self.jsonpath_expr).update_or_create(
+                data, val, ownership
+            )
+        if ownership is None:
+            ownership = MergeOwnership(IN_PLACE)
+        if isinstance(data, dict):
+            data = ownership.writable(data)
+        parent = data
+        for step in self.steps[:-1]:
+            if not isinstance(parent, dict):
+                return data
+            if step not in parent:
+                parent[step] = ownership.claim({})
+            elif isinstance(parent[step], dict):
+                parent[step] = ownership.writable(parent[step])
+            parent = parent[step]
+        if parent is None:
+            return data
+        if not isinstance(parent, dict):
+            raise TypeError(
+                f"Cannot set '{self.steps[-1]}' on a {type(parent).__name__}."
+            )
+        parent[self.steps[-1]] = val
+        return data
+
+    def __str__(self):
+        return str(self.jsonpath_expr)
+
+
+@lru_cache(maxsize=JSON_PATH_CACHE_SIZE)
+def compile_json_path(json_path: str):
+    """
+    Synopsis:   Parses a jsonpath string into an expression that can be used to find and update content.
+                Simple paths become a SimpleJsonPath, everything else a JsonPathExpression.
+                Parsing is slow so expressions are kept in a process-wide LRU cache of JSON_PATH_CACHE_SIZE
+                entries. Every module in dfm should parse jsonpaths through this function.
+    Parameters:
+        json_path = The jsonpath string to parse.
+    Returns:    The parsed jsonpath expression.
+    """
+    jsonpath_expr = parse(json_path)
+    simple_json_path = SimpleJsonPath.from_jsonpath_expr(jsonpath_expr)
+    if simple_json_path is not None:
+        return simple_json_path
+    return JsonPathExpression(jsonpath_expr)
+
+
+def json_path_cache_info():
+    """
+    Synopsis:   Reports how well the jsonpath cache is doing.
+    Returns:    A named tuple of hits, misses, maxsize and currsize.
+    """
+    return compile_json_path.cache_info()
@@ -1,7 +1,7 @@
 import re
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List
 
 from dfm.exceptions import NamingConventionError
 
@@ -12,9 +12,15 @@ class BaseNamingConvention(ABC):
     Synopsis:   The base naming convention class
     Parameters:
         regex = the rstring to use as part of a conversion (if applicable)
+        compiled_regex = regex, compiled once for each naming convention class when the class is defined
     """
 
     regex = None
+    compiled_regex = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compiled_regex = None if cls.regex is None else re.compile(cls.regex)
 
     def convert_to_list(self, string_to_convert: str) -> List[str]:
         """
@@ -23,7 +29,7 @@ class BaseNamingConvention(ABC):
             string_to_convert = string to query against
         Returns:    A list of all the regex matches in lowercase form
         """
-        strings_found = re.findall(self.regex, string_to_convert)
+        strings_found = self.compiled_regex.findall(string_to_convert)
         if not strings_found:
             raise NamingConventionError(
                 f"{string_to_convert} is not of the expected naming convention."
@@ -74,7 +80,7 @@ class SnakeCase(BaseNamingConvention):
             string_to_convert = string to query against
         Returns:    A list of all the regex matches in lowercase form
         """
-        strings_found = re.findall(self.regex, string_to_convert)
+        strings_found = self.compiled_regex.findall(string_to_convert)
         if not strings_found:
             raise NamingConventionError(
                 f"{string_to_convert} is not of the expected naming convention."
@@ -99,6 +105,26 @@ class SnakeCase(BaseNamingConvention):
         return "_".join(list_to_convert)
 
 
+@dataclass
+class KebabCase(SnakeCase):
+    """
+    Synopsis:   The naming convention class for kebab case
+    Parameters:
+        regex = the rstring to use as part of a conversion.
+    """
+
+    regex = r"(?=(?<=^)|(?<=-))[^A-Z\s]*?(?=-|$)"
+
+    def convert_from_list(self, list_to_convert: List[str]) -> str:
+        """
+        Synopsis:   Converts a lowercase list of strings to a single kebab case string
+        Parameters:
+            list_to_convert = a lowercased list of strings
+        Returns:    A single string of kebab case naming convention
+        """
+        return "-".join(list_to_convert)
+
+
 @dataclass
 class CamelCase(BaseNamingConvention):
     """
@@ -172,6 +198,7 @@ class ConversionStringParser:
     SUPPORTED_CONVENTIONS = {
         "Pascal": PascalCase,
         "Snake": SnakeCase,
+        "Kebab": KebabCase,
         "Camel": CamelCase,
         "Upper": UpperCase,
         "Lower": LowerCase,
@@ -213,10 +240,14 @@ class StringConverter:
     Parameters:
         from_convention = The NamingConvention object for converting from
         to_convention = The NamingConvention object for converting to
+        converted = Every string converted so far, mapped to its conversion, so repeated strings are only converted once
     """
 
     from_convention: BaseNamingConvention  # TODO should I be useing the base here as the type? I want to be able to use one from a whole group?
     to_convention: BaseNamingConvention
+    converted: Dict[str, str] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     def convert(self, string_to_convert: str) -> str:
         """
@@ -225,6 +256,35 @@ class StringConverter:
             string_to_convert = the string to convert
         Returns:    The converted string
         """
-        return self.to_convention.convert_from_list(
-            self.from_convention.convert_to_list(string_to_convert)
-        )
+        converted_string = self.converted.get(string_to_convert)
+        if converted_string is None:
+            converted_string = self.to_convention.convert_from_list(
+                self.from_convention.convert_to_list(string_to_convert)
+            )
+            self.converted[string_to_convert] = converted_string
+        return converted_string
+
+    def convert_many(self, strings_to_convert: List[str]) -> List[str]:
+        """
+        Synopsis:   Converts many strings (e.g. every key of a document) from one naming convention to another.
+                    Each distinct string is only converted once, however often it repeats.
+        Parameters:
+            strings_to_convert = the strings to convert
+        Returns:    The converted strings, in the same order
+        """
+        converted = self.converted
+        for string_to_convert in dict.fromkeys(strings_to_convert):
+            if string_to_convert not in converted:
+                converted[string_to_convert] = self.to_convention.convert_from_list(
+                    self.from_convention.convert_to_list(string_to_convert)
+                )
+        return [
+            converted[string_to_convert] for string_to_convert in strings_to_convert
+        ]
+
+    @staticmethod
+    def parse_from_sub_dict(sub_dict: dict):
+        if "NamingConvention" not in sub_dict:
+            return None
+        conversion = ConversionStringParser(sub_dict["NamingConvention"])
+        return StringConverter(conversion.from_convention(), conversion.to_convention())
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List
+
+from dfm.json_merger import JsonMergerFactory, MergeOwnership
+
+
+def merge_chunk(objs_to_merge: List) -> list or int or dict or str or bool or None:
+    """
+    Synopsis:   Folds a chunk of objects together in order.
+                Kept at module level so that it can be sent to a process pool.
+    Parameters:
+        objs_to_merge = The objects to merge, in merge order.
+    Returns:    The partial result of merging the chunk.
+    """
+    return JsonMergerFactory(None, MergeOwnership()).merge_all(objs_to_merge)
+
+
+def is_tree_reducible(objs_to_merge: List) -> bool:
+    """
+    Synopsis:   Determines whether merging objects pairwise gives the same result as merging them in order.
+                This holds when, at every path where more than one object has a value, the values that
+                aren't None are all dicts (checked key by key), all lists or all ints.
+                Anything else, such as two strings becoming a list, depends on the order of the merges.
+    Parameters:
+        objs_to_merge = The objects to merge, in merge order.
+    Returns:    True if the objects can be merged as a tree reduction.
+    """
+    values_to_check = [objs_to_merge]
+    while values_to_check:
+        values = [value for value in values_to_check.pop() if value is not None]
+        if len(values) < 2:
+            continue
+        value_types = {type(value) for value in values}
+        if len(value_types) != 1:
+            return False
+        value_type = value_types.pop()
+        if value_type == dict:
+            values_by_key = {}
+            for value in values:
+                for key, nested_value in value.items():
+                    values_by_key.setdefault(key, []).append(nested_value)
+            values_to_check.extend(values_by_key.values())
+        elif value_type not in (list, int):
+            return False
+    return True
+
+
+@dataclass
+class TreeReductionMerger:
+    """
+    Synopsis:   A class for merging many objects using a process pool.
+                The objects are split into one chunk per worker, each chunk is merged in its own process
+                and the partial results are then combined pairwise, keeping their original order.
+                Merges whose result depends on merge order are done serially instead.
+                The process pool is started the first time it is needed and reused by every later merge,
+                so use the merger as a context manager (or call close) to shut the pool down once a build is done.
+    Parameters:
+        workers = The number of processes to merge with. 1 always merges serially.
+        ownership = The MergeOwnership used when merging into the destination.
+    """
+
+    workers: int = 1
+    ownership: MergeOwnership = None
+    executor: ProcessPoolExecutor = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        if self.workers < 1:
+            raise ValueError(
+                f"A merge needs at least 1 worker, {self.workers} were requested."
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Synopsis:   Shuts down the process pool, if one was started.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def merge_all(
+        self, json_to_merge_into, objs_to_merge: List
+    ) -> list or int or dict or str or bool or None:
+        """
+        Synopsis:   Merges every object into json_to_merge_into, as JsonMergerFactory.merge_all would.
+        Parameters:
+            json_to_merge_into = The object to merge into.
+            objs_to_merge = The objects to merge in, in merge order.
+        Returns:    The merged object.
+        """
+        if (
+            self.workers == 1
+            or len(objs_to_merge) < 2 * self.workers
+            or not is_tree_reducible([json_to_merge_into, *objs_to_merge])
+        ):
+            return JsonMergerFactory(json_to_merge_into, self.ownership).merge_all(
+                objs_to_merge
+            )
+
+        chunk_size = -(-len(objs_to_merge) // self.workers)
+        chunks = [
+            objs_to_merge[i : i + chunk_size]
+            for i in range(0, len(objs_to_merge), chunk_size)
+        ]
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        partial_results = list(self.executor.map(merge_chunk, chunks))
+
+        while len(partial_results) > 1:
+            partial_results = [
+                merge_chunk(partial_results[i : i + 2])
+                for i in range(0, len(partial_results), 2)
+            ]
+        return JsonMergerFactory(json_to_merge_into, self.ownership).merge_all(
+            partial_results
+        )
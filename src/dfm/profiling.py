@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import cached_property, wraps
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from dfm.config import BuildConfig, SourceFile
+from dfm.file_location import FileLocation
+from dfm.file_types import BaseBinaryFileType, JsonFileType, TomlFileType, YamlFileType
+from dfm.json_merger import BaseJsonMerger
+from dfm.json_path import JsonPathExpression, SimpleJsonPath
+
+TEXT_FORMAT = "text"
+JSON_FORMAT = "json"
+CHROME_FORMAT = "chrome"
+PROFILE_FORMATS = (TEXT_FORMAT, JSON_FORMAT, CHROME_FORMAT)
+
+
+def _file_size(file_path: Path) -> int:
+    try:
+        return os.stat(file_path).st_size
+    except OSError:
+        return None
+
+
+def _describe_source(src: SourceFile, *_) -> Tuple[str, int]:
+    return (
+        f"{src.location.substituted_path} {src.node}",
+        sum(
+            _file_size(resolved_path) or 0
+            for resolved_path in src.location.resolved_paths
+        ),
+    )
+
+
+# Each hook is the class and attribute to time, the stage it is reported under and a function that,
+# given the call's arguments, returns a label and the number of bytes involved (or None).
+HOOKS = (
+    (
+        FileLocation,
+        "resolved_paths",
+        "glob",
+        lambda location: (location.substituted_path, None),
+    ),
+    (
+        JsonFileType,
+        "load_from_file",
+        "load",
+        lambda file_path, *_: (str(file_path), _file_size(file_path)),
+    ),
+    (
+        JsonFileType,
+        "load_node_from_file",
+        "load",
+        lambda file_path, *_: (str(file_path), _file_size(file_path)),
+    ),
+    (SourceFile, "retrieved_src_content", "source", _describe_source),
+    (
+        BaseJsonMerger,
+        "merge_obj",
+        "merge",
+        lambda merger, *_: (type(merger).__name__, None),
+    ),
+    (SimpleJsonPath, "find_values", "find", lambda path, *_: (str(path), None)),
+    (JsonPathExpression, "find_values", "find", lambda path, *_: (str(path), None)),
+    (
+        SimpleJsonPath,
+        "update_or_create",
+        "update_or_create",
+        lambda path, *_: (str(path), None),
+    ),
+    (
+        JsonPathExpression,
+        "update_or_create",
+        "update_or_create",
+        lambda path, *_: (str(path), None),
+    ),
+    (
+        BuildConfig,
+        "write_content",
+        "write",
+        lambda build_config, *_: (
+            str(build_config.destination_path),
+            _file_size(build_config.destination_path),
+        ),
+    ),
+    *(
+        (
+            file_type,
+            "load_from_file",
+            "load",
+            lambda file_path, *_: (str(file_path), _file_size(file_path)),
+        )
+        for file_type in (YamlFileType, TomlFileType, BaseBinaryFileType)
+    ),
+)
+
+# Held while a profiler is running, as the hooks it installs are shared by the whole process.
+_RUNNING = threading.Lock()
+
+
+@dataclass
+class ProfileEvent:
+    """
+    Synopsis:   One timed call.
+    Parameters:
+        stage = The stage of the build the call belongs to, e.g. 'load'.
+        label = What the call worked on, e.g. the file loaded.
+        start = When the call started, in seconds since profiling started.
+        duration = How long the call took, in seconds.
+        size = The number of bytes read or written, if known.
+        thread_id = The thread the call was made on.
+        nested = Whether the call was made from within another call of the same stage,
+                 in which case its time is already counted by that call.
+    """
+
+    stage: str
+    label: str
+    start: float
+    duration: float
+    size: int
+    thread_id: int
+    nested: bool
+
+
+@dataclass
+class Profiler:
+    """
+    Synopsis:   Times each stage of a build: globbing, loading files, retrieving source content, merging,
+                evaluating jsonpaths and writing the destination.
+                While a profiler is running (as a context manager) the methods in HOOKS are wrapped to time each call.
+                The wrappers are only installed while profiling, so a build that isn't profiled runs exactly
+                the same code as it would without this module.
+                Calls made in other processes (the 'process' executor, or merge_workers > 1) aren't timed.
+                build_async loads each file separately rather than each source's content at once,
+                so its loads are timed but there are no per-source totals.
+                As the hooks are installed on the classes, every call in the process is timed, on any thread.
+                So only one profiler can run at a time (starting another raises a RuntimeError), and builds
+                running alongside the one being profiled (e.g. other threads, or other build_async tasks)
+                are timed along with it.
+    """
+
+    events: List[ProfileEvent] = field(default_factory=list, init=False, repr=False)
+    _originals: list = field(default_factory=list, init=False, repr=False)
+    _started: float = field(default=None, init=False, repr=False)
+    _active_stages: threading.local = field(
+        default_factory=threading.local, init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def __enter__(self):
+        if not _RUNNING.acquire(blocking=False):
+            raise RuntimeError(
+                "A profiler is already running. Only one can run at a time."
+            )
+        self._started = time.perf_counter()
+        for owner, attribute_name, stage, describe in HOOKS:
+            original = owner.__dict__[attribute_name]
+            self._originals.append((owner, attribute_name, original))
+            setattr(owner, attribute_name, self._instrument(original, stage, describe))
+            if isinstance(original, cached_property):
+                getattr(owner, attribute_name).__set_name__(owner, attribute_name)
+        return self
+
+    def __exit__(self, *_):
+        for owner, attribute_name, original in reversed(self._originals):
+            setattr(owner, attribute_name, original)
+        self._originals = []
+        _RUNNING.release()
+
+    def _instrument(self, original, stage: str, describe: Callable):
+        if isinstance(original, classmethod):
+            return classmethod(self._timed(original.__func__, stage, describe, True))
+        if isinstance(original, cached_property):
+            return cached_property(self._timed(original.func, stage, describe))
+        return self._timed(original, stage, describe)
+
+    def _timed(
+        self, function: Callable, stage: str, describe: Callable, skip_cls=False
+    ):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            active_stages = self._active_stages.__dict__.setdefault("stages", [])
+            nested = stage in active_stages
+            active_stages.append(stage)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - started
+                active_stages.pop()
+                label, size = describe(*(args[1:] if skip_cls else args))
+                self.record(
+                    ProfileEvent(
+                        stage,
+                        label,
+                        started - self._started,
+                        duration,
+                        size,
+                        threading.get_ident(),
+                        nested,
+                    )
+                )
+
+        return timed
+
+    def record(self, event: ProfileEvent):
+        with self._lock:
+            self.events.append(event)
+
+    def stage_totals(self) -> Dict[str, dict]:
+        """
+        Synopsis:   Totals the calls, time and bytes of each stage. Nested calls are counted but not timed twice.
+        """
+        totals = {}
+        for event in self.events:
+            stage_total = totals.setdefault(
+                event.stage, {"Calls": 0, "Seconds": 0.0, "Bytes": 0}
+            )
+            stage_total["Calls"] += 1
+            if not event.nested:
+                stage_total["Seconds"] += event.duration
+                stage_total["Bytes"] += event.size or 0
+        return totals
+
+    def source_totals(self) -> Dict[str, dict]:
+        """
+        Synopsis:   Totals the time and bytes of retrieving each source's content.
+        """
+        totals = {}
+        for event in self.events:
+            if event.stage == "source":
+                source_total = totals.setdefault(
+                    event.label, {"Seconds": 0.0, "Bytes": 0}
+                )
+                source_total["Seconds"] += event.duration
+                source_total["Bytes"] += event.size or 0
+        return totals
+
+    def to_dict(self) -> dict:
+        return {"Stages": self.stage_totals(), "Sources": self.source_totals()}
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Synopsis:   Converts every event to Chrome's trace event format, for chrome://tracing or Perfetto.
+        """
+        return {
+            "traceEvents": [
+                {
+                    "name": event.label,
+                    "cat": event.stage,
+                    "ph": "X",
+                    "ts": event.start * 1e6,
+                    "dur": event.duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": event.thread_id,
+                    "args": {"Bytes": event.size} if event.size is not None else {},
+                }
+                for event in self.events
+            ]
+        }
+
+    def format_text(self) -> str:
+        """
+        Synopsis:   Formats the stage and source totals as tables.
+        """
+        lines = [f"{'Stage':<20}{'Calls':>10}{'Time (ms)':>12}{'Bytes':>14}"]
+        for stage, stage_total in self.stage_totals().items():
+            lines.append(
+                f"{stage:<20}{stage_total['Calls']:>10}"
+                f"{stage_total['Seconds'] * 1000:>12.2f}{stage_total['Bytes']:>14}"
+            )
+        source_totals = self.source_totals()
+        if source_totals:
+            source_width = max(len("Source"), *map(len, source_totals)) + 2
+            lines.append("")
+            lines.append(f"{'Source':<{source_width}}{'Time (ms)':>12}{'Bytes':>14}")
+            for source, source_total in source_totals.items():
+                lines.append(
+                    f"{source:<{source_width}}"
+                    f"{source_total['Seconds'] * 1000:>12.2f}{source_total['Bytes']:>14}"
+                )
+        return "\n".join(lines)
+
+    def report(self, profile_format: str = TEXT_FORMAT, output_path: Path = None):
+        """
+        Synopsis:   Writes the profile out.
+        Parameters:
+            profile_format = 'text' for tables, 'json' for the totals as JSON or 'chrome' for a trace of every call.
+            output_path = The file to write to. None prints to stdout.
+        """
+        if profile_format not in PROFILE_FORMATS:
+            raise ValueError(
+                f"Profile format '{profile_format}' is not one of {PROFILE_FORMATS}."
+            )
+        if profile_format == TEXT_FORMAT:
+            report = self.format_text()
+            if output_path is None:
+                print(report)
+            else:
+                Path(output_path).write_text(report + "\n")
+            return
+        report = (
+            self.to_dict() if profile_format == JSON_FORMAT else self.to_chrome_trace()
+        )
+        if output_path is None:
+            print(json.dumps(report, indent=4))
+        else:
+            JsonFileType.save_to_file(report, output_path)
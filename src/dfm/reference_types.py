@@ -1,9 +1,8 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 
-from jsonpath_ng import parse
-
 from dfm.exceptions import ReferenceTypeError
+from dfm.json_path import compile_json_path
 from dfm.regex import RegexExtractor
 
 
@@ -11,11 +10,15 @@ from dfm.regex import RegexExtractor
 class BaseReferenceType(ABC):
     """
     Synopsis:   A base class for all reference types to inherit
+    Parameters:
+        reads_content = whether the reference type reads its value from file_content.
     """
 
     parameters: dict = field(default_factory=dict)
     file_content: dict or list = None
 
+    reads_content = False
+
     @abstractmethod
     def evaluate(self, value: str, **kwargs) -> str:
         raise NotImplementedError()
@@ -52,6 +55,8 @@ class ContentReferenceType(BaseReferenceType):
         file_content = dictionary/list form of a json file
     """
 
+    reads_content = True
+
     def evaluate(self, value: str, regex: RegexExtractor = None) -> str:
         """
         Synopsis:   Retrieves desired string (or int cast as string) from a dict/list using jsonpath.
@@ -61,10 +66,8 @@ class ContentReferenceType(BaseReferenceType):
             regex = The regex object to use for further filtering
         Returns:    The aquired (and possibly filtered) string/int from an original dict/list
         """
-        jsonpath_expr = parse(value)
-        jsonpath_matches = [
-            match.value for match in jsonpath_expr.find(self.file_content)
-        ]
+        jsonpath_expr = compile_json_path(value)
+        jsonpath_matches = jsonpath_expr.find_values(self.file_content)
         if len(jsonpath_matches) != 1:
             raise ReferenceTypeError(
                 f"Content reference type returned {len(jsonpath_matches)} matches instead of the required 1."
@@ -89,6 +92,8 @@ class KeyReferenceType(BaseReferenceType):
         file_content = dictionary/list form of a json file
     """
 
+    reads_content = True
+
     def evaluate(self, value: str, regex: RegexExtractor = None) -> str:
         """
         Synopsis:   Retrieves desired key's name from a dict/list using jsonpath.
@@ -100,10 +105,8 @@ class KeyReferenceType(BaseReferenceType):
             regex = The regex object to use for further filtering
         Returns:    The aquired (and possibly filtered) key's name from an original dict/list
         """
-        jsonpath_expr = parse(value)
-        jsonpath_matches = [
-            match.value for match in jsonpath_expr.find(self.file_content)
-        ]
+        jsonpath_expr = compile_json_path(value)
+        jsonpath_matches = jsonpath_expr.find_values(self.file_content)
         if len(jsonpath_matches) != 1:
             raise ReferenceTypeError(
                 f"Key reference type returned {len(jsonpath_matches)} matches instead of the required 1."
@@ -1,5 +1,5 @@
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -9,10 +9,15 @@ class RegexExtractor:
     Parameters:
         expression =    a regex expression
         capture_group = the intended capture group as an integer or named string to retrieve as the intended substring
+        pattern =       the compiled expression. Compiled once, when the extractor is created.
     """
 
     expression: str
     capture_group: str or int
+    pattern: re.Pattern = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.pattern = re.compile(self.expression)
 
     def resolve(self, string_input: str) -> str:
         """
@@ -21,8 +26,7 @@ class RegexExtractor:
             string_input =  The string to query against via regex
         Returns:    the string found in the desired capture group after running the regex query
         """
-        pattern = re.compile(self.expression)
-        match = pattern.match(string_input)
+        match = self.pattern.match(string_input)
         if not match:
             raise Exception("No match was found in regex.")
         else:
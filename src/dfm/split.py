@@ -0,0 +1,176 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List
+
+from dfm.config import BuildConfig, SourceFile
+from dfm.directory_index import is_wildcard
+from dfm.exceptions import SplitError
+from dfm.file_types import BaseFileType, FileTypeFactory
+from dfm.json_merger import COPY_ON_WRITE, JsonMergerFactory, MergeOwnership
+from dfm.json_path import SimpleJsonPath, compile_json_path
+
+
+@dataclass
+class SplitBuild:
+    """
+    Synopsis:   A class for splitting a file back into the files it would be merged from, i.e. the reverse of a build.
+                The config is the same as for merging. The build's destination file is read (once) and each source file
+                entry gets the content at its DestinationFileNode, placed at its SourceFileNode:
+                - Entries whose path has 'Key' or 'Content' substitutions are split into one item per key
+                  (or list item) of that content. The substitutions are evaluated against each item to
+                  work out the file it is written to, e.g. 'resources/${Name}.json' with a 'Key' substitution.
+                  Items that end up at the same path are merged into one file.
+                  Each value substituted from content must be a plain file name, so no item is written
+                  outside the root path or into a directory of its own making.
+                - Any other entry gets all of the content, written to its (substituted) path.
+                Content that an entry with a deeper DestinationFileNode splits out is left out (as an empty dict or list)
+                of entries above it, so that e.g. a template's resources are not also written into the template.
+                Directories are created once each, up front, then the files are written (and each synced to disk)
+                in parallel. Once every file is written, each directory is synced once.
+    Parameters:
+        build_config = The build to reverse. Usually loaded with BuildConfig.load_config_from_file.
+        workers = The most files to write at once.
+    Attributes:
+        file_types = The name of the file type (from 'FileType' in the config) each file is written as, if given.
+                     Otherwise each file's type is chosen by its extension, so a split can write e.g. YAML files.
+    """
+
+    build_config: BuildConfig
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    file_types: Dict[Path, str] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.workers < 1:
+            raise ValueError(
+                f"A split needs at least 1 worker, {self.workers} were requested."
+            )
+
+    @cached_property
+    def document(self) -> dict or list:
+        """
+        Synopsis:   The content of the file being split, i.e. the build's destination file.
+        """
+        if not self.build_config.destination_path.exists():
+            raise SplitError(
+                f"There is no file to split at {self.build_config.destination_path}."
+            )
+        return self.build_config.destination_file.content
+
+    def _content_for(self, src: SourceFile) -> List:
+        jsonpath_expr = compile_json_path(src.destination_node)
+        document = self.document
+        if isinstance(jsonpath_expr, SimpleJsonPath):
+            ownership = MergeOwnership(COPY_ON_WRITE)
+            for other_src in self.build_config.source_files:
+                other_jsonpath_expr = compile_json_path(other_src.destination_node)
+                if (
+                    isinstance(other_jsonpath_expr, SimpleJsonPath)
+                    and len(other_jsonpath_expr.steps) > len(jsonpath_expr.steps)
+                    and other_jsonpath_expr.steps[: len(jsonpath_expr.steps)]
+                    == jsonpath_expr.steps
+                    and self._splits_items(other_src)
+                ):
+                    for value in other_jsonpath_expr.find_values(document):
+                        if isinstance(value, (dict, list)):
+                            document = other_jsonpath_expr.update_or_create(
+                                document, type(value)(), ownership
+                            )
+        return jsonpath_expr.find_values(document)
+
+    @staticmethod
+    def _splits_items(src: SourceFile) -> bool:
+        return any(
+            substitution.reference_type.reads_content
+            for substitution in src.location.subs.values()
+        )
+
+    def _item_path(self, src: SourceFile, item) -> str:
+        item_path = src.location.path
+        for sub_key, substitution in src.location.subs.items():
+            value = str(substitution.evaluate_with_content(item))
+            if substitution.reference_type.reads_content and (
+                value in ("", ".", "..")
+                or any(separator in value for separator in ("/", "\\"))
+            ):
+                raise SplitError(
+                    f"Can't split into a file named by '{value}' at '${{{sub_key}}}' "
+                    "as it isn't a plain file name."
+                )
+            item_path = item_path.replace(f"${{{sub_key}}}", value)
+        if is_wildcard(item_path):
+            raise SplitError(
+                f"Can't split into '{item_path}' as it is a glob. "
+                "Use 'Key' or 'Content' substitutions to name each file instead."
+            )
+        return item_path
+
+    @cached_property
+    def files(self) -> Dict[Path, dict or list]:
+        """
+        Synopsis:   Works out the content of every file the split writes.
+        Returns:    A mapping of each file's path to its content, in the order the content appears in the config.
+        """
+        fragments_by_path = {}
+        for src in self.build_config.source_files:
+            for content in self._content_for(src):
+                if not self._splits_items(src):
+                    items = [content]
+                elif isinstance(content, dict):
+                    items = [{key: value} for key, value in content.items()]
+                elif isinstance(content, list):
+                    items = content
+                else:
+                    raise SplitError(
+                        f"Can't split the {type(content).__name__} at '{src.destination_node}' into items."
+                    )
+                node_expr = compile_json_path(src.node)
+                for item in items:
+                    file_path = self.build_config.root_path / self._item_path(src, item)
+                    fragments_by_path.setdefault(file_path, []).append(
+                        node_expr.update_or_create({}, item)
+                    )
+                    self.file_types[file_path] = src.file_type
+        return {
+            file_path: fragments[0]
+            if len(fragments) == 1
+            else JsonMergerFactory(None, MergeOwnership(COPY_ON_WRITE)).merge_all(
+                fragments
+            )
+            for file_path, fragments in fragments_by_path.items()
+        }
+
+    def _write_files(self, file_paths: List[Path]):
+        for file_path in file_paths:
+            FileTypeFactory(self.file_types[file_path]).generate(
+                file_path
+            ).save_to_file(
+                self.files[file_path],
+                file_path,
+                self.build_config.loader.codec,
+                self.build_config.compact_output,
+            )
+
+    def run(self) -> List[Path]:
+        """
+        Synopsis:   Splits the file, writing every file worked out in files.
+        Returns:    The paths of the files written.
+        """
+        file_paths = list(self.files)
+        directories = sorted({file_path.parent for file_path in file_paths})
+        for directory in directories:
+            directory.mkdir(parents=True, exist_ok=True)
+        # Each worker writes its share of the files in one go, rather than each file being its own task.
+        # A directory is only synced after every file renamed into it, so once rather than once per file.
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(
+                executor.map(
+                    self._write_files,
+                    [file_paths[i :: self.workers] for i in range(self.workers)],
+                )
+            )
+            list(executor.map(BaseFileType.sync_directory, directories))
+        self.build_config.directory_index.invalidate(directories)
+        return file_paths
@@ -0,0 +1,417 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+from dfm.build_cache import MemoryCache
+from dfm.config import BuildConfig
+from dfm.directory_index import is_wildcard
+from dfm.json_merger import COPY_ON_WRITE
+
+# See inotify(7).
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+def watched_directory(root_path: Path, pattern: str) -> Tuple[Path, bool]:
+    """
+    Synopsis:   Works out which directory has to be watched to see every file a glob pattern could match.
+    Parameters:
+        root_path = The path the pattern is relative to.
+        pattern = The glob pattern, e.g. 'resources/**/*.json'.
+    Returns:    The directory the pattern starts globbing from and whether its subdirectories need watching too.
+    """
+    parts = Path(pattern).parts
+    for index, part in enumerate(parts):
+        if is_wildcard(part):
+            return root_path.joinpath(*parts[:index]), index < len(parts) - 1
+    return (root_path / pattern).parent, False
+
+
+def list_directories(directory: Path, recursive: bool) -> List[Path]:
+    """
+    Synopsis:   Lists a directory and, if recursive, every directory below it. Symlinks are not followed.
+    """
+    directories = [directory]
+    if recursive:
+        for dir_path, dir_names, _ in os.walk(directory):
+            directories.extend(Path(dir_path) / dir_name for dir_name in dir_names)
+    return directories
+
+
+class BaseWatcher(ABC):
+    """
+    Synopsis:   A base class for watching directories for changed files.
+    Parameters:
+        directories = A mapping of each directory to watch to whether its subdirectories are watched too.
+    """
+
+    def __init__(self, directories: Dict[Path, bool]):
+        self.directories = directories
+
+    @abstractmethod
+    def wait(self, timeout: float = None) -> Set[Path] or None:
+        """
+        Synopsis:   Waits for files to change.
+        Parameters:
+            timeout = The most seconds to wait. None waits until something changes.
+        Returns:    The paths that were created, modified or deleted (empty if the timeout passed first),
+                    or None if changes were missed and anything may have changed.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(BaseWatcher):
+    """
+    Synopsis:   Watches directories by listing them every interval and comparing mtimes and sizes.
+                Works everywhere, but costs a scan of the directories every interval.
+    Parameters:
+        directories = See BaseWatcher.
+        interval = The seconds between scans.
+    """
+
+    def __init__(self, directories: Dict[Path, bool], interval: float = 0.5):
+        super().__init__(directories)
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for directory, recursive in self.directories.items():
+            for listed_directory in list_directories(directory, recursive):
+                try:
+                    entries = list(os.scandir(listed_directory))
+                except OSError:
+                    continue
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            entry_stat = entry.stat()
+                            snapshot[Path(entry.path)] = (
+                                entry_stat.st_mtime_ns,
+                                entry_stat.st_size,
+                            )
+                    except OSError:
+                        continue
+        return snapshot
+
+    def wait(self, timeout: float = None) -> Set[Path] or None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return set()
+            time.sleep(
+                self.interval if remaining is None else min(self.interval, remaining)
+            )
+            snapshot = self.scan()
+            changed_paths = {
+                file_path
+                for file_path in snapshot.keys() | self.snapshot.keys()
+                if snapshot.get(file_path) != self.snapshot.get(file_path)
+            }
+            self.snapshot = snapshot
+            if changed_paths:
+                return changed_paths
+
+
+class InotifyWatcher(BaseWatcher):
+    """
+    Synopsis:   Watches directories with Linux's inotify, so changes are seen as soon as they happen
+                without scanning anything. Directories created inside a recursively watched directory
+                are watched as they appear. A directory that doesn't exist yet is watched for from its
+                nearest existing ancestor, and watched itself once it is created.
+    Parameters:
+        directories = See BaseWatcher.
+    """
+
+    def __init__(self, directories: Dict[Path, bool]):
+        super().__init__(directories)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.missing_directories = {}
+        for directory, recursive in directories.items():
+            self.watch(directory, recursive)
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        Synopsis:   Determines whether inotify can be used on this platform.
+        """
+        if not sys.platform.startswith("linux"):
+            return False
+        libc_name = ctypes.util.find_library("c")
+        return libc_name is not None and hasattr(
+            ctypes.CDLL(libc_name), "inotify_init1"
+        )
+
+    def add_watch(self, directory: Path, recursive: bool):
+        watch_descriptor = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), INOTIFY_MASK
+        )
+        if watch_descriptor >= 0:
+            # A directory watched twice (e.g. as another's ancestor) keeps one watch, recursive if either is.
+            _, watched_recursive = self.watches.get(watch_descriptor, (None, False))
+            self.watches[watch_descriptor] = (directory, recursive or watched_recursive)
+
+    def watch(self, directory: Path, recursive: bool) -> Set[Path]:
+        """
+        Synopsis:   Watches a directory and, if recursive, every directory below it.
+                    If the directory doesn't exist, its nearest existing ancestor is watched until it is created.
+        Parameters:
+            directory = The directory to watch.
+            recursive = Whether to watch its subdirectories too.
+        Returns:    The paths already in the directories watched, as they may have changed before being watched.
+        """
+        if not directory.is_dir():
+            self.missing_directories[directory] = recursive
+            ancestor = directory.parent
+            while not ancestor.is_dir() and ancestor != ancestor.parent:
+                ancestor = ancestor.parent
+            self.add_watch(ancestor, False)
+            return set()
+        self.missing_directories.pop(directory, None)
+        existing_paths = set()
+        for listed_directory in list_directories(directory, recursive):
+            self.add_watch(listed_directory, recursive)
+            try:
+                existing_paths.update(
+                    listed_directory / file_name
+                    for file_name in os.listdir(listed_directory)
+                )
+            except OSError:
+                continue
+        return existing_paths
+
+    def wait(self, timeout: float = None) -> Set[Path] or None:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed_paths = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return changed_paths
+            offset = 0
+            while offset < len(data):
+                (
+                    watch_descriptor,
+                    mask,
+                    _,
+                    name_length,
+                ) = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                name = data[offset : offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if watch_descriptor not in self.watches or not name:
+                    continue
+                directory, recursive = self.watches[watch_descriptor]
+                changed_path = directory / os.fsdecode(name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # Files can land in a new directory before it is watched, so report what is already there.
+                        if recursive:
+                            changed_paths.update(self.watch(changed_path, True))
+                        for missing_directory, missing_recursive in list(
+                            self.missing_directories.items()
+                        ):
+                            if (
+                                changed_path == missing_directory
+                                or changed_path in missing_directory.parents
+                            ):
+                                changed_paths.update(
+                                    self.watch(missing_directory, missing_recursive)
+                                )
+                    continue
+                changed_paths.add(changed_path)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(
+    directories: Dict[Path, bool], polling: bool = False, interval: float = 0.5
+) -> BaseWatcher:
+    """
+    Synopsis:   Creates the best watcher available for the platform.
+    Parameters:
+        directories = See BaseWatcher.
+        polling = Whether to poll even when inotify is available.
+        interval = The seconds between scans when polling.
+    Returns:    An InotifyWatcher where possible, otherwise a PollingWatcher.
+    """
+    if not polling and InotifyWatcher.is_available():
+        return InotifyWatcher(directories)
+    return PollingWatcher(directories, interval)
+
+
+@dataclass
+class BuildWatcher:
+    """
+    Synopsis:   Keeps a build resident and rebuilds it whenever one of its source files changes.
+                The config, the compiled jsonpaths and the content of unchanged source files are kept between
+                builds, so a rebuild only re-globs the source locations and loads the files that changed.
+                Every rebuild merges into the destination content as it was when watching started,
+                so the destination doesn't accumulate the output of earlier rebuilds.
+    Parameters:
+        build_config = The build to keep up to date.
+        debounce = The seconds to wait for a burst of changes to finish before rebuilding.
+        polling = Whether to poll for changes even when inotify is available.
+        poll_interval = The seconds between scans when polling.
+        merge_workers = The number of processes to merge each source's content with. See TreeReductionMerger.
+    """
+
+    build_config: BuildConfig
+    debounce: float = 0.05
+    polling: bool = False
+    poll_interval: float = 0.5
+    merge_workers: int = 1
+    builds: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        loader = self.build_config.loader
+        if not isinstance(loader.cache, MemoryCache):
+            loader.cache = MemoryCache(backing=loader.cache)
+        self.cache = loader.cache
+
+    @property
+    def directories(self) -> Dict[Path, bool]:
+        directories = {}
+        for src in self.build_config.source_files:
+            directory, recursive = watched_directory(
+                src.location.root_path, src.location.substituted_path
+            )
+            directories[directory] = directories.get(directory, False) or recursive
+        return directories
+
+    def is_build_output(self, file_path: Path) -> bool:
+        # The destination is written to a temporary file that is renamed over it, see write_atomically.
+        file_path = Path(file_path).absolute()
+        destination_path = Path(self.build_config.destination_path).absolute()
+        return file_path == destination_path or (
+            file_path.parent == destination_path.parent
+            and file_path.name.startswith(f".{destination_path.name}.")
+            and file_path.name.endswith(".tmp")
+        )
+
+    def invalidate(self, changed_paths: Iterable[Path] or None) -> bool:
+        """
+        Synopsis:   Forgets what is known about the files that changed.
+        Parameters:
+            changed_paths = The paths that changed, or None if anything may have changed.
+        Returns:    True if any source's files or their content changed, so a rebuild is needed.
+        """
+        if changed_paths is not None:
+            changed_paths = {
+                Path(changed_path).absolute() for changed_path in changed_paths
+            }
+        self.cache.invalidate(changed_paths)
+        self.build_config.directory_index.invalidate(
+            None
+            if changed_paths is None
+            else {changed_path.parent for changed_path in changed_paths} | changed_paths
+        )
+        needs_rebuild = False
+        # Sources can share a FileLocation, which must only be globbed again once.
+        paths_by_location = {}
+        for src in self.build_config.source_files:
+            if id(src.location) not in paths_by_location:
+                old_paths = {
+                    Path(resolved_path).absolute()
+                    for resolved_path in src.location.resolved_paths
+                }
+                src.location.__dict__.pop("resolved_paths", None)
+                paths_by_location[id(src.location)] = old_paths, {
+                    Path(resolved_path).absolute()
+                    for resolved_path in src.location.resolved_paths
+                }
+            old_paths, new_paths = paths_by_location[id(src.location)]
+            if (
+                changed_paths is None
+                or old_paths != new_paths
+                or not changed_paths.isdisjoint(new_paths)
+            ):
+                src.__dict__.pop("retrieved_src_content", None)
+                needs_rebuild = True
+        return needs_rebuild
+
+    def build(self):
+        started = time.perf_counter()
+        self.build_config.build(
+            merge_mode=COPY_ON_WRITE, merge_workers=self.merge_workers
+        )
+        self.builds += 1
+        print(
+            f"Built {self.build_config.destination_path} in {(time.perf_counter() - started) * 1000:.1f}ms",
+            flush=True,
+        )
+
+    def run(self, max_builds: int = None):
+        """
+        Synopsis:   Builds, then rebuilds every time a source changes, until interrupted.
+        Parameters:
+            max_builds = Stop after this many builds (including the first). None watches forever.
+        """
+        # Load the destination before the first build. Merging copy on write leaves it as it is,
+        # so every rebuild merges into the destination as it was before watching started.
+        self.build_config.destination_file.content
+        self.build()
+        watcher = create_watcher(self.directories, self.polling, self.poll_interval)
+        try:
+            while max_builds is None or self.builds < max_builds:
+                changed_paths = watcher.wait()
+                while changed_paths:
+                    more_changed_paths = watcher.wait(self.debounce)
+                    if more_changed_paths is None:
+                        changed_paths = None
+                    elif more_changed_paths:
+                        changed_paths |= more_changed_paths
+                        continue
+                    break
+                if changed_paths is not None:
+                    changed_paths = {
+                        changed_path
+                        for changed_path in changed_paths
+                        if not self.is_build_output(changed_path)
+                    }
+                    if not changed_paths:
+                        continue
+                if self.invalidate(changed_paths):
+                    self.build()
+        finally:
+            watcher.close()
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from dfm.batch import BatchBuild, format_summary
+from dfm.exceptions import BatchBuildError
+
+
+def write_config(config_path, source_pattern, destination_path):
+    config_path.write_text(
+        json.dumps(
+            {
+                "SourceFiles": [
+                    {
+                        "SourceFileLocation": {"Path": source_pattern},
+                        "SourceFileNode": "$.Key",
+                        "DestinationFileNode": "$.Key",
+                    }
+                ],
+                "DestinationFile": {
+                    "DestinationFileLocation": {"Path": destination_path}
+                },
+            }
+        )
+    )
+    return config_path
+
+
+class TestBatchBuild:
+    def test_dependent_configs_are_built_in_order(self, tmp_path):
+        (tmp_path / "sources").mkdir()
+        (tmp_path / "built").mkdir()
+        for i in range(2):
+            (tmp_path / "sources" / f"source_{i}.json").write_text(
+                json.dumps({"Key": [i]})
+            )
+        config_paths = [
+            # Reads the destinations of both configs below.
+            write_config(tmp_path / "final.json", "built/*.json", "final_out.json"),
+            write_config(tmp_path / "first.json", "sources/*.json", "built/first.json"),
+            write_config(
+                tmp_path / "second.json", "sources/source_1.json", "built/second.json"
+            ),
+        ]
+        batch_build = BatchBuild(config_paths, tmp_path, workers=2)
+        assert batch_build.waves == [[1, 2], [0]]
+        results = batch_build.run()
+        assert [result.error for result in results] == [None, None, None]
+        assert [result.wave for result in results] == [1, 0, 0]
+        assert sorted(json.loads((tmp_path / "final_out.json").read_text())["Key"]) == [
+            0,
+            1,
+            1,
+        ]
+        assert "3 built, 0 failed" in format_summary(results)
+
+    def test_dependents_of_failed_configs_are_skipped(self, tmp_path):
+        (tmp_path / "source.json").write_text(json.dumps({"Key": 1.5}))
+        config_paths = [
+            write_config(tmp_path / "first.json", "source.json", "first_out.json"),
+            write_config(tmp_path / "second.json", "first_out.json", "second_out.json"),
+        ]
+        (tmp_path / "first_out.json").write_text(json.dumps({"Key": 1.5}))
+        results = BatchBuild(config_paths, tmp_path).run()
+        assert results[0].error.startswith("TypeError")
+        assert results[1].error.startswith("Skipped")
+        assert not (tmp_path / "second_out.json").exists()
+
+    def test_cycles_are_rejected(self, tmp_path):
+        config_paths = [
+            write_config(tmp_path / "first.json", "b.json", "a.json"),
+            write_config(tmp_path / "second.json", "a.json", "b.json"),
+        ]
+        with pytest.raises(BatchBuildError):
+            BatchBuild(config_paths, tmp_path).waves
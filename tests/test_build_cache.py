@@ -0,0 +1,149 @@
+import json
+import os
+import time
+
+import pytest
+
+from dfm.build_cache import RACY_WINDOW_NS, BuildCache
+from dfm.config import BuildConfig, DestinationFile, SourceFile
+from dfm.file_loader import FileLoader
+from dfm.file_location import FileLocation
+
+
+def age_file(file_path, seconds=10):
+    # Move the mtime back so the cache can trust it (see RACY_WINDOW_NS).
+    past = time.time() - max(seconds, 2 * RACY_WINDOW_NS / 1e9)
+    os.utime(file_path, (past, past))
+
+
+class TestBuildCache:
+    def test_unchanged_file_is_not_reloaded(self, tmp_path):
+        source = tmp_path / "source.json"
+        source.write_text(json.dumps({"Key": [1, 2]}))
+        age_file(source)
+        cache = BuildCache(tmp_path / "cache")
+        assert cache.get_node_values(source, "$.Key", lambda: [[1, 2]]) == [[1, 2]]
+
+        def fail():
+            raise AssertionError("An unchanged file was reloaded.")
+
+        assert cache.get_node_values(source, "$.Key", fail) == [[1, 2]]
+        # A touched but unchanged file is hashed rather than reloaded.
+        os.utime(source)
+        assert cache.get_node_values(source, "$.Key", fail) == [[1, 2]]
+
+    def test_changed_file_is_reloaded(self, tmp_path):
+        source = tmp_path / "source.json"
+        source.write_text(json.dumps({"Key": 1}))
+        cache = BuildCache(tmp_path / "cache")
+        assert cache.get_node_values(source, "$.Key", lambda: [1]) == [1]
+        source.write_text(json.dumps({"Key": 2}))
+        assert cache.get_node_values(source, "$.Key", lambda: [2]) == [2]
+
+    @pytest.mark.parametrize(
+        "storage_format, library_name, extension",
+        [("MessagePack", "msgpack", ".msgpack"), ("Cbor", "cbor2", ".cbor")],
+    )
+    def test_binary_storage_format(
+        self, tmp_path, storage_format, library_name, extension
+    ):
+        pytest.importorskip(library_name)
+        source = tmp_path / "source.json"
+        source.write_text(json.dumps({"Key": {"A": [1, None, "é"]}}))
+        age_file(source)
+        cache = BuildCache(tmp_path / "cache", storage_format=storage_format)
+        values = [{"A": [1, None, "é"]}]
+        assert cache.get_node_values(source, "$.Key", lambda: values) == values
+        assert [entry.suffix for entry in cache.sources_dir.iterdir()] == [extension]
+
+        def fail():
+            raise AssertionError("An unchanged file was reloaded.")
+
+        assert cache.get_node_values(source, "$.Key", fail) == values
+
+    def test_entries_are_not_synced(self, tmp_path, monkeypatch):
+        source = tmp_path / "source.json"
+        source.write_text(json.dumps({"Key": 1}))
+        synced = []
+        monkeypatch.setattr(os, "fsync", synced.append)
+        cache = BuildCache(tmp_path / "cache")
+        assert cache.get_node_values(source, "$.Key", lambda: [1]) == [1]
+        assert synced == []
+        assert [entry.name for entry in cache.sources_dir.iterdir()] == [
+            cache._entry_name(str(source.absolute()), "$.Key")
+        ]
+        assert cache.get_node_values(source, "$.Key", lambda: [2]) == [1]
+
+    def test_unknown_storage_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            BuildCache(tmp_path / "cache", storage_format="Toml")
+
+    def test_eviction_by_count(self, tmp_path):
+        cache = BuildCache(tmp_path / "cache", max_entries=2)
+        for i in range(4):
+            source = tmp_path / f"source_{i}.json"
+            source.write_text("{}")
+            cache.get_node_values(source, "$", lambda: [{}])
+        cache.evict()
+        assert len(list(cache.sources_dir.iterdir())) == 2
+
+    def test_eviction_of_builds(self, tmp_path):
+        cache = BuildCache(tmp_path / "cache", max_entries=2)
+        for i in range(4):
+            destination = tmp_path / f"destination_{i}.json"
+            destination.write_text("{}")
+            cache.record_build(destination, "fingerprint")
+        cache.evict()
+        assert len(list(cache.builds_dir.iterdir())) == 2
+
+    def test_unchanged_build_is_skipped(self, tmp_path):
+        for i in range(2):
+            (tmp_path / f"source_{i}.json").write_text(json.dumps({"Key": [i]}))
+            age_file(tmp_path / f"source_{i}.json")
+        loader = FileLoader(cache=BuildCache(tmp_path / "cache"))
+
+        def build():
+            build_config = BuildConfig(
+                [SourceFile(FileLocation("source_*.json", tmp_path), "$.Key", "$.Key")],
+                DestinationFile(FileLocation("destination.json", tmp_path)),
+                tmp_path,
+                loader,
+            )
+            content = build_config.build()
+            return build_config, content
+
+        build_config, content = build()
+        assert not build_config.build_skipped
+        assert sorted(content["Key"]) == [0, 1]
+        destination_mtime = (tmp_path / "destination.json").stat().st_mtime_ns
+
+        build_config, content = build()
+        assert build_config.build_skipped
+        assert sorted(content["Key"]) == [0, 1]
+        assert (tmp_path / "destination.json").stat().st_mtime_ns == destination_mtime
+
+        (tmp_path / "source_2.json").write_text(json.dumps({"Key": [2]}))
+        build_config, content = build()
+        assert not build_config.build_skipped
+
+    def test_build_with_recently_modified_sources_is_not_skipped(self, tmp_path):
+        source = tmp_path / "source.json"
+        source.write_text(json.dumps({"Key": [1]}))
+        loader = FileLoader(cache=BuildCache(tmp_path / "cache"))
+
+        def build():
+            build_config = BuildConfig(
+                [SourceFile(FileLocation("source.json", tmp_path), "$.Key", "$.Key")],
+                DestinationFile(FileLocation("destination.json", tmp_path)),
+                tmp_path,
+                loader,
+            )
+            build_config.build()
+            return build_config
+
+        build()
+        # The source could change again without its mtime moving, so it isn't trusted yet.
+        assert not build().build_skipped
+        age_file(source)
+        assert not build().build_skipped
+        assert build().build_skipped
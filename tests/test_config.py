@@ -1,8 +1,21 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import pytest
+
+from dfm import parallel_merge
 from dfm.config import BuildConfig, DestinationFile, SourceFile
+from dfm.exceptions import ReferenceTypeError
+from dfm.file_loader import FileLoader
 from dfm.file_location import FileLocation, Substitution
 from dfm.file_types import JsonFileType
+from dfm.json_merger import COPY_ON_WRITE, IN_PLACE, JsonMergerFactory
+from dfm.naming_conventions import PascalCase, SnakeCase, StringConverter
 from dfm.reference_types import (
     ContentReferenceType,
     KeyReferenceType,
@@ -34,6 +47,56 @@ class TestSubstitutions:
         ):
             assert Substitution(reference_type, value).evaluate() == expected_resolution
 
+    def test_evaluate_with_content(self):
+        substitution = Substitution(
+            KeyReferenceType(),
+            "$",
+            naming_convention=StringConverter(PascalCase(), SnakeCase()),
+        )
+        assert substitution.evaluate_with_content({"MyBucket": {}}) == "my_bucket"
+        assert substitution.evaluate_with_content({"MyRole": {}}) == "my_role"
+        assert substitution.reference_type.file_content is None
+        literal = Substitution(LiteralReferenceType(), "Literal")
+        assert literal.evaluate_with_content({"MyBucket": {}}) == "Literal"
+
+    def test_content_substitutions_match_anything_when_merging(self):
+        file_location = FileLocation(
+            path="resources/${Name}.json",
+            root_path=Path(__file__).parent.resolve(),
+            subs={"Name": Substitution(KeyReferenceType(), "$")},
+            content_wildcards=True,
+        )
+        assert file_location.substituted_path == "resources/*.json"
+
+    @pytest.mark.parametrize("destination_path", ["out.json", "out/${Name}.json"])
+    def test_content_substitutions_only_match_anything_in_sources(
+        self, tmp_path, destination_path
+    ):
+        sub = {"Type": "Key", "Value": "$"}
+        config_dict = {
+            "SourceFiles": [
+                {
+                    "SourceFileLocation": {
+                        "Path": "${Name}.json",
+                        "PathSubs": {"Name": sub},
+                    },
+                    "SourceFileNode": "$",
+                    "DestinationFileNode": "$",
+                }
+            ],
+            "DestinationFile": {"DestinationFileLocation": {"Path": destination_path}},
+        }
+        if "${Name}" in destination_path:
+            config_dict["DestinationFile"]["DestinationFileLocation"]["PathSubs"] = {
+                "Name": sub
+            }
+        else:
+            config = BuildConfig.from_dict(config_dict, tmp_path)
+            assert config.source_files[0].location.substituted_path == "*.json"
+            return
+        with pytest.raises(ReferenceTypeError):
+            BuildConfig.from_dict(config_dict, tmp_path)
+
 
 class TestFileLocations:
     def test_file_locations(self):
@@ -53,6 +116,25 @@ class TestFileLocations:
             ),
         ]
 
+    @pytest.mark.parametrize(
+        "pattern,file_path,expected",
+        [
+            ("a/*.json", "a/file.json", True),
+            ("a/*.json", "a/b/file.json", False),
+            ("a/**/*.json", "a/file.json", True),
+            ("a/**/*.json", "a/b/c/file.json", True),
+            ("a/file_[!2].json", "a/file_1.json", True),
+            ("a/file_[!2].json", "a/file_2.json", False),
+            ("a/file?.json", "a/file1.json", True),
+            ("a/*.json", "../a/file.json", False),
+        ],
+    )
+    def test_file_location_matches(self, pattern, file_path, expected):
+        root_path = Path("/root/path")
+        assert (
+            FileLocation(pattern, root_path).matches(root_path / file_path) == expected
+        )
+
 
 class TestDestinationFiles:
     def test_destination_files(self):
@@ -200,3 +282,341 @@ class TestConfigs:
             root_path=Path(__file__).parent.resolve(),
         )
         assert expected_config == generated_config
+
+    def test_config_build_batches_tree_writes(self):
+        src_file_location = FileLocation(
+            path="test_files_directory/${Sub1}/nested_test_file_*.json",
+            subs={"Sub1": Substitution(LiteralReferenceType(), "nested_directory")},
+            root_path=Path(__file__).parent.resolve(),
+        )
+        dest_file_location = FileLocation(
+            path="test_files_directory/nested_directory/DOESNT_EXIST.json",
+            root_path=Path(__file__).parent.resolve(),
+        )
+        src = SourceFile(src_file_location, "$.AnotherKeyInTheFile", "$.Merged")
+        config = BuildConfig(
+            [src], DestinationFile(dest_file_location), Path(__file__).parent.resolve()
+        )
+        content = config.build(save_to_local_file=False)
+        assert sorted(content["Merged"]) == ["OneIs", "OneIs2", "UhOh", "UhOh2"]
+        assert config.tree_writes_avoided == 1
+
+    def test_merge_workers_share_one_process_pool(self, tmp_path, monkeypatch):
+        started = []
+        monkeypatch.setattr(
+            parallel_merge,
+            "ProcessPoolExecutor",
+            lambda max_workers: started.append(max_workers)
+            or ProcessPoolExecutor(max_workers),
+        )
+        (tmp_path / "sources").mkdir()
+        for i in range(8):
+            (tmp_path / "sources" / f"{i}.json").write_text(json.dumps({"Tags": [i]}))
+        (tmp_path / "destination.json").write_text(json.dumps({"A": {}, "B": {}}))
+        config = BuildConfig.from_dict(
+            {
+                "SourceFiles": [
+                    {
+                        "SourceFileLocation": {"Path": "sources/*.json"},
+                        "SourceFileNode": "$",
+                        "DestinationFileNode": destination_node,
+                    }
+                    for destination_node in ("$.*", "$.C")
+                ],
+                "DestinationFile": {
+                    "DestinationFileLocation": {"Path": "destination.json"}
+                },
+            },
+            tmp_path,
+        )
+        content = config.build(save_to_local_file=False, merge_workers=2)
+        assert content == {node: {"Tags": list(range(8))} for node in "ABC"}
+        assert started == [2]
+
+
+class TestSharedSources:
+    @pytest.fixture
+    def config_path(self, tmp_path):
+        (tmp_path / "sources").mkdir()
+        for i in range(2):
+            (tmp_path / "sources" / f"env-dev_{i}.json").write_text(
+                json.dumps({"Tags": [i], "Names": {f"Name{i}": i}})
+            )
+        location = {
+            "Path": "sources/env-${Env}_*.json",
+            "PathSubs": {
+                "Env": {
+                    "Type": "Parameter",
+                    "Value": "Stage",
+                    "Regex": {"Expression": "(.+)-.+", "CaptureGroup": 1},
+                }
+            },
+        }
+        config_path = tmp_path / "config.json"
+        config_path.write_text(
+            json.dumps(
+                {
+                    "SourceFiles": [
+                        {
+                            "SourceFileLocation": location,
+                            "SourceFileNode": node,
+                            "DestinationFileNode": node,
+                        }
+                        for node in ("$.Tags", "$.Names")
+                    ],
+                    "DestinationFile": {
+                        "DestinationFileLocation": {
+                            "Path": "${Env}.json",
+                            "PathSubs": location["PathSubs"],
+                        }
+                    },
+                }
+            )
+        )
+        return config_path
+
+    def test_identical_locations_and_substitutions_are_shared(self, config_path):
+        config = BuildConfig.load_config_from_file(
+            config_path, config_path.parent, {"Stage": "dev-eu"}
+        )
+        first_src, second_src = config.source_files
+        assert first_src.location is second_src.location
+        assert (
+            first_src.location.subs["Env"]
+            is config.destination_file.location.subs["Env"]
+        )
+        assert config.destination_path == config_path.parent / "dev.json"
+
+    @pytest.mark.parametrize(
+        "merge_mode,loads_per_file", [(COPY_ON_WRITE, 1), (IN_PLACE, 2)]
+    )
+    def test_shared_files_are_loaded_once(
+        self, config_path, monkeypatch, merge_mode, loads_per_file
+    ):
+        loaded = []
+        load_from_file = JsonFileType.load_from_file
+        monkeypatch.setattr(
+            JsonFileType,
+            "load_from_file",
+            lambda file_path, codec=None: loaded.append(Path(file_path).name)
+            or load_from_file(file_path, codec),
+        )
+        config = BuildConfig.load_config_from_file(
+            config_path, config_path.parent, {"Stage": "dev-eu"}
+        )
+        content = config.build(save_to_local_file=False, merge_mode=merge_mode)
+        assert content == {"Tags": [0, 1], "Names": {"Name0": 0, "Name1": 1}}
+        assert sorted(loaded) == sorted(
+            ["config.json"] + ["env-dev_0.json", "env-dev_1.json"] * loads_per_file
+        )
+        assert config.source_files[0].loader is config.loader
+
+
+class TestBuildAsync:
+    @pytest.fixture
+    def config_path(self, tmp_path):
+        (tmp_path / "sources").mkdir()
+        for i in range(20):
+            (tmp_path / "sources" / f"source_{i:02}.json").write_text(
+                json.dumps({"Tags": [i], "Names": {"Last": i, f"Name{i}": i}})
+            )
+        (tmp_path / "empty.json").write_text(json.dumps({}))
+        config_path = tmp_path / "config.json"
+        config_path.write_text(
+            json.dumps(
+                {
+                    "SourceFiles": [
+                        {
+                            "SourceFileLocation": {"Path": path},
+                            "SourceFileNode": node,
+                            "DestinationFileNode": node,
+                        }
+                        for path, node in [
+                            ("sources/*.json", "$.Tags"),
+                            ("empty.json", "$.Missing"),
+                            ("missing/*.json", "$.Missing"),
+                            ("sources/*.json", "$.Names"),
+                        ]
+                    ],
+                    "DestinationFile": {
+                        "DestinationFileLocation": {"Path": "destination.json"}
+                    },
+                }
+            )
+        )
+        return config_path
+
+    @pytest.mark.parametrize("merge_mode", [COPY_ON_WRITE, IN_PLACE])
+    def test_matches_build(self, config_path, monkeypatch, merge_mode):
+        expected = BuildConfig.load_config_from_file(
+            config_path, config_path.parent
+        ).build(save_to_local_file=False, merge_mode=merge_mode)
+        original_extract_node_values = FileLoader.extract_node_values
+
+        def extract_node_values_slowly(loader, *args):
+            # Finish loads out of order.
+            time.sleep(random.random() / 1000)
+            return original_extract_node_values(loader, *args)
+
+        monkeypatch.setattr(
+            FileLoader, "extract_node_values", extract_node_values_slowly
+        )
+        config = BuildConfig.load_config_from_file(
+            config_path, config_path.parent, loader=FileLoader(workers=4)
+        )
+        content = asyncio.run(config.build_async(merge_mode=merge_mode, queue_size=2))
+        assert content == expected
+        assert list(content["Names"]) == list(expected["Names"])
+        assert "Missing" not in content
+        assert config.tree_writes_avoided == 38
+        assert JsonFileType.load_from_file(config.destination_path) == expected
+
+    def test_queue_bounds_loaded_files(self, config_path, monkeypatch):
+        original_extract_node_values = FileLoader.extract_node_values
+        lock = threading.Lock()
+        held = {"Now": 0, "Most": 0}
+
+        def extract_node_values(loader, *args):
+            values = original_extract_node_values(loader, *args)
+            with lock:
+                held["Now"] += len(values)
+                held["Most"] = max(held["Most"], held["Now"])
+            return values
+
+        def merge_all(merger, values):
+            time.sleep(0.001)
+            with lock:
+                held["Now"] -= len(values)
+            return original_merge_all(merger, values)
+
+        original_merge_all = JsonMergerFactory.merge_all
+        monkeypatch.setattr(FileLoader, "extract_node_values", extract_node_values)
+        monkeypatch.setattr(JsonMergerFactory, "merge_all", merge_all)
+        config = BuildConfig.load_config_from_file(
+            config_path, config_path.parent, loader=FileLoader(workers=2)
+        )
+        asyncio.run(config.build_async(save_to_local_file=False, queue_size=3))
+        # Up to queue_size being merged, queue_size waiting and workers loading.
+        assert 3 < held["Most"] <= 2 * 3 + 2
+
+    def test_errors_are_raised(self, config_path, monkeypatch):
+        def fail(*_):
+            raise RuntimeError("Failed to load")
+
+        monkeypatch.setattr(FileLoader, "extract_node_values", fail)
+        config = BuildConfig.load_config_from_file(config_path, config_path.parent)
+        with pytest.raises(RuntimeError):
+            asyncio.run(config.build_async())
+        assert not config.destination_path.exists()
+
+
+class TestFileTypes:
+    def test_mixed_file_types(self, tmp_path):
+        pytest.importorskip("yaml")
+        (tmp_path / "a.json").write_text(json.dumps({"Resources": {"A": 1}}))
+        (tmp_path / "b.yaml").write_text("Resources:\n  B: [2, 3]\n")
+        (tmp_path / "c.toml").write_text("[Resources]\nC = 'c'\n")
+        (tmp_path / "d.template").write_text("Resources:\n  D: null\n")
+        (tmp_path / "config.yml").write_text(
+            "SourceFiles:\n"
+            + "".join(
+                f"  - SourceFileLocation: {{Path: {path}{file_type}}}\n"
+                "    SourceFileNode: $.Resources\n"
+                "    DestinationFileNode: $.Resources\n"
+                for path, file_type in [
+                    ("a.json", ""),
+                    ("b.yaml", ""),
+                    ("c.toml", ""),
+                    ("d.template", ", FileType: Yaml"),
+                ]
+            )
+            + "DestinationFile:\n  DestinationFileLocation: {Path: out.yaml}\n"
+        )
+        build_config = BuildConfig.load_config_from_file(
+            tmp_path / "config.yml", tmp_path
+        )
+        assert [src.file_type for src in build_config.source_files] == [
+            None,
+            None,
+            None,
+            "Yaml",
+        ]
+        build_config.build()
+        assert (tmp_path / "out.yaml").read_text().startswith("Resources:\n")
+        assert BuildConfig.load_config_from_file(
+            tmp_path / "config.yml", tmp_path
+        ).destination_file.content == {
+            "Resources": {"A": 1, "B": [2, 3], "C": "c", "D": None}
+        }
+
+
+class TestSeveralDestinationNodes:
+    BUILD_MODES = [
+        (is_async, merge_mode)
+        for is_async in (False, True)
+        for merge_mode in (COPY_ON_WRITE, IN_PLACE)
+    ]
+
+    def build(self, tmp_path, destination, source_files: list, build_mode: tuple):
+        (tmp_path / "destination.json").write_text(json.dumps(destination))
+        config = BuildConfig.from_dict(
+            {
+                "SourceFiles": [
+                    {
+                        "SourceFileLocation": {"Path": path},
+                        "SourceFileNode": node,
+                        "DestinationFileNode": destination_node,
+                    }
+                    for path, node, destination_node in source_files
+                ],
+                "DestinationFile": {
+                    "DestinationFileLocation": {"Path": "destination.json"}
+                },
+            },
+            tmp_path,
+        )
+        is_async, merge_mode = build_mode
+        if is_async:
+            return config, asyncio.run(config.build_async(False, merge_mode))
+        return config, config.build(False, merge_mode)
+
+    @pytest.mark.parametrize("build_mode", BUILD_MODES)
+    def test_source_content_is_merged_into_each_node(self, tmp_path, build_mode):
+        (tmp_path / "a.json").write_text(json.dumps({"b": {"d": "z"}}))
+        (tmp_path / "b.json").write_text(json.dumps({"b": {"k": False}}))
+        config, content = self.build(
+            tmp_path, {"x": None, "y": None}, [("[ab].json", "$.b", "$.*")], build_mode
+        )
+        assert content == {"x": {"d": "z", "k": False}, "y": {"d": "z", "k": False}}
+        if not build_mode[0]:
+            assert config.source_files[0].retrieved_src_content == [
+                {"d": "z"},
+                {"k": False},
+            ]
+
+    @pytest.mark.parametrize("build_mode", BUILD_MODES)
+    def test_merging_doesnt_change_source_content(self, tmp_path, build_mode):
+        (tmp_path / "source.json").write_text(json.dumps({"n": 2}))
+        _, content = self.build(
+            tmp_path,
+            {"x": {"n": 1}, "y": [0]},
+            [("source.json", "$", "$.*")],
+            build_mode,
+        )
+        # Every match is written the value merged into the last match, as jsonpath_ng updates every match.
+        # Before merges were copy on write, merging into "$.x" changed the source to {"n": 3}
+        # and that is what was then merged into "$.y".
+        assert content == {"x": [0, {"n": 2}], "y": [0, {"n": 2}]}
+
+    @pytest.mark.parametrize("build_mode", BUILD_MODES)
+    def test_nodes_written_together_are_independent(self, tmp_path, build_mode):
+        (tmp_path / "a.json").write_text(json.dumps([1]))
+        (tmp_path / "b.json").write_text(json.dumps([2]))
+        _, content = self.build(
+            tmp_path,
+            {"x": None, "y": None},
+            [("a.json", "$", "$.*"), ("b.json", "$", "$.x")],
+            build_mode,
+        )
+        # Before merges were copy on write, both nodes were the same list, so merging into "$.x" changed "$.y".
+        assert content == {"x": [1, 2], "y": [1]}
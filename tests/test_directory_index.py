@@ -0,0 +1,79 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pytest
+
+from dfm.directory_index import DirectoryIndex
+
+
+@dataclass
+class CountingDirectoryIndex(DirectoryIndex):
+    scanned: list = field(default_factory=list)
+
+    def scan_directory(self, directory: Path):
+        self.scanned.append(directory)
+        return super().scan_directory(directory)
+
+
+@pytest.fixture
+def directory_tree(tmp_path: Path) -> Path:
+    for directory in ["a/b/c", "a/.hidden", "d/e"]:
+        (tmp_path / directory).mkdir(parents=True)
+    for file_path in [
+        "a/x.json",
+        "a/b/y.json",
+        "a/b/c/z.json",
+        "a/.hidden/w.json",
+        "d/e/v.json",
+        "a/notes.txt",
+    ]:
+        (tmp_path / file_path).write_text("{}")
+    os.symlink(tmp_path / "d", tmp_path / "a" / "link")
+    return tmp_path
+
+
+class TestDirectoryIndex:
+    @pytest.mark.parametrize(
+        "pattern",
+        [
+            "**/*.json",
+            "a/**/*.json",
+            "a/*",
+            "a/*/*.json",
+            "**",
+            "*/*/",
+            "a/b/c/z.json",
+            "a/missing.json",
+            "a/link/e/*.json",
+            "a/link/**/*.json",
+            "a/[!b]*",
+            "a/?.json",
+            "a/../d/*/v.json",
+        ],
+    )
+    def test_glob_matches_pathlib(self, directory_tree, pattern):
+        assert DirectoryIndex().glob(directory_tree, pattern) == sorted(
+            set(directory_tree.glob(pattern))
+        )
+
+    def test_directories_are_listed_once(self, directory_tree):
+        directory_index = CountingDirectoryIndex()
+        directory_index.glob(directory_tree, "a/**/*.json")
+        directory_index.glob(directory_tree, "a/**/*.txt")
+        directory_index.glob(directory_tree, "a/b/*.json")
+        assert len(directory_index.scanned) == len(set(directory_index.scanned))
+
+    def test_invalidated_directories_are_listed_again(self, directory_tree):
+        directory_index = DirectoryIndex()
+        assert directory_index.glob(directory_tree, "a/b/*.json") == [
+            directory_tree / "a/b/y.json"
+        ]
+        (directory_tree / "a/b/new.json").write_text("{}")
+        assert len(directory_index.glob(directory_tree, "a/b/*.json")) == 1
+        directory_index.invalidate([directory_tree / "a/b"])
+        assert len(directory_index.glob(directory_tree, "a/b/*.json")) == 2
+
+    def test_absolute_patterns_are_rejected(self, directory_tree):
+        with pytest.raises(NotImplementedError):
+            DirectoryIndex().glob(directory_tree, "/a/*.json")
@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import pytest
+
+from dfm import file_loader
+from dfm.build_cache import MemoryCache
+from dfm.file_loader import PROCESS_EXECUTOR, THREAD_EXECUTOR, FileLoader
+
+NESTED_DIRECTORY = (
+    Path(__file__).parent.resolve() / "test_files_directory/nested_directory"
+)
+
+
+class TestFileLoader:
+    @pytest.mark.parametrize("executor", [THREAD_EXECUTOR, PROCESS_EXECUTOR])
+    def test_concurrent_loading_keeps_file_order(self, executor):
+        file_paths = [
+            NESTED_DIRECTORY / "nested_test_file_2.json",
+            NESTED_DIRECTORY / "nested_test_file_1.json",
+        ] * 3
+        loader = FileLoader(workers=4, executor=executor)
+        assert loader.load_node_values(
+            file_paths, "$.AnotherKeyInTheFile"
+        ) == FileLoader().load_node_values(file_paths, "$.AnotherKeyInTheFile")
+        assert loader.load_node_values(file_paths, "$.AnotherKeyInTheFile")[:2] == [
+            {"UhOh2": "This", "OneIs2": "NestedAlso"},
+            {"UhOh": "This", "OneIs": "Nested"},
+        ]
+
+    def test_process_loading_fills_the_cache(self, monkeypatch):
+        file_paths = [
+            NESTED_DIRECTORY / f"nested_test_file_{i}.json" for i in (1, 2, 1)
+        ]
+        loader = FileLoader(workers=2, executor=PROCESS_EXECUTOR, cache=MemoryCache())
+        expected = FileLoader().load_node_values(file_paths, "$.AnotherKeyInTheFile")
+        assert loader.load_node_values(file_paths, "$.AnotherKeyInTheFile") == expected
+        assert len(loader.cache.entries) == 2
+
+        def parse_node_values(*_):
+            raise AssertionError("The cache should have had this file.")
+
+        monkeypatch.setattr(file_loader, "parse_node_values", parse_node_values)
+        assert loader.load_node_values(file_paths, "$.AnotherKeyInTheFile") == expected
+
+    def test_invalid_loader(self):
+        with pytest.raises(ValueError):
+            FileLoader(workers=0)
+        with pytest.raises(ValueError):
+            FileLoader(executor="fibre")
+
+    @pytest.mark.parametrize(
+        "node", ["$.AnotherKeyInTheFile", "$.AnotherKeyInTheFile.UhOh", "$.Missing"]
+    )
+    def test_lazy_loading_matches_full_loading(self, node):
+        pytest.importorskip("ijson")
+        file_paths = [
+            NESTED_DIRECTORY / "nested_test_file_1.json",
+            NESTED_DIRECTORY / "nested_test_file_2.json",
+        ]
+        assert FileLoader(lazy=True).load_node_values(
+            file_paths, node
+        ) == FileLoader().load_node_values(file_paths, node)
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from dfm import file_types
+from dfm.exceptions import FileTypeError
+from dfm.file_types import (
+    CborFileType,
+    FileTypeFactory,
+    JsonFileType,
+    MessagePackFileType,
+    TomlFileType,
+    YamlFileType,
+)
+
+
+class TestJsonFileType:
+    def test_compact_output(self, tmp_path):
+        content = {"A": [1, {"B": None}], "C": "é"}
+        JsonFileType.save_to_file(content, tmp_path / "file.json", compact=True)
+        assert (tmp_path / "file.json").read_text() == json.dumps(
+            content, separators=(",", ":")
+        )
+
+    def test_failed_write_leaves_file_untouched(self, tmp_path):
+        JsonFileType.save_to_file({"A": 1}, tmp_path / "file.json")
+
+        def failing_blocks():
+            yield b'{"A":'
+            raise RuntimeError("Crashed mid-write")
+
+        with pytest.raises(RuntimeError):
+            JsonFileType.write_atomically(tmp_path / "file.json", failing_blocks())
+        assert JsonFileType.load_from_file(tmp_path / "file.json") == {"A": 1}
+        assert [path.name for path in tmp_path.iterdir()] == ["file.json"]
+
+
+class TestYamlFileType:
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_round_trip(self, tmp_path, compact):
+        pytest.importorskip("yaml")
+        content = {"B": [1, {"C": None}], "A": "é", "D": {"E": 1.5, "F": True}}
+        YamlFileType.save_to_file(content, tmp_path / "file.yaml", compact=compact)
+        loaded = YamlFileType.load_from_file(tmp_path / "file.yaml")
+        assert loaded == content
+        assert list(loaded) == ["B", "A", "D"]
+
+
+class TestTomlFileType:
+    def test_load(self, tmp_path):
+        (tmp_path / "file.toml").write_text('A = 1\n\n[B]\nC = ["d"]\n')
+        assert TomlFileType.load_from_file(tmp_path / "file.toml") == {
+            "A": 1,
+            "B": {"C": ["d"]},
+        }
+
+    def test_round_trip(self, tmp_path):
+        pytest.importorskip("tomli_w")
+        content = {"A": 1, "B": {"C": ["d"]}}
+        TomlFileType.save_to_file(content, tmp_path / "file.toml")
+        assert TomlFileType.load_from_file(tmp_path / "file.toml") == content
+        with pytest.raises(FileTypeError):
+            TomlFileType.save_to_file([1], tmp_path / "file.toml")
+
+
+class TestBinaryFileTypes:
+    @pytest.mark.parametrize(
+        "file_type, library_name",
+        [(MessagePackFileType, "msgpack"), (CborFileType, "cbor2")],
+    )
+    def test_round_trip(self, tmp_path, file_type, library_name):
+        pytest.importorskip(library_name)
+        content = {"B": [1, {"C": None}], "A": "é", "D": {"E": 1.5, "F": True}}
+        file_path = tmp_path / f"file{file_type.extensions[0]}"
+        file_type.save_to_file(content, file_path)
+        loaded = FileTypeFactory().generate(file_path).load_from_file(file_path)
+        assert loaded == content
+        assert list(loaded) == ["B", "A", "D"]
+
+    @pytest.mark.parametrize(
+        "file_type, module_name",
+        [(MessagePackFileType, "msgpack"), (CborFileType, "cbor2")],
+    )
+    def test_missing_library(self, tmp_path, monkeypatch, file_type, module_name):
+        monkeypatch.setattr(file_types, module_name, None)
+        assert not file_type.is_available()
+        with pytest.raises(FileTypeError):
+            file_type.save_to_file({"A": 1}, tmp_path / "file")
+        assert not (tmp_path / "file").exists()
+
+
+class TestFileTypeFactory:
+    @pytest.mark.parametrize(
+        "file_type_name, file_name, expected_file_type",
+        [
+            (None, "file.json", JsonFileType),
+            (None, "file.yaml", YamlFileType),
+            (None, "file.YML", YamlFileType),
+            (None, "file.toml", TomlFileType),
+            (None, "file.msgpack", MessagePackFileType),
+            (None, "file.cbor", CborFileType),
+            ("MessagePack", "file.out", MessagePackFileType),
+            (None, "file.template", JsonFileType),
+            ("Yaml", "file.template", YamlFileType),
+            ("Json", "file.yaml", JsonFileType),
+        ],
+    )
+    def test_generate(self, file_type_name, file_name, expected_file_type):
+        assert FileTypeFactory(file_type_name).generate(file_name) is expected_file_type
+
+    def test_unknown_file_type(self):
+        with pytest.raises(FileTypeError):
+            FileTypeFactory("Xml").generate("file.xml")
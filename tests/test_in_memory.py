@@ -0,0 +1,119 @@
+import asyncio
+import builtins
+import json
+import os
+
+import pytest
+
+from dfm.config import BuildConfig
+from dfm.in_memory import InMemoryDirectoryIndex, load_config_in_memory
+from dfm.json_merger import COPY_ON_WRITE, IN_PLACE
+
+DOCUMENTS = {
+    "template.json": {"Resources": {}, "Outputs": {"Out": 1}},
+    "resources/s3/bucket.json": {"Bucket": {"Type": "AWS::S3::Bucket"}},
+    "resources/ec2/subnet.json": {"Subnet": {"Type": "AWS::EC2::Subnet"}},
+    "resources/ec2/vpc/vpc.json": {"Vpc": {"Type": "AWS::EC2::VPC"}},
+    "other/ignored.json": {"Ignored": {}},
+}
+CONFIG = {
+    "SourceFiles": [
+        {
+            "SourceFileLocation": {"Path": "template.json"},
+            "SourceFileNode": "$",
+            "DestinationFileNode": "$",
+        },
+        {
+            "SourceFileLocation": {
+                "Path": "resources/${Service}/**/*.json",
+                "PathSubs": {"Service": {"Type": "Parameter", "Value": "Service"}},
+            },
+            "SourceFileNode": "$",
+            "DestinationFileNode": "$.Resources",
+        },
+    ],
+    "DestinationFile": {"DestinationFileLocation": {"Path": "out/template.json"}},
+}
+
+
+def record_disk_access(monkeypatch, accessed: list):
+    for module, name in [
+        (builtins, "open"),
+        (os, "open"),
+        (os, "stat"),
+        (os, "scandir"),
+    ]:
+
+        def record(*args, original=getattr(module, name), **kwargs):
+            accessed.append(args)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(module, name, record)
+
+
+class TestInMemoryBuild:
+    @pytest.mark.parametrize("service", ["ec2", "*"])
+    def test_matches_build_from_disk(self, tmp_path, service):
+        for file_path, content in DOCUMENTS.items():
+            (tmp_path / file_path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / file_path).write_text(json.dumps(content))
+        (tmp_path / "config.json").write_text(json.dumps(CONFIG))
+        expected = BuildConfig.load_config_from_file(
+            tmp_path / "config.json", tmp_path, {"Service": service}
+        ).build(save_to_local_file=False)
+
+        build_config = load_config_in_memory(CONFIG, DOCUMENTS, {"Service": service})
+        assert build_config.build(save_to_local_file=False) == expected
+        assert list(expected["Resources"])[0] == "Subnet"
+
+    @pytest.mark.parametrize("merge_mode", [COPY_ON_WRITE, IN_PLACE])
+    def test_no_disk_access(self, monkeypatch, merge_mode):
+        documents = json.loads(json.dumps(DOCUMENTS))
+        accessed = []
+        with monkeypatch.context() as patch:
+            record_disk_access(patch, accessed)
+            build_config = load_config_in_memory(CONFIG, documents, {"Service": "*"})
+            content = build_config.build(merge_mode=merge_mode)
+            async_content = asyncio.run(
+                load_config_in_memory(CONFIG, documents, {"Service": "*"}).build_async(
+                    merge_mode=merge_mode
+                )
+            )
+        assert accessed == []
+        assert sorted(content["Resources"]) == ["Bucket", "Subnet", "Vpc"]
+        assert build_config.loader.documents[build_config.destination_path] is content
+        assert async_content == content
+
+    def test_chained_builds(self):
+        first_build = load_config_in_memory(CONFIG, DOCUMENTS, {"Service": "s3"})
+        first_build.build()
+        second_config = {
+            "SourceFiles": [
+                {
+                    "SourceFileLocation": {"Path": "out/*.json"},
+                    "SourceFileNode": "$.Resources",
+                    "DestinationFileNode": "$",
+                }
+            ],
+            "DestinationFile": {"DestinationFileLocation": {"Path": "resources.json"}},
+        }
+        second_build = load_config_in_memory(
+            second_config, first_build.loader.documents
+        )
+        assert second_build.build() == {"Bucket": {"Type": "AWS::S3::Bucket"}}
+        # The documents given aren't changed, only the loader's copy of them.
+        assert "out/template.json" not in DOCUMENTS
+
+    def test_glob_matches_pathlib(self):
+        index = InMemoryDirectoryIndex(DOCUMENTS)
+        assert [path.as_posix() for path in index.glob(".", "resources/**/*.json")] == [
+            "resources/ec2/subnet.json",
+            "resources/ec2/vpc/vpc.json",
+            "resources/s3/bucket.json",
+        ]
+        assert [path.as_posix() for path in index.glob(".", "*/s3")] == ["resources/s3"]
+        assert index.glob(".", "resources/*.json") == []
+
+    def test_virtual_paths_are_relative(self):
+        with pytest.raises(ValueError):
+            load_config_in_memory(CONFIG, {"/template.json": {}})
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from dfm.exceptions import JsonCodecError
+from dfm.file_types import JsonFileType
+from dfm.json_codecs import (
+    AutoJsonCodec,
+    JsonCodecFactory,
+    StdlibJsonCodec,
+    UjsonJsonCodec,
+)
+
+CONTENT = {"Key": ["Välue", 1, True, None, {"Nested": "/path"}]}
+
+
+class TestJsonCodecs:
+    @pytest.mark.parametrize("codec_name", list(JsonCodecFactory.CODEC_MAPPING))
+    def test_round_trip(self, codec_name, tmp_path):
+        JsonFileType.save_to_file(CONTENT, tmp_path / "file.json", codec_name)
+        assert (
+            JsonFileType.load_from_file(tmp_path / "file.json", codec_name) == CONTENT
+        )
+
+    def test_auto_codec_writes_like_json_dump(self, tmp_path):
+        JsonFileType.save_to_file(CONTENT, tmp_path / "file.json")
+        assert (tmp_path / "file.json").read_text() == json.dumps(CONTENT, indent=4)
+
+    def test_auto_codec_falls_back_to_stdlib(self):
+        assert AutoJsonCodec.loads(b'{"Big": 123456789012345678901234567890}') == {
+            "Big": 123456789012345678901234567890
+        }
+
+    def test_orjson_codec(self):
+        pytest.importorskip("orjson")
+        codec = JsonCodecFactory("orjson").generate()
+        assert codec.loads(b'{"A": [1]}') == {"A": [1]}
+        assert codec.dumps({"A": [1]}, indent=4) == StdlibJsonCodec.dumps(
+            {"A": [1]}, indent=4
+        )
+
+    def test_missing_codec_falls_back_to_stdlib(self, monkeypatch):
+        monkeypatch.setattr(
+            UjsonJsonCodec, "is_available", classmethod(lambda cls: False)
+        )
+        with pytest.warns(UserWarning):
+            assert JsonCodecFactory("ujson").generate() == StdlibJsonCodec
+
+    def test_unknown_codec(self):
+        with pytest.raises(JsonCodecError):
+            JsonCodecFactory("yaml").generate()
@@ -0,0 +1,154 @@
+from copy import deepcopy
+
+import pytest
+
+from dfm.exceptions import JsonMergerError
+from dfm.json_merger import (
+    COPY_ON_WRITE,
+    IN_PLACE,
+    MERGE_MODES,
+    BoolJsonMerger,
+    DictJsonMerger,
+    IntJsonMerger,
+    JsonMergerFactory,
+    MergeOwnership,
+    generate_json_merger,
+)
+
+
+def merge(json_obj, obj_to_merge, ownership=None):
+    merger = JsonMergerFactory(json_obj, ownership).generate_json_merger()
+    merger.merge_obj(obj_to_merge)
+    return merger.json_obj
+
+
+class TestMergeRules:
+    @pytest.mark.parametrize("mode", [COPY_ON_WRITE, IN_PLACE])
+    def test_dict_merge(self, mode):
+        assert merge(
+            {"A": 1, "B": {"C": [1]}, "D": "x"},
+            {"E": True, "B": {"C": [2], "F": None}, "A": 2, "D": "y"},
+            MergeOwnership(mode),
+        ) == {"A": 3, "B": {"C": [1, 2], "F": None}, "D": ["x", "y"], "E": True}
+
+    def test_key_order(self):
+        assert list(merge({"B": 1, "A": 1}, {"C": 1, "A": 1, "D": 1})) == [
+            "B",
+            "A",
+            "C",
+            "D",
+        ]
+
+    def test_scalar_rules(self):
+        assert merge(None, {"A": 1}) == {"A": 1}
+        assert merge("a", None) == "a"
+        assert merge("a", "b") == ["a", "b"]
+        assert merge(True, 1) == [True, 1]
+        assert merge([1], {"A": 1}) == [1, {"A": 1}]
+        with pytest.raises(TypeError):
+            merge("a", ["b"])
+        with pytest.raises(TypeError):
+            merge({}, 1.5)
+
+    def test_unknown_merge_mode(self):
+        with pytest.raises(JsonMergerError):
+            MergeOwnership("sometimes")
+
+
+class TestCopyOnWrite:
+    def test_inputs_are_not_mutated(self):
+        dest = {"A": {"B": [1]}, "Untouched": {"C": 1}}
+        src = {"A": {"B": [2]}, "New": {"D": [1]}}
+        dest_before, src_before = deepcopy(dest), deepcopy(src)
+
+        merged = merge(dest, src, MergeOwnership(COPY_ON_WRITE))
+
+        assert dest == dest_before
+        assert src == src_before
+        assert merged["Untouched"] is dest["Untouched"]
+        assert merged["New"] is src["New"]
+
+    def test_adopted_content_is_copied_before_mutation(self):
+        ownership = MergeOwnership(COPY_ON_WRITE)
+        first_src = {"A": [1]}
+        merged = merge({}, first_src, ownership)
+        merged = merge(merged, {"A": [2]}, ownership)
+        assert merged == {"A": [1, 2]}
+        assert first_src == {"A": [1]}
+
+    def test_in_place_mutates_destination(self):
+        dest = {"A": [1]}
+        merged = merge(dest, {"A": [2], "B": 1}, MergeOwnership(IN_PLACE))
+        assert merged is dest
+        assert dest == {"A": [1, 2], "B": 1}
+
+
+class TestMergeAll:
+    def test_merge_all_matches_merging_one_at_a_time(self):
+        objs = [{"A": "x"}, {"A": "y", "B": [1]}, {"B": [2]}, None]
+        merged_one_at_a_time = None
+        for obj in deepcopy(objs):
+            merged_one_at_a_time = merge(merged_one_at_a_time, obj)
+        assert JsonMergerFactory(None).merge_all(objs) == merged_one_at_a_time
+        assert merged_one_at_a_time == {"A": ["x", "y"], "B": [1, 2]}
+
+
+class TestDispatch:
+    def test_types_are_matched_exactly(self):
+        assert type(generate_json_merger(True)) is BoolJsonMerger
+        assert type(generate_json_merger(1)) is IntJsonMerger
+        assert merge(1, True) == [1, True]
+        assert merge(True, 1) == [True, 1]
+
+    def test_unsupported_types(self):
+        with pytest.raises(TypeError):
+            generate_json_merger(1.5)
+        with pytest.raises(TypeError):
+            generate_json_merger([]).merge_obj(1.5)
+
+    def test_mergers_have_no_instance_dict(self):
+        merger = generate_json_merger({})
+        assert not hasattr(merger, "__dict__")
+        assert merger == DictJsonMerger({}, merger.ownership)
+
+
+def nested_dict(depth, leaf):
+    nested = leaf
+    for level in reversed(range(depth)):
+        nested = {f"Level{level}": nested}
+    return nested
+
+
+def walk_to_leaf(nested, depth):
+    for level in range(depth):
+        nested = nested[f"Level{level}"]
+    return nested
+
+
+class TestDeepMerge:
+    DEPTH = 10000
+
+    @pytest.mark.parametrize("mode", MERGE_MODES)
+    def test_merge_beyond_recursion_limit(self, mode):
+        first = nested_dict(self.DEPTH, {"A": [1], "B": "x"})
+        second = nested_dict(self.DEPTH, {"A": [2], "C": True})
+        merged = JsonMergerFactory(None, MergeOwnership(mode)).merge_all(
+            [first, second]
+        )
+        assert walk_to_leaf(merged, self.DEPTH) == {
+            "A": [1, 2],
+            "B": "x",
+            "C": True,
+        }
+        assert walk_to_leaf(second, self.DEPTH) == {"A": [2], "C": True}
+        if mode == COPY_ON_WRITE:
+            assert walk_to_leaf(first, self.DEPTH) == {"A": [1], "B": "x"}
+
+    def test_keys_are_merged_depth_first(self):
+        shared = {"X": [1]}
+        dest = {"A": {"B": shared}, "C": shared}
+        merged = JsonMergerFactory(dest, MergeOwnership(IN_PLACE)).merge_all(
+            [{"A": {"B": {"X": [2]}}, "C": {"X": [3]}}]
+        )
+        # Merging in place, A.B is merged before C, as a recursive merge would.
+        assert merged == {"A": {"B": {"X": [1, 2, 3]}}, "C": {"X": [1, 2, 3]}}
@@ -0,0 +1,152 @@
+from copy import deepcopy
+from pathlib import Path
+
+import pytest
+from jsonpath_ng import parse
+
+from dfm.config import BuildConfig
+from dfm.json_merger import COPY_ON_WRITE, MergeOwnership
+from dfm.json_path import (
+    JsonPathExpression,
+    SimpleJsonPath,
+    compile_json_path,
+    json_path_cache_info,
+)
+
+
+class TestJsonPathCache:
+    def test_expressions_are_reused(self):
+        hits_before = json_path_cache_info().hits
+        assert compile_json_path("$.Some.Path") is compile_json_path("$.Some.Path")
+        assert json_path_cache_info().hits > hits_before
+
+    def test_config_load_warms_cache(self):
+        compile_json_path.cache_clear()
+        BuildConfig.load_config_from_file(
+            file_path=str(
+                Path(__file__).parent.resolve()
+                / "test_files_directory/nested_directory/build_test_config.json"
+            ),
+            parameters={"TheWordTest": "test"},
+            root_path=Path(__file__).parent.resolve(),
+        )
+        assert json_path_cache_info().currsize == 2
+
+
+class TestSimpleJsonPath:
+    DOCUMENT = {"a": {"b": [{"c": 1}, "x"], "n": None, "s": "str"}, "l": [1, 2]}
+
+    @pytest.mark.parametrize(
+        "json_path", ["$", "$.a", "$.a.b[0]", "$.a.b[-1]", "$.a.b[5]", "$.l[0].c"]
+    )
+    def test_find_matches_jsonpath_ng(self, json_path):
+        expr = compile_json_path(json_path)
+        assert isinstance(expr, SimpleJsonPath)
+        assert expr.find_values(self.DOCUMENT) == [
+            match.value for match in parse(json_path).find(self.DOCUMENT)
+        ]
+
+    @pytest.mark.parametrize(
+        "json_path", ["$", "$.a", "$.new.nested", "$.a.n.c", "$.a.s.c.d", "$.a.b[0]"]
+    )
+    def test_update_or_create_matches_jsonpath_ng(self, json_path):
+        expected = parse(json_path).update_or_create(deepcopy(self.DOCUMENT), "val")
+        assert (
+            compile_json_path(json_path).update_or_create(
+                deepcopy(self.DOCUMENT), "val"
+            )
+            == expected
+        )
+
+    @pytest.mark.parametrize(
+        "json_path", ["$.a", "$.new.nested", "$.a.n.c", "$.a.b[0]", "$.*"]
+    )
+    def test_copy_on_write_update_leaves_data_unchanged(self, json_path):
+        data = deepcopy(self.DOCUMENT)
+        expected = parse(json_path).update_or_create(deepcopy(self.DOCUMENT), "val")
+        assert (
+            compile_json_path(json_path).update_or_create(
+                data, "val", MergeOwnership(COPY_ON_WRITE)
+            )
+            == expected
+        )
+        assert data == self.DOCUMENT
+
+    def test_update_on_a_non_dict_fails(self):
+        with pytest.raises(TypeError):
+            compile_json_path("$.a.s.c").update_or_create(deepcopy(self.DOCUMENT), 1)
+
+    @pytest.mark.parametrize("json_path", ["$.*", "$..c", "$.a.b[*]", "$.a['b','s']"])
+    def test_complex_paths_use_jsonpath_ng(self, json_path):
+        assert isinstance(compile_json_path(json_path), JsonPathExpression)
+
+
+class TestJsonPathExpression:
+    DOCUMENT = {
+        "a": {"x": [{"T": [1]}, {"T": [2]}], "u": {"big": [1, 2, 3]}},
+        "b": {"x": [], "u": {"big": [4, 5, 6]}},
+    }
+
+    @pytest.mark.parametrize(
+        "json_path",
+        ["$.*.x", "$.*.x[*].T", "$.a.x[0:1]", "$.*.new.nested", "$..T", "$.a['x','u']"],
+    )
+    def test_copy_on_write_update_matches_jsonpath_ng(self, json_path):
+        data = deepcopy(self.DOCUMENT)
+        expected = parse(json_path).update_or_create(deepcopy(self.DOCUMENT), "val")
+        assert (
+            compile_json_path(json_path).update_or_create(
+                data, "val", MergeOwnership(COPY_ON_WRITE)
+            )
+            == expected
+        )
+        assert data == self.DOCUMENT
+
+    @pytest.mark.parametrize(
+        "json_path,document",
+        [
+            ("$[*].a", {"a": 1}),
+            ("$.a[*].b", {"a": {"b": 1}}),
+            ("$.a[0:1].b", {"a": {"b": 1}}),
+        ],
+    )
+    def test_index_steps_over_dicts_match_jsonpath_ng(self, json_path, document):
+        data = deepcopy(document)
+        expected = parse(json_path).update_or_create(deepcopy(document), "val")
+        assert (
+            compile_json_path(json_path).update_or_create(
+                data, "val", MergeOwnership(COPY_ON_WRITE)
+            )
+            == expected
+        )
+        assert data == document
+
+    @pytest.mark.parametrize("ownership", [None, MergeOwnership(COPY_ON_WRITE)])
+    @pytest.mark.parametrize("json_path", ["$.*.u", "$.*.*.big", "$.*.*", "$.*.n"])
+    def test_field_updates_match_jsonpath_ng(self, json_path, ownership):
+        def outcome(update):
+            try:
+                return update()
+            except TypeError as error:
+                return type(error)
+
+        for document in [
+            {**deepcopy(self.DOCUMENT), "n": None, "c": {"n": 1}},
+            {**deepcopy(self.DOCUMENT), "l": [1]},
+        ]:
+            assert outcome(
+                lambda: compile_json_path(json_path).update_or_create(
+                    deepcopy(document), "val", ownership
+                )
+            ) == outcome(
+                lambda: parse(json_path).update_or_create(deepcopy(document), "val")
+            )
+
+    def test_copy_on_write_update_shares_untouched_content(self):
+        data = deepcopy(self.DOCUMENT)
+        updated = compile_json_path("$.*.x").update_or_create(
+            data, [], MergeOwnership(COPY_ON_WRITE)
+        )
+        assert updated is not data and updated["a"] is not data["a"]
+        assert updated["a"]["u"] is data["a"]["u"]
+        assert updated["b"]["u"] is data["b"]["u"]
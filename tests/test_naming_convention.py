@@ -1,5 +1,9 @@
+import pytest
+
+from dfm.exceptions import NamingConventionError
 from dfm.naming_conventions import (
     ConversionStringParser,
+    KebabCase,
     PascalCase,
     SnakeCase,
     StringConverter,
@@ -30,3 +34,45 @@ class TestStringConverter:
             )
 
             assert converter.convert("hello_there!") == "HelloThere!"
+
+    class TestConversionFromKebabCase:
+        def test_kebab_case_conversion(self):
+            converter = StringConverter(
+                from_convention=KebabCase(), to_convention=PascalCase()
+            )
+
+            assert converter.convert("my-app-server") == "MyAppServer"
+
+        def test_parsed_from_sub_dict(self):
+            converter = StringConverter.parse_from_sub_dict(
+                {"Type": "Key", "Value": "$", "NamingConvention": "PascalToKebab"}
+            )
+
+            assert converter.convert("MyAppServer") == "my-app-server"
+            assert StringConverter.parse_from_sub_dict({"Type": "Key"}) is None
+
+    class TestConvertMany:
+        def test_convert_many_matches_convert(self):
+            converter = StringConverter(
+                from_convention=PascalCase(), to_convention=SnakeCase()
+            )
+            keys = ["HelloThere", "GeneralKenobi", "HelloThere"] * 1000
+            assert converter.convert_many(keys) == [
+                StringConverter(PascalCase(), SnakeCase()).convert(key) for key in keys
+            ]
+            assert converter.converted == {
+                "HelloThere": "hello_there",
+                "GeneralKenobi": "general_kenobi",
+            }
+
+        def test_invalid_strings_still_raise(self):
+            converter = StringConverter(
+                from_convention=PascalCase(), to_convention=SnakeCase()
+            )
+            with pytest.raises(NamingConventionError):
+                converter.convert_many(["HelloThere", "lowercase"])
+            assert "lowercase" not in converter.converted
+
+    def test_patterns_are_compiled_once_per_convention(self):
+        assert PascalCase.compiled_regex.pattern == PascalCase.regex
+        assert PascalCase().compiled_regex is PascalCase().compiled_regex
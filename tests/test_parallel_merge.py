@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+
+import pytest
+
+from dfm import parallel_merge
+from dfm.json_merger import JsonMergerFactory
+from dfm.parallel_merge import TreeReductionMerger, is_tree_reducible
+
+
+class TestIsTreeReducible:
+    def test_order_insensitive_merges(self):
+        assert is_tree_reducible([{"A": [1], "B": 1}, {"A": [2], "C": "x"}, None])
+        assert is_tree_reducible([{"A": {"B": 1}}, {"A": {"B": 2}}])
+
+    def test_order_sensitive_merges(self):
+        assert not is_tree_reducible([{"A": "x"}, {"A": "y"}])
+        assert not is_tree_reducible([{"A": 1}, {"A": [1]}])
+        assert not is_tree_reducible([True, False])
+
+
+class TestTreeReductionMerger:
+    def test_matches_serial_merge(self):
+        objs = [
+            {"Resources": {f"Resource{i}": {"Index": i}}, "Tags": [i], "Count": 1}
+            for i in range(20)
+        ]
+        expected = JsonMergerFactory({"Tags": []}).merge_all(deepcopy(objs))
+        assert TreeReductionMerger(workers=3).merge_all({"Tags": []}, objs) == expected
+        assert expected["Tags"] == list(range(20))
+        assert expected["Count"] == 20
+
+    def test_falls_back_to_serial_merge(self):
+        objs = [{"A": str(i)} for i in range(10)]
+        assert TreeReductionMerger(workers=3).merge_all(None, objs) == {
+            "A": [str(i) for i in range(10)]
+        }
+
+    def test_process_pool_is_reused_until_closed(self, monkeypatch):
+        started = []
+        monkeypatch.setattr(
+            parallel_merge,
+            "ProcessPoolExecutor",
+            lambda max_workers: started.append(max_workers)
+            or ProcessPoolExecutor(max_workers),
+        )
+        objs = [{"Tags": [i]} for i in range(10)]
+        with TreeReductionMerger(workers=2) as merger:
+            for _ in range(3):
+                assert merger.merge_all(None, objs) == {"Tags": list(range(10))}
+            executor = merger.executor
+        assert started == [2]
+        assert merger.executor is None
+        with pytest.raises(RuntimeError):
+            executor.submit(len, [])
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from dfm.config import BuildConfig
+from dfm.file_loader import FileLoader
+from dfm.file_types import JsonFileType
+from dfm.json_merger import BaseJsonMerger, JsonMergerFactory
+from dfm.profiling import HOOKS, Profiler
+
+
+def write_build(tmp_path):
+    (tmp_path / "sources").mkdir()
+    for i in range(3):
+        (tmp_path / "sources" / f"source_{i}.json").write_text(
+            json.dumps({"Key": {f"Value{i}": [i]}})
+        )
+    config_path = tmp_path / "config.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "SourceFiles": [
+                    {
+                        "SourceFileLocation": {"Path": "sources/*.json"},
+                        "SourceFileNode": "$.Key",
+                        "DestinationFileNode": "$.Key",
+                    }
+                ],
+                "DestinationFile": {"DestinationFileLocation": {"Path": "out.json"}},
+            }
+        )
+    )
+    return BuildConfig.load_config_from_file(config_path, tmp_path)
+
+
+class TestProfiler:
+    def test_every_stage_is_timed(self, tmp_path):
+        build_config = write_build(tmp_path)
+        with Profiler() as profiler:
+            build_config.build()
+        stage_totals = profiler.stage_totals()
+        assert set(stage_totals) == {
+            "glob",
+            "load",
+            "source",
+            "find",
+            "merge",
+            "update_or_create",
+            "write",
+        }
+        source_bytes = sum(
+            path.stat().st_size for path in (tmp_path / "sources").iterdir()
+        )
+        source_totals = profiler.source_totals()
+        assert list(source_totals) == ["sources/*.json $.Key"]
+        assert source_totals["sources/*.json $.Key"]["Bytes"] == source_bytes
+        assert stage_totals["write"]["Bytes"] == (tmp_path / "out.json").stat().st_size
+        assert "sources/*.json $.Key" in profiler.format_text()
+
+    def test_async_build_is_timed(self, tmp_path):
+        build_config = write_build(tmp_path)
+        with Profiler() as profiler:
+            asyncio.run(build_config.build_async())
+        assert {"load", "merge", "write"} <= set(profiler.stage_totals())
+        # build_async loads file by file, so each file is timed but not each source.
+        assert {event.label for event in profiler.events if event.stage == "load"} >= {
+            str(path) for path in (tmp_path / "sources").iterdir()
+        }
+
+    def test_hooks_are_removed_afterwards(self, tmp_path):
+        originals = [owner.__dict__[name] for owner, name, *_ in HOOKS]
+        merge_obj = BaseJsonMerger.__dict__["merge_obj"]
+        with Profiler():
+            assert BaseJsonMerger.__dict__["merge_obj"] is not merge_obj
+        assert [owner.__dict__[name] for owner, name, *_ in HOOKS] == originals
+
+        profiler = Profiler()
+        with profiler:
+            pass
+        write_build(tmp_path).build()
+        assert profiler.events == []
+
+    def test_nested_calls_are_not_timed_twice(self):
+        with Profiler() as profiler:
+            JsonMergerFactory({"A": {"B": 1}}).merge_all([{"A": {"B": 2}}])
+        merge_events = [event for event in profiler.events if event.stage == "merge"]
+        assert len(merge_events) > 1
+        assert [event.nested for event in merge_events].count(False) == 1
+        assert profiler.stage_totals()["merge"]["Seconds"] == sum(
+            event.duration for event in merge_events if not event.nested
+        )
+
+    def test_chrome_trace(self, tmp_path):
+        build_config = write_build(tmp_path)
+        with Profiler() as profiler:
+            build_config.build()
+        profiler.report("chrome", tmp_path / "trace.json")
+        trace_events = JsonFileType.load_from_file(tmp_path / "trace.json")[
+            "traceEvents"
+        ]
+        assert len(trace_events) == len(profiler.events)
+        assert {event["ph"] for event in trace_events} == {"X"}
+        assert {event["name"] for event in trace_events if event["cat"] == "load"} >= {
+            str(tmp_path / "sources" / f"source_{i}.json") for i in range(3)
+        }
+        with pytest.raises(ValueError):
+            profiler.report("xml")
+
+    def test_cached_properties_still_cache(self, tmp_path):
+        build_config = write_build(tmp_path)
+        with Profiler() as profiler:
+            location = build_config.source_files[0].location
+            assert location.resolved_paths is location.resolved_paths
+        assert [event.stage for event in profiler.events] == ["glob"]
+
+    def test_lazy_loads_are_timed(self, tmp_path):
+        build_config = write_build(tmp_path)
+        build_config.loader = FileLoader(lazy=True)
+        with Profiler() as profiler:
+            build_config.build()
+        assert sorted(
+            event.label for event in profiler.events if event.stage == "load"
+        ) == [str(tmp_path / "sources" / f"source_{i}.json") for i in range(3)]
+
+    def test_one_profiler_at_a_time(self):
+        merge_obj = BaseJsonMerger.__dict__["merge_obj"]
+        with Profiler() as profiler:
+            with pytest.raises(RuntimeError):
+                Profiler().__enter__()
+            with pytest.raises(RuntimeError):
+                profiler.__enter__()
+            JsonMergerFactory({}).merge_all([{"A": 1}])
+        assert BaseJsonMerger.__dict__["merge_obj"] is merge_obj
+        assert [event.stage for event in profiler.events] == ["merge"]
+        with Profiler():
+            pass
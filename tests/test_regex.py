@@ -32,3 +32,9 @@ class TestRegexExtractor:
         )
         with pytest.raises(IndexError):
             assert regex.resolve("AWS::Ec2::Instance")
+
+    def test_expression_is_compiled_once(self):
+        regex = RegexExtractor("(.+)::(.+)", 2)
+        pattern = regex.pattern
+        assert regex.resolve("AWS::Ec2") == "Ec2"
+        assert regex.pattern is pattern
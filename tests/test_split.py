@@ -0,0 +1,200 @@
+import json
+import os
+import stat
+
+import pytest
+
+from dfm.config import BuildConfig
+from dfm.exceptions import SplitError
+from dfm.file_types import JsonFileType
+from dfm.split import SplitBuild
+
+TEMPLATE = {
+    "AWSTemplateFormatVersion": "2010-09-09",
+    "Resources": {
+        "MyAppBucket": {"Type": "AWS::S3::Bucket", "Properties": {}},
+        "PublicSubnet": {"Type": "AWS::EC2::Subnet", "Properties": {"A": 1}},
+        "InstanceRole": {"Type": "AWS::IAM::Role", "Properties": {"B": [2]}},
+    },
+    "Outputs": {},
+}
+
+
+def write_config(tmp_path, source_files: list, destination_content=TEMPLATE):
+    (tmp_path / "template.json").write_text(json.dumps(destination_content))
+    config_path = tmp_path / "config.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "SourceFiles": source_files,
+                "DestinationFile": {
+                    "DestinationFileLocation": {"Path": "template.json"}
+                },
+            }
+        )
+    )
+    return config_path
+
+
+def resource_source_file(path: str, subs: dict) -> dict:
+    return {
+        "SourceFileLocation": {"Path": path, "PathSubs": subs},
+        "SourceFileNode": "$",
+        "DestinationFileNode": "$.Resources",
+    }
+
+
+RESOURCE_SUBS = {
+    "Service": {
+        "Type": "Content",
+        "Value": "$.*.Type",
+        "Regex": {"Expression": "AWS::(.+)::.+", "CaptureGroup": 1},
+        "NamingConvention": "UpperToLower",
+    },
+    "Name": {"Type": "Key", "Value": "$", "NamingConvention": "PascalToKebab"},
+}
+
+
+class TestSplitBuild:
+    def test_split_then_merge_round_trips(self, tmp_path):
+        config_path = write_config(
+            tmp_path,
+            [
+                {
+                    "SourceFileLocation": {"Path": "split/template.json"},
+                    "SourceFileNode": "$",
+                    "DestinationFileNode": "$",
+                },
+                resource_source_file(
+                    "split/resources/${Service}/${Name}.json", RESOURCE_SUBS
+                ),
+            ],
+        )
+        written_paths = SplitBuild(
+            BuildConfig.load_config_from_file(config_path, tmp_path), workers=2
+        ).run()
+        assert written_paths == [
+            tmp_path / "split" / "template.json",
+            tmp_path / "split" / "resources" / "s3" / "my-app-bucket.json",
+            tmp_path / "split" / "resources" / "ec2" / "public-subnet.json",
+            tmp_path / "split" / "resources" / "iam" / "instance-role.json",
+        ]
+        assert JsonFileType.load_from_file(written_paths[0]) == {
+            **TEMPLATE,
+            "Resources": {},
+        }
+        assert JsonFileType.load_from_file(written_paths[2]) == {
+            "PublicSubnet": TEMPLATE["Resources"]["PublicSubnet"]
+        }
+
+        (tmp_path / "template.json").unlink()
+        build_config = BuildConfig.load_config_from_file(config_path, tmp_path)
+        build_config.build()
+        assert JsonFileType.load_from_file(tmp_path / "template.json") == TEMPLATE
+
+    def test_files_and_directories_are_synced_once(self, tmp_path, monkeypatch):
+        config_path = write_config(
+            tmp_path,
+            [resource_source_file("split/${Service}/${Name}.json", RESOURCE_SUBS)],
+        )
+        synced = []
+        fsync = os.fsync
+        monkeypatch.setattr(
+            os, "fsync", lambda fd: synced.append(os.fstat(fd)) or fsync(fd)
+        )
+        written_paths = SplitBuild(
+            BuildConfig.load_config_from_file(config_path, tmp_path), workers=2
+        ).run()
+        synced_directories = [
+            file_stat.st_ino for file_stat in synced if stat.S_ISDIR(file_stat.st_mode)
+        ]
+        assert len(synced) - len(synced_directories) == len(written_paths) == 3
+        assert sorted(synced_directories) == sorted(
+            file_path.parent.stat().st_ino for file_path in written_paths
+        )
+
+    def test_items_at_the_same_path_are_merged(self, tmp_path):
+        config_path = write_config(
+            tmp_path,
+            [
+                resource_source_file(
+                    "resources/${Service}.json", {"Service": RESOURCE_SUBS["Service"]}
+                )
+            ],
+            {
+                "Resources": {
+                    "A": {"Type": "AWS::EC2::Subnet"},
+                    "B": {"Type": "AWS::S3::Bucket"},
+                    "C": {"Type": "AWS::EC2::VPC"},
+                }
+            },
+        )
+        build_config = BuildConfig.load_config_from_file(config_path, tmp_path)
+        assert SplitBuild(build_config).files == {
+            tmp_path
+            / "resources"
+            / "ec2.json": {
+                "A": {"Type": "AWS::EC2::Subnet"},
+                "C": {"Type": "AWS::EC2::VPC"},
+            },
+            tmp_path / "resources" / "s3.json": {"B": {"Type": "AWS::S3::Bucket"}},
+        }
+
+    def test_source_node_wraps_content(self, tmp_path):
+        config_path = write_config(
+            tmp_path,
+            [
+                {
+                    "SourceFileLocation": {
+                        "Path": "${Name}.json",
+                        "PathSubs": {"Name": {"Type": "Key", "Value": "$"}},
+                    },
+                    "SourceFileNode": "$.Resource",
+                    "DestinationFileNode": "$.Resources",
+                }
+            ],
+        )
+        files = SplitBuild(
+            BuildConfig.load_config_from_file(config_path, tmp_path)
+        ).files
+        assert files[tmp_path / "MyAppBucket.json"] == {
+            "Resource": {"MyAppBucket": TEMPLATE["Resources"]["MyAppBucket"]}
+        }
+
+    def test_globs_are_rejected(self, tmp_path):
+        config_path = write_config(
+            tmp_path, [resource_source_file("resources/**/*.json", {})]
+        )
+        with pytest.raises(SplitError):
+            SplitBuild(BuildConfig.load_config_from_file(config_path, tmp_path)).run()
+
+    @pytest.mark.parametrize("name", ["../../escaped", "nested/name", "..", ""])
+    def test_names_that_are_not_plain_file_names_are_rejected(self, tmp_path, name):
+        (tmp_path / "root").mkdir()
+        config_path = write_config(
+            tmp_path / "root",
+            [
+                resource_source_file(
+                    "${Name}.json", {"Name": {"Type": "Key", "Value": "$"}}
+                )
+            ],
+            {"Resources": {name: {"Type": "AWS::S3::Bucket"}}},
+        )
+        with pytest.raises(SplitError):
+            SplitBuild(
+                BuildConfig.load_config_from_file(config_path, tmp_path / "root")
+            ).run()
+        assert sorted(path.name for path in tmp_path.rglob("*")) == [
+            "config.json",
+            "root",
+            "template.json",
+        ]
+
+    def test_missing_file_is_rejected(self, tmp_path):
+        config_path = write_config(
+            tmp_path,
+            [resource_source_file("${Name}.json", {"Name": RESOURCE_SUBS["Name"]})],
+        )
+        (tmp_path / "template.json").unlink()
+        with pytest.raises(SplitError):
+            SplitBuild(BuildConfig.load_config_from_file(config_path, tmp_path)).run()
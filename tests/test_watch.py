@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from dfm.config import BuildConfig, DestinationFile, SourceFile
+from dfm.file_location import FileLocation
+from dfm.watch import (
+    BuildWatcher,
+    InotifyWatcher,
+    PollingWatcher,
+    create_watcher,
+    watched_directory,
+)
+
+
+def make_build_config(root_path: Path) -> BuildConfig:
+    (root_path / "sources").mkdir()
+    for i in range(2):
+        (root_path / "sources" / f"source_{i}.json").write_text(
+            json.dumps({"Key": [i]})
+        )
+    (root_path / "destination.json").write_text(json.dumps({"Key": ["base"]}))
+    return BuildConfig(
+        [SourceFile(FileLocation("sources/*.json", root_path), "$.Key", "$.Key")],
+        DestinationFile(FileLocation("destination.json", root_path)),
+        root_path,
+    )
+
+
+class TestWatchedDirectory:
+    @pytest.mark.parametrize(
+        "pattern,expected",
+        [
+            ("a/b/file.json", (Path("/root/a/b"), False)),
+            ("a/*.json", (Path("/root/a"), False)),
+            ("a/**/*.json", (Path("/root/a"), True)),
+            ("a/*/file.json", (Path("/root/a"), True)),
+        ],
+    )
+    def test_watched_directory(self, pattern, expected):
+        assert watched_directory(Path("/root"), pattern) == expected
+
+
+class TestWatchers:
+    @pytest.mark.parametrize("polling", [True, False])
+    def test_watcher_sees_changes(self, tmp_path, polling):
+        if not polling and not InotifyWatcher.is_available():
+            pytest.skip("inotify is not available")
+        (tmp_path / "nested").mkdir()
+        watcher = create_watcher({tmp_path: True}, polling, interval=0.01)
+        try:
+            assert watcher.wait(0.05) == set()
+            (tmp_path / "nested" / "file.json").write_text("{}")
+            assert tmp_path / "nested" / "file.json" in watcher.wait(2)
+        finally:
+            watcher.close()
+
+    @pytest.mark.parametrize("polling", [True, False])
+    def test_watcher_sees_directories_created_later(self, tmp_path, polling):
+        if not polling and not InotifyWatcher.is_available():
+            pytest.skip("inotify is not available")
+        watcher = create_watcher({tmp_path / "a" / "b": False}, polling, interval=0.01)
+        try:
+            (tmp_path / "a").mkdir()
+            watcher.wait(0.05)
+            (tmp_path / "a" / "b").mkdir()
+            (tmp_path / "a" / "b" / "file.json").write_text("{}")
+            changed_paths = set()
+            deadline = time.monotonic() + 2
+            while tmp_path / "a" / "b" / "file.json" not in changed_paths:
+                assert time.monotonic() < deadline
+                changed_paths |= watcher.wait(0.1)
+            (tmp_path / "a" / "b" / "file.json").write_text("[]")
+            assert tmp_path / "a" / "b" / "file.json" in watcher.wait(2)
+        finally:
+            watcher.close()
+
+    def test_polling_watcher_sees_deletions(self, tmp_path):
+        (tmp_path / "file.json").write_text("{}")
+        watcher = PollingWatcher({tmp_path: False}, interval=0.01)
+        (tmp_path / "file.json").unlink()
+        assert watcher.wait(1) == {tmp_path / "file.json"}
+
+
+class TestBuildWatcher:
+    def test_rebuilds_only_merge_into_the_original_destination(self, tmp_path):
+        build_watcher = BuildWatcher(make_build_config(tmp_path))
+        build_watcher.run(max_builds=1)
+        assert sorted(
+            json.loads((tmp_path / "destination.json").read_text())["Key"], key=str
+        ) == [0, 1, "base"]
+
+        (tmp_path / "sources" / "source_2.json").write_text(json.dumps({"Key": [2]}))
+        assert build_watcher.invalidate({tmp_path / "sources" / "source_2.json"})
+        build_watcher.build()
+        assert sorted(
+            json.loads((tmp_path / "destination.json").read_text())["Key"], key=str
+        ) == [0, 1, 2, "base"]
+
+    def test_sources_sharing_a_location_all_see_deletions(self, tmp_path):
+        build_config = make_build_config(tmp_path)
+        location = build_config.source_files[0].location
+        build_config.source_files.append(SourceFile(location, "$.Key", "$.Copy"))
+        build_watcher = BuildWatcher(build_config)
+        build_watcher.run(max_builds=1)
+
+        (tmp_path / "sources" / "source_1.json").unlink()
+        assert build_watcher.invalidate({tmp_path / "sources" / "source_1.json"})
+        assert all(
+            "retrieved_src_content" not in src.__dict__
+            for src in build_config.source_files
+        )
+        build_watcher.build()
+        assert json.loads((tmp_path / "destination.json").read_text())["Copy"] == [0]
+
+    def test_unrelated_changes_do_not_rebuild(self, tmp_path):
+        build_watcher = BuildWatcher(make_build_config(tmp_path))
+        build_watcher.run(max_builds=1)
+        assert not build_watcher.invalidate({tmp_path / "sources" / "notes.txt"})
+        assert build_watcher.is_build_output(tmp_path / "destination.json")
+        assert build_watcher.is_build_output(tmp_path / ".destination.json.1a2b.tmp")
+
+    def test_run_rebuilds_on_change(self, tmp_path):
+        build_watcher = BuildWatcher(
+            make_build_config(tmp_path), debounce=0.01, polling=True, poll_interval=0.01
+        )
+        thread = threading.Thread(target=build_watcher.run, kwargs={"max_builds": 2})
+        thread.start()
+        while build_watcher.builds < 1:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        (tmp_path / "sources" / "source_0.json").write_text(json.dumps({"Key": [5]}))
+        thread.join(5)
+        assert not thread.is_alive()
+        assert sorted(
+            json.loads((tmp_path / "destination.json").read_text())["Key"], key=str
+        ) == [1, 5, "base"]